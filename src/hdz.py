@@ -1,36 +1,342 @@
 import sys
 import os
+import glob
+import time
+import cProfile
+import subprocess
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 from hdzlexer import Tokenizer
 from hdzparser import Parser
-from hdzgenerator import Generator
-from hdzerrors import ErrorHandler
+from hdzgenerator import Generator, StreamOutput, TeeOutput
+from hdzassembler import Assembler
+from hdzarena import AstArena
+from hdzfold import ConstantFolder
+from hdzlower import Lowering
+from hdzpasses import PassManager
+from hdzpeephole import Peephole
+from hdzcache import BuildCache
+from hdzerrors import ErrorHandler, LineIndex, CompileError
+from hdztrace import Trace
+from hdztiming import PassTimer, PassTiming, count_nodes, count_instructions, format_passes
 
-all_flags: list[str] = list(filter(lambda x: x[0] == "-", sys.argv))
 
-if "-s" in all_flags:
-    ErrorHandler.dialect_errors = True
+@dataclass(slots=True)
+class BuildResult:
+    filename: str
+    status: str = "pending" # cached, ok, error (in the compiler) or failed (in nasm or ld)
+    front_end_seconds: float = 0.0
+    toolchain_seconds: float = 0.0
+    diagnostics: str = ""
+    passes: list[PassTiming] = field(default_factory=list) # filled with --time-passes
 
-filename: str = sys.argv[1]
 
-if not filename.endswith(".hdz"):
-    print("CompilerError: file extension is missing or invalid (file extension must be .hdz and file must be the first arg)")
-    exit(1)
+def compile_source(content: str, filename_no_extension: str, flags: list[str], timer: PassTimer | None = None) -> None:
+    """
+    runs the lexer, parser, folder, lowering, the ir passes of the -O level and the generator on the source
+    and writes the assembly to filename_no_extension.asm (and the ir to filename_no_extension.ir with --dump-ir),
+    with --native the assembly is also encoded into the executable while its generated so nasm and ld aren't needed,
+    with -O1 and up the assembly goes through the peephole optimizer on its way out,
+    with a timer every stage is measured on its own, so the tokens are all scanned before the parser starts instead of being streamed
+    """
+    line_index = LineIndex(content) # shared by every stage, only gets built if something needs a line number
+    if timer is not None:
+        with timer.measure("tokenizer") as timing:
+            tokens = Tokenizer(content, line_index).tokenize()
+        timing.count, timing.unit = len(tokens), "tokens"
+    else:
+        tokens = Tokenizer(content, line_index).iter_tokens() # streamed, the parser pulls tokens while the tokenizer is still scanning
+    if Trace.lexer:
+        tokens = Trace.traced_tokens(tokens)
+    parser = Parser(tokens, content, line_index)
+    with timer.measure("parser") if timer is not None else nullcontext() as timing:
+        if "--compact-ast" in flags:
+            arena = AstArena.from_parser(parser)
+            parse_tree = arena.program() # statements are stored in flat arrays and rebuilt one at a time for the lowering
+        else:
+            parse_tree = parser.parse_program()
+    if timer is not None:
+        timing.count, timing.unit = len(arena) if "--compact-ast" in flags else count_nodes(parse_tree), "nodes"
 
-with open("./" + filename, "r") as f:
-    content: str = f.read()
+    folder = ConstantFolder()
+    with timer.measure("folder") if timer is not None else nullcontext() as timing:
+        parse_tree = folder.fold_program(parse_tree) # constant subexpressions never reach the generator
+    if timer is not None:
+        timing.count, timing.unit = folder.folded, "folded nodes" # the statements of a compact tree are only folded while the lowering runs
 
-tokens = Tokenizer(content).tokenize()
-print(tokens)
-parse_tree = Parser(tokens, content).parse_program()
-print(parse_tree)
-final_asm = Generator(parse_tree, content).generate_program()
+    lowering = Lowering(content, line_index)
+    with timer.measure("lowering") if timer is not None else nullcontext() as timing:
+        function = lowering.lower_program(parse_tree)
+    if timer is not None:
+        timing.count, timing.unit = function.instruction_count(), "ir instructions"
 
-filename_no_extension = filename[:4]
+    level = optimization_level(flags)
+    with open(filename_no_extension + ".ir", "w") if "--dump-ir" in flags else nullcontext() as dump:
+        PassManager(level, timer=timer, dump=dump).run(function)
+        if dump is not None:
+            dump.write(f"; generated at -O{level}\n{function}")
 
-with open("./" + filename_no_extension + ".asm", "w") as f:
-    f.write(final_asm)
+    with open(filename_no_extension + ".asm", "w", buffering=1 << 16) as f:
+        output = StreamOutput(f) # written while the ir is walked, never held whole in memory
+        if "--native" in flags:
+            assembler = Assembler()
+            output = TeeOutput(output, assembler)
+        peephole = Peephole(output) if level >= 1 else None
+        if peephole is not None and timer is not None:
+            with timer.measure("generator") as timing: # the generator writes to a list so the peephole pass is measured on its own
+                assembly = Generator(function, []).generate_program()
+            timing.count, timing.unit = count_instructions(assembly.splitlines()), "instructions"
+            with timer.measure("peephole") as timing:
+                peephole.append(assembly)
+                peephole.finish()
+            timing.count, timing.unit, timing.details = peephole.fired.total(), "rewrites", dict(peephole.fired)
+        else:
+            with timer.measure("generator") if timer is not None else nullcontext() as timing:
+                Generator(function, peephole if peephole is not None else output).generate_program()
+                if peephole is not None:
+                    peephole.finish()
+    if timer is not None and peephole is None:
+        with open(filename_no_extension + ".asm") as f:
+            timing.count, timing.unit = count_instructions(f), "instructions"
+    if "--native" in flags:
+        with timer.measure("encoder") if timer is not None else nullcontext(): # the lines were encoded during the generator, this links them
+            assembler.write_executable(filename_no_extension)
 
-os.system("nasm -felf64 " + filename_no_extension + ".asm")
-os.system("ld " + filename_no_extension + ".o -o " + filename_no_extension)
-print("Done!")
+
+def optimization_level(flags: list[str]) -> int:
+    """
+    the level of the last -O flag (-O0, -O1 or -O2), 0 when theres none
+    """
+    level = 0
+    for flag in flags:
+        if flag.startswith("-O") and flag[2:].isdigit():
+            level = int(flag[2:])
+    return level
+
+
+def front_end(content: str, filename_no_extension: str, flags: list[str]) -> tuple[bool, str, float, list[PassTiming]]:
+    """
+    compiles one source to assembly (or straight to an executable with --native), runs in a worker process when compiling many files,
+    returns if it succeeded, the error messages it printed, how long it took and the measured stages (empty without --time-passes)
+    """
+    ErrorHandler.dialect_errors = "-s" in flags # set again because a spawned worker doesn't inherit it
+    timer = PassTimer() if "--time-passes" in flags else None
+    start = time.perf_counter()
+    try:
+        compile_source(content, filename_no_extension, flags, timer)
+    except CompileError as error:
+        return False, error.message + "\n", time.perf_counter() - start, timer.passes if timer is not None else []
+    return True, "", time.perf_counter() - start, timer.passes if timer is not None else []
+
+
+def assemble_and_link(filename_no_extension: str, timer: PassTimer | None = None) -> tuple[int, str]:
+    """
+    turns filename_no_extension.asm into an executable,
+    returns the exit code of the first tool that failed (or 0) and what the tools printed
+    """
+    output = ""
+    for command in (["nasm", "-felf64", filename_no_extension + ".asm"],
+                    ["ld", filename_no_extension + ".o", "-o", filename_no_extension]):
+        try:
+            with timer.measure_tool(command[0]) if timer is not None else nullcontext():
+                completed = subprocess.run(command, capture_output=True, text=True)
+        except FileNotFoundError:
+            return 1, output + f"CompilerError: {command[0]} was not found, it has to be installed to build the executable\n"
+        output += completed.stdout + completed.stderr
+        if completed.returncode != 0:
+            return completed.returncode, output
+    return 0, output
+
+
+def collect_sources(paths: list[str]) -> list[str]:
+    """
+    expands directories into the .hdz files inside them (searched recursively), files are kept as they are
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(glob.glob(os.path.join(path, "**", "*.hdz"), recursive=True)))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def parse_arguments(args: list[str]) -> tuple[list[str], list[str], int]:
+    """
+    splits the arguments into paths, flags and the amount of jobs (-j N or -jN, all cores by default),
+    raises ValueError when the amount of jobs isn't a positive number
+    """
+    paths = []
+    flags = []
+    jobs = os.cpu_count() or 1
+    arguments = iter(args)
+    for argument in arguments:
+        if argument.startswith("-j"):
+            value = argument[2:] if argument != "-j" else next(arguments, "1")
+            if not value.isdigit() or int(value) < 1:
+                raise ValueError("-j needs a positive number of jobs")
+            jobs = int(value)
+        elif argument.startswith("-"):
+            flags.append(argument)
+        else:
+            paths.append(argument)
+    return paths, flags, jobs
+
+
+def build(filenames: list[str], flags: list[str], jobs: int, contents: dict[str, str] | None = None) -> list[BuildResult]:
+    """
+    compiles every file, the front ends run in a process pool and nasm and ld run in up to jobs threads at the same time,
+    a file goes to the toolchain as soon as its front end is done,
+    contents has the source of files that aren't read from the disk (sent to the compile server by an editor)
+    """
+    results = [BuildResult(filename) for filename in filenames]
+    native = "--native" in flags
+    measured = "--time-passes" in flags or "--dump-ir" in flags or any(flag.startswith("--profile-compiler=") for flag in flags)
+    #NOTE: a traced, measured or dumped compile always runs every stage, otherwise the trace, the timings or the ir of a cache hit would be empty
+    cache = BuildCache(artifacts=(".asm", "") if native else None) if "--no-cache" not in flags and Trace.file is None and not measured else None
+    pending: list[tuple[BuildResult, str, str | None]] = [] # result, source and cache key of files that have to be compiled
+
+    for result in results:
+        if not result.filename.endswith(".hdz"):
+            result.status = "error"
+            result.diagnostics = "CompilerError: file extension is missing or invalid (file extension must be .hdz)\n"
+            continue
+        if contents is not None and result.filename in contents:
+            content: str = contents[result.filename]
+        else:
+            try:
+                with open(result.filename, "r") as f:
+                    content: str = f.read()
+            except OSError as error: # missing or unreadable, the other files still build
+                result.status = "error"
+                result.diagnostics = f"CompilerError: cannot read {result.filename}: {error.strerror or error}\n"
+                continue
+        key = cache.key(content, flags) if cache is not None else None
+        if cache is not None and cache.restore(key, result.filename[:-len(".hdz")]):
+            result.status = "cached"
+            continue
+        pending.append((result, content, key))
+
+    def link(result: BuildResult, key: str | None) -> None:
+        filename_no_extension = result.filename[:-len(".hdz")]
+        timer = PassTimer() if "--time-passes" in flags else None
+        start = time.perf_counter()
+        returncode, output = assemble_and_link(filename_no_extension, timer)
+        if timer is not None:
+            result.passes.extend(timer.passes)
+        result.toolchain_seconds = time.perf_counter() - start
+        result.diagnostics += output
+        result.status = "ok" if returncode == 0 else "failed"
+        if returncode == 0 and cache is not None:
+            cache.store(key, filename_no_extension)
+
+    def front_end_done(result: BuildResult, key: str | None, succeeded: bool, diagnostics: str, seconds: float, passes: list[PassTiming]) -> None:
+        result.front_end_seconds = seconds
+        result.passes.extend(passes)
+        result.diagnostics += diagnostics
+        if not succeeded:
+            result.status = "error"
+        elif native: # the executable is already written
+            result.status = "ok"
+            if cache is not None:
+                cache.store(key, result.filename[:-len(".hdz")])
+        else:
+            link_futures.append(toolchain.submit(link, result, key))
+
+    link_futures = []
+    with ThreadPoolExecutor(jobs) as toolchain:
+        #NOTE: the trace file can't be shared between processes and the profiler only sees this process,
+        # so a traced or profiled build runs the front ends one by one in this process
+        profiled = any(flag.startswith("--profile-compiler=") for flag in flags)
+        if len(pending) > 1 and jobs > 1 and Trace.file is None and not profiled:
+            with ProcessPoolExecutor(min(jobs, len(pending))) as pool:
+                futures = {pool.submit(front_end, content, result.filename[:-len(".hdz")], flags): (result, key)
+                           for result, content, key in pending}
+                for future in as_completed(futures):
+                    result, key = futures[future]
+                    try:
+                        front_end_done(result, key, *future.result())
+                    except Exception as exception: # the worker process died
+                        result.status = "error"
+                        result.diagnostics += f"CompilerError: {exception!r}\n"
+        else:
+            for result, content, key in pending:
+                front_end_done(result, key, *front_end(content, result.filename[:-len(".hdz")], flags))
+        for future in link_futures:
+            future.result()
+    return results
+
+
+def print_summary(results: list[BuildResult], seconds: float) -> None:
+    width = max(len(result.filename) for result in results)
+    print(f"{'file'.ljust(width)}  status  front end   nasm + ld")
+    for result in results:
+        print(f"{result.filename.ljust(width)}  {result.status.ljust(6)}  {result.front_end_seconds * 1000:7.1f} ms  {result.toolchain_seconds * 1000:7.1f} ms")
+    counts = {status: sum(result.status == status for result in results) for status in ("ok", "cached", "error", "failed")}
+    print(f"{len(results)} files: " + ", ".join(f"{count} {status}" for status, count in counts.items()) + f" in {seconds * 1000:.1f} ms")
+
+
+def run(args: list[str], contents: dict[str, str] | None = None) -> tuple[int, list[BuildResult]]:
+    """
+    compiles what the command line arguments ask for and prints the diagnostics,
+    returns the exit code and the result of every file
+    """
+    try:
+        paths, all_flags, jobs = parse_arguments(args)
+    except ValueError as error:
+        print(f"CompilerError: {error}")
+        return 1, []
+
+    if "-s" in all_flags:
+        ErrorHandler.dialect_errors = True
+
+    for flag in all_flags:
+        if flag.startswith("--trace="):
+            trace_file = next((flag[len("--trace-file="):] for flag in all_flags if flag.startswith("--trace-file=")), "hdz-trace.jsonl")
+            try:
+                Trace.configure(flag[len("--trace="):], trace_file)
+            except ValueError as error:
+                print(f"CompilerError: {error}")
+                return 1, []
+
+    filenames = collect_sources(paths)
+    if not filenames:
+        print("CompilerError: no files to compile (give .hdz files or directories that contain them)")
+        return 1, []
+
+    profile_file = next((flag[len("--profile-compiler="):] for flag in all_flags if flag.startswith("--profile-compiler=")), None)
+    profiler = cProfile.Profile() if profile_file is not None else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        results = build(filenames, all_flags, jobs, contents)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file) # read with python -m pstats
+    Trace.close()
+
+    for result in results:
+        if result.diagnostics:
+            if len(results) > 1:
+                print(f"{result.filename}:")
+            print(result.diagnostics, end="")
+    if "--time-passes" in all_flags:
+        for result in results:
+            if result.passes:
+                print(f"{result.filename}:")
+                print(format_passes(result.passes), end="")
+    if len(results) > 1:
+        print_summary(results, time.perf_counter() - start)
+    return (0 if all(result.status in ("ok", "cached") for result in results) else 1), results
+
+
+def main(args: list[str]) -> int:
+    return run(args)[0]
+
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
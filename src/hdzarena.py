@@ -0,0 +1,325 @@
+from array import array
+from dataclasses import fields
+from typing import Iterator
+import hdzparser as prs
+from hdzlexer import Token
+from hdztrace import Trace
+
+
+# how the fields of every node type are stored, in the order of the dataclass fields:
+# N = another node (-1 for None), T = a token, B = a bool, L = a list of nodes
+node_layouts: dict[type, str] = {
+    prs.NodeTermBool: "T", prs.NodeTermChar: "T", prs.NodeTermIdent: "T", prs.NodeTermInt: "T",
+    prs.NodeTermParen: "N", prs.NodeTermNot: "N", prs.NodeTerm: "NB",
+    prs.NodeBinExprAdd: "NN", prs.NodeBinExprSub: "NN", prs.NodeBinExprMulti: "NN", prs.NodeBinExprDiv: "NN", prs.NodeBinExprMod: "NN",
+    prs.NodeBinExprComp: "TNN", prs.NodeBinExprLogic: "TNN",
+    prs.NodeBinExpr: "N", prs.NodeLogicExpr: "N", prs.NodeExpr: "N",
+    prs.NodeStmtExit: "N", prs.NodeStmtLet: "TNT", prs.NodeStmtPrint: "NB", prs.NodeStmtBreak: "T",
+    prs.NodeIfPredElse: "N", prs.NodeIfPredElif: "NNN", prs.NodeIfPred: "N", prs.NodeStmtIf: "NNN",
+    prs.NodeStmtReassignEq: "TN", prs.NodeStmtReassignInc: "T", prs.NodeStmtReassignDec: "T", prs.NodeStmtReassign: "N",
+    prs.NodeStmtWhile: "NN", prs.NodeStmtDoWhile: "NN", prs.NodeStmtFor: "NNNN",
+    prs.NodeStmt: "N", prs.NodeScope: "L", prs.NodeProgram: "L",
+}
+
+node_types: tuple[type, ...] = tuple(node_layouts) # the kind of a node is its index in here
+node_kinds: dict[type, int] = {node_type: kind for kind, node_type in enumerate(node_types)}
+
+
+def plan_columns(layout: str) -> tuple[tuple[str, str, int], ...]:
+    """
+    decides which column every field of a node goes to: the first two nodes (or a bool) go to lhs and rhs,
+    the first token goes to token, everything else goes to the children column after the node's list of children
+    """
+    plan = []
+    free = ["lhs", "rhs"]
+    token_free = True
+    overflow = 0
+    for sort in layout:
+        if sort in "NB" and free:
+            plan.append((sort, free.pop(0), 0))
+        elif sort == "T" and token_free:
+            plan.append((sort, "token", 0))
+            token_free = False
+        else:
+            plan.append((sort, "children", overflow))
+            overflow += 1
+    return tuple(plan)
+
+node_plans: tuple[tuple[tuple[str, str, int], ...], ...] = tuple(plan_columns(node_layouts[node_type]) for node_type in node_types)
+node_fields: tuple[tuple[str, ...], ...] = tuple(tuple(field.name for field in fields(node_type)) for node_type in node_types)
+
+header_magic: bytes = b"HDZA"
+column_names: tuple[str, ...] = ("kinds", "lhs", "rhs", "tokens", "children_start", "children", "token_types", "token_starts", "token_ends")
+
+
+class AstArena:
+    """
+    a whole syntax tree stored as struct of arrays instead of nested dataclasses,
+    node i is kinds[i], lhs[i], rhs[i], tokens[i] and children_start[i] (index into children, -1 if it has none),
+    tokens are stored the same way in the token_ columns, so every node costs a few machine words
+    """
+    def __init__(self) -> None:
+        self.kinds: array = array("i")
+        self.lhs: array = array("i")
+        self.rhs: array = array("i")
+        self.tokens: array = array("i")
+        self.children_start: array = array("i")
+        self.children: array = array("i") # runs of [count, child...] followed by the extra fields of a node
+
+        self.token_types: array = array("i")
+        self.token_starts: array = array("i")
+        self.token_ends: array = array("i")
+        self.token_values: list[str | None] = []
+        self.interned_values: dict[str, str] = {} # the same identifier or number is only stored once
+
+        self.statements: list[int] = [] # top level statements of the program
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @classmethod
+    def from_parser(cls, parser: prs.Parser) -> "AstArena":
+        """
+        parses a program statement by statement and moves every statement into the arena as soon as its parsed,
+        so the nested dataclasses of only one top level statement exist at a time
+        """
+        arena = cls()
+        parser.skip_end_lines()
+        while parser.current_token is not None:
+            statement = parser.parse_statement()
+            if Trace.parser >= 2:
+                Trace.record("parser", "statement", statement=statement)
+            arena.statements.append(arena.add(statement))
+            parser.skip_end_lines()
+        if Trace.parser:
+            Trace.record("parser", "done", statements=len(arena.statements), nodes=len(arena))
+        return arena
+
+    @classmethod
+    def from_program(cls, program: prs.NodeProgram) -> "AstArena":
+        arena = cls()
+        for stmt in program.stmts:
+            arena.statements.append(arena.add(stmt))
+        return arena
+
+    def add_token(self, token: Token) -> int:
+        self.token_types.append(token.type)
+        self.token_starts.append(token.start)
+        self.token_ends.append(token.end)
+        if token.value is None:
+            self.token_values.append(None)
+        else:
+            value = str(token.value)
+            self.token_values.append(self.interned_values.setdefault(value, value))
+        return len(self.token_types) - 1
+
+    def add(self, root) -> int:
+        """
+        stores a dataclass node and everything under it, returns the index of the node,
+        walks the tree with an explicit stack so deep expressions don't hit the recursion limit
+        """
+        work: list[tuple[object, list | None]] = [(root, None)]
+        finished: list[int] = [] # indexes of stored nodes whose parent isn't stored yet
+        while work:
+            node, children = work.pop()
+            kind = node_kinds[type(node)]
+            if children is None:
+                children = self.child_nodes(node, kind)
+                work.append((node, children))
+                work.extend((child, None) for child in reversed(children))
+                continue
+
+            child_indexes = iter(finished[len(finished) - len(children):])
+            del finished[len(finished) - len(children):]
+
+            columns = {"lhs": -1, "rhs": -1, "token": -1}
+            extra: list[int] = []
+            listed: list[int] | None = None
+            for (sort, column, _), name in zip(node_plans[kind], node_fields[kind]):
+                value = getattr(node, name)
+                if sort == "N":
+                    encoded = next(child_indexes) if value is not None else -1
+                elif sort == "T":
+                    encoded = self.add_token(value) if value is not None else -1
+                elif sort == "B":
+                    encoded = int(value)
+                else:
+                    listed = [next(child_indexes) for _ in value]
+                    continue
+                if column == "children":
+                    extra.append(encoded)
+                else:
+                    columns[column] = encoded
+
+            self.kinds.append(kind)
+            self.lhs.append(columns["lhs"])
+            self.rhs.append(columns["rhs"])
+            self.tokens.append(columns["token"])
+            if listed is not None or extra:
+                self.children_start.append(len(self.children))
+                listed = listed or []
+                self.children.append(len(listed))
+                self.children.extend(listed)
+                self.children.extend(extra)
+            else:
+                self.children_start.append(-1)
+            finished.append(len(self.kinds) - 1)
+        return finished[0]
+
+    def child_nodes(self, node, kind: int) -> list:
+        """
+        returns the child nodes of a dataclass node in the order they are stored
+        """
+        children = []
+        for (sort, _, _), name in zip(node_plans[kind], node_fields[kind]):
+            value = getattr(node, name)
+            if sort == "N" and value is not None:
+                children.append(value)
+            elif sort == "L":
+                children.extend(value)
+        return children
+
+    def field_values(self, index: int) -> list[tuple[str, int | list[int]]]:
+        """
+        returns the sort and the stored value of every field of a node, lists are returned as lists of node indexes
+        """
+        values = []
+        start = self.children_start[index]
+        for sort, column, overflow in node_plans[self.kinds[index]]:
+            if sort == "L":
+                count = self.children[start]
+                values.append((sort, list(self.children[start + 1:start + 1 + count])))
+            elif column == "children":
+                values.append((sort, self.children[start + 1 + self.children[start] + overflow]))
+            elif column == "token":
+                values.append((sort, self.tokens[index]))
+            else:
+                values.append((sort, self.lhs[index] if column == "lhs" else self.rhs[index]))
+        return values
+
+    def token(self, index: int) -> Token:
+        return Token(self.token_types[index], self.token_values[index], self.token_starts[index], self.token_ends[index])
+
+    def view(self, index: int) -> "NodeView":
+        return NodeView(self, index)
+
+    def materialize(self, root: int):
+        """
+        rebuilds the dataclass node at the index with everything under it,
+        used by the generator to walk one statement at a time
+        """
+        work: list[tuple[int, bool]] = [(root, False)]
+        finished: list = []
+        while work:
+            index, children_done = work.pop()
+            values = self.field_values(index)
+            children = [value for sort, value in values if sort == "N" and value != -1]
+            children += [child for sort, value in values if sort == "L" for child in value]
+            if not children_done:
+                work.append((index, True))
+                for child in reversed(children):
+                    work.append((child, False))
+                continue
+
+            built = iter(finished[len(finished) - len(children):])
+            del finished[len(finished) - len(children):]
+            arguments = []
+            for sort, value in values:
+                if sort == "N":
+                    arguments.append(next(built) if value != -1 else None)
+                elif sort == "T":
+                    arguments.append(self.token(value) if value != -1 else None)
+                elif sort == "B":
+                    arguments.append(bool(value))
+                else:
+                    arguments.append([next(built) for _ in value])
+            finished.append(node_types[self.kinds[index]](*arguments))
+        return finished[0]
+
+    def program(self) -> "ArenaProgram":
+        return ArenaProgram(self)
+
+    def to_bytes(self) -> bytes:
+        """
+        serializes the arena, the columns are written as they are in memory
+        """
+        values = "\0".join("" if value is None else value for value in self.token_values).encode()
+        columns = [getattr(self, name) for name in column_names] + [array("i", self.statements)]
+        header = array("i", [len(column) for column in columns] + [len(values)])
+        return header_magic + header.tobytes() + b"".join(column.tobytes() for column in columns) + values
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview) -> "AstArena":
+        """
+        loads an arena written by to_bytes, the columns are memoryviews into data so nothing gets copied
+        """
+        data = memoryview(data)
+        if bytes(data[:len(header_magic)]) != header_magic:
+            raise ValueError("not a serialized syntax tree")
+        item_size = array("i").itemsize
+        offset = len(header_magic)
+        lengths = data[offset:offset + item_size * (len(column_names) + 2)].cast("i")
+        offset += item_size * len(lengths)
+
+        arena = cls()
+        for name, length in zip(column_names + ("statements",), lengths):
+            column = data[offset:offset + length * item_size].cast("i")
+            setattr(arena, name, column)
+            offset += length * item_size
+        arena.token_values = [value or None for value in bytes(data[offset:offset + lengths[-1]]).decode().split("\0")]
+        if not arena.token_types:
+            arena.token_values = []
+        return arena
+
+
+class ArenaProgram:
+    """
+    stands in for a NodeProgram, the statements are rebuilt from the arena one at a time while they are iterated
+    so the generator can walk a compact tree without changes
+    """
+    def __init__(self, arena: AstArena) -> None:
+        self.arena: AstArena = arena
+
+    @property
+    def stmts(self) -> Iterator[prs.NodeStmt]:
+        for index in self.arena.statements:
+            yield self.arena.materialize(index)
+
+
+class NodeView:
+    """
+    a read only view of one node in an arena, fields are read by the same names as on the dataclass nodes,
+    child nodes come back as views, tokens as Token objects
+    """
+    __slots__ = ("arena", "index")
+
+    def __init__(self, arena: AstArena, index: int) -> None:
+        self.arena: AstArena = arena
+        self.index: int = index
+
+    @property
+    def kind(self) -> int:
+        return self.arena.kinds[self.index]
+
+    @property
+    def node_type(self) -> type:
+        return node_types[self.kind]
+
+    def __getattr__(self, name: str):
+        names = node_fields[self.kind]
+        if name not in names:
+            raise AttributeError(f"{self.node_type.__name__} has no field {name}")
+        sort, value = self.arena.field_values(self.index)[names.index(name)]
+        if sort == "N":
+            return NodeView(self.arena, value) if value != -1 else None
+        elif sort == "T":
+            return self.arena.token(value) if value != -1 else None
+        elif sort == "B":
+            return bool(value)
+        return [NodeView(self.arena, child) for child in value]
+
+    def __repr__(self) -> str:
+        return f"NodeView({self.node_type.__name__}, {self.index})"
+
+    def materialize(self):
+        return self.arena.materialize(self.index)
@@ -0,0 +1,594 @@
+import os
+import re
+import struct
+from dataclasses import dataclass
+
+
+# register name -> (register number, size in bytes)
+registers: dict[str, tuple[int, int]] = {}
+for number, name in enumerate(("rax", "rcx", "rdx", "rbx", "rsp", "rbp", "rsi", "rdi")):
+    registers[name] = (number, 8)
+    registers["e" + name[1:]] = (number, 4)
+    registers[name[1:]] = (number, 2)
+for number, name in enumerate(("al", "cl", "dl", "bl", "spl", "bpl", "sil", "dil")):
+    registers[name] = (number, 1)
+for number in range(8, 16):
+    registers[f"r{number}"] = (number, 8)
+    registers[f"r{number}d"] = (number, 4)
+    registers[f"r{number}w"] = (number, 2)
+    registers[f"r{number}b"] = (number, 1)
+
+size_names: dict[str, int] = {"byte": 1, "word": 2, "dword": 4, "qword": 8}
+
+# condition code of every jcc, setcc and cmovcc suffix
+condition_codes: dict[str, int] = {
+    "o": 0x0, "no": 0x1, "b": 0x2, "c": 0x2, "nae": 0x2, "ae": 0x3, "nb": 0x3, "nc": 0x3,
+    "e": 0x4, "z": 0x4, "ne": 0x5, "nz": 0x5, "be": 0x6, "na": 0x6, "a": 0x7, "nbe": 0x7,
+    "s": 0x8, "ns": 0x9, "p": 0xA, "pe": 0xA, "np": 0xB, "po": 0xB,
+    "l": 0xC, "nge": 0xC, "ge": 0xD, "nl": 0xD, "le": 0xE, "ng": 0xE, "g": 0xF, "nle": 0xF,
+}
+
+alu_operations: dict[str, int] = {"add": 0, "or": 1, "adc": 2, "sbb": 3, "and": 4, "sub": 5, "xor": 6, "cmp": 7} # the /n of the 0x80 group
+unary_operations: dict[str, int] = {"not": 2, "neg": 3, "mul": 4, "imul": 5, "div": 6, "idiv": 7} # the /n of the 0xF6 group
+shift_operations: dict[str, int] = {"rol": 0, "ror": 1, "shl": 4, "sal": 4, "shr": 5, "sar": 7} # the /n of the 0xC0 group
+no_operand_instructions: dict[str, bytes] = {
+    "syscall": b"\x0f\x05", "ret": b"\xc3", "cqo": b"\x48\x99", "cdq": b"\x99", "nop": b"\x90", "leave": b"\xc9",
+}
+data_sizes: dict[str, int] = {"db": 1, "dw": 2, "dd": 4, "dq": 8}
+reserve_sizes: dict[str, int] = {"resb": 1, "resw": 2, "resd": 4, "resq": 8}
+
+base_address: int = 0x400000 # where the executable is loaded, low enough for every address to fit into a sign extended 32 bit field
+page_size: int = 0x1000
+
+label_pattern = re.compile(r"([A-Za-z_.$?][\w.$?@]*):")
+
+
+class AssemblerError(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class Register:
+    number: int
+    size: int
+    name: str
+
+
+@dataclass(slots=True)
+class Memory:
+    size: int | None # None when the instruction has to get it from the other operand
+    base: Register | None = None
+    index: Register | None = None
+    scale: int = 1
+    displacement: int = 0
+    label: str | None = None # the address of the label gets added to the displacement
+
+
+@dataclass(slots=True)
+class Immediate:
+    value: int
+    label: str | None = None # the address of the label gets added to the value
+
+
+@dataclass(slots=True)
+class Fixup:
+    section: str
+    offset: int # where the field is in the section
+    kind: str # rel32, abs32 or abs64
+    label: str
+    addend: int
+
+
+def parse_number(text: str) -> int:
+    text = text.strip()
+    if len(text) >= 3 and text[0] == text[-1] and text[0] in "'\"`":
+        value = 0
+        for character in reversed(text[1:-1].encode()):
+            value = value << 8 | character
+        return value
+    sign = -1 if text.startswith("-") else 1
+    digits = text.lstrip("+-").strip().lower()
+    if digits.startswith(("0x", "0b", "0o")):
+        return sign * int(digits, 0)
+    return sign * int(digits, 10) # decimal even with leading zeros, like nasm
+
+
+def parse_operand(text: str) -> Register | Memory | Immediate:
+    text = text.strip()
+    lowered = text.lower()
+    if lowered in registers:
+        return Register(*registers[lowered], lowered)
+
+    size = None
+    first_word = lowered.split(maxsplit=1)[0] if lowered else ""
+    if first_word in size_names:
+        size = size_names[first_word]
+        text = text[len(first_word):].strip()
+        lowered = text.lower()
+    if text.startswith("["):
+        if not text.endswith("]"):
+            raise AssemblerError(f"unclosed memory operand: {text}")
+        memory = Memory(size)
+        inner = text[1:-1].strip()
+        if inner.lower().startswith("rel "):
+            inner = inner[4:]
+        negative = False
+        for term in re.findall(r"[+-]|[^+-]+", inner):
+            term = term.strip()
+            if term in ("+", "-", ""):
+                negative ^= term == "-" # signs stack up, the generator writes things like [rsp + -8]
+                continue
+            sign = "-" if negative else "+"
+            negative = False
+            lowered_term = term.lower()
+            if "*" in term:
+                index, scale = (part.strip() for part in lowered_term.split("*"))
+                if index not in registers:
+                    index, scale = scale, index
+                memory.index = Register(*registers[index], index)
+                memory.scale = int(scale, 0)
+            elif lowered_term in registers:
+                register = Register(*registers[lowered_term], lowered_term)
+                if memory.base is None:
+                    memory.base = register
+                else:
+                    memory.index = register
+            elif re.fullmatch(r"[0-9].*|'.*'", term):
+                memory.displacement += -parse_number(term) if sign == "-" else parse_number(term)
+            else:
+                memory.label = term
+        return memory
+    if size is not None:
+        raise AssemblerError(f"size given to an operand that isn't in memory: {text}")
+
+    match = re.fullmatch(r"([A-Za-z_.$?][\w.$?@]*)\s*(?:([+-])\s*(.+))?", text)
+    if match and not re.fullmatch(r"[0-9].*", text):
+        addend = parse_number(match[3]) if match[3] else 0
+        return Immediate(-addend if match[2] == "-" else addend, match[1])
+    return Immediate(parse_number(text))
+
+
+def split_operands(text: str) -> list[str]:
+    """
+    splits the operands on commas that aren't inside quotes
+    """
+    operands = []
+    current = ""
+    quote = None
+    for character in text:
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in "'\"`":
+            quote = character
+        elif character == ",":
+            operands.append(current)
+            current = ""
+            continue
+        current += character
+    if current.strip():
+        operands.append(current)
+    return [operand.strip() for operand in operands]
+
+
+def strip_comment(line: str) -> str:
+    quote = None
+    for index, character in enumerate(line):
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in "'\"`":
+            quote = character
+        elif character == ";":
+            return line[:index]
+    return line
+
+
+def fits_in_signed(value: int, bits: int) -> bool:
+    return -(1 << (bits - 1)) <= value < (1 << (bits - 1))
+
+
+class Assembler:
+    """
+    encodes the nasm subset the generator writes into x86-64 machine code and links it into a static ELF64 executable,
+    used as an output sink of the generator (lines are assembled as they are appended) so no text is kept around,
+    jumps and calls always use 32 bit displacements, references to labels are patched once every label is known
+    """
+    def __init__(self) -> None:
+        self.sections: dict[str, bytearray] = {".text": bytearray(), ".data": bytearray()}
+        self.bss_size: int = 0
+        self.section: str = ".text"
+        self.labels: dict[str, tuple[str, int]] = {} # label -> section and offset in it
+        self.fixups: list[Fixup] = []
+        self.pending: str = "" # the start of a line that hasn't been appended whole yet
+        self.line_number: int = 0
+
+    def append(self, text: str) -> None:
+        lines = (self.pending + text).split("\n")
+        self.pending = lines.pop()
+        for line in lines:
+            self.assemble_line(line)
+
+    def finish(self) -> None:
+        if self.pending:
+            self.assemble_line(self.pending)
+            self.pending = ""
+
+    def offset(self) -> int:
+        return self.bss_size if self.section == ".bss" else len(self.sections[self.section])
+
+    def assemble_line(self, line: str) -> None:
+        self.line_number += 1
+        line = strip_comment(line).strip()
+        while True:
+            match = label_pattern.match(line)
+            if match is None:
+                break
+            self.define_label(match[1])
+            line = line[match.end():].strip()
+        if not line:
+            return
+
+        mnemonic, _, rest = line.partition(" ")
+        mnemonic = mnemonic.lower()
+        if rest.split(maxsplit=1) and rest.split(maxsplit=1)[0].lower() in data_sizes | reserve_sizes and mnemonic not in data_sizes:
+            self.define_label(line.split()[0]) # "name db 1" is a label without a colon
+            mnemonic, _, rest = rest.strip().partition(" ")
+            mnemonic = mnemonic.lower()
+        try:
+            self.assemble_statement(mnemonic, rest.strip())
+        except (AssemblerError, ValueError, KeyError) as error:
+            raise AssemblerError(f"line {self.line_number}: {line}: {error}") from None
+
+    def define_label(self, label: str) -> None:
+        if label in self.labels:
+            raise AssemblerError(f"line {self.line_number}: label defined twice: {label}")
+        self.labels[label] = (self.section, self.offset())
+
+    def assemble_statement(self, mnemonic: str, rest: str) -> None:
+        if mnemonic == "section":
+            self.section = rest.split()[0]
+            if self.section not in (".text", ".data", ".bss"):
+                raise AssemblerError(f"unknown section {self.section}")
+            return
+        if mnemonic in ("global", "extern", "bits", "default"):
+            return
+        if mnemonic == "align":
+            alignment = parse_number(rest)
+            padding = -self.offset() % alignment
+            if self.section == ".bss":
+                self.bss_size += padding
+            else:
+                self.sections[self.section] += (b"\x90" if self.section == ".text" else b"\x00") * padding
+            return
+        if mnemonic in reserve_sizes:
+            if self.section != ".bss":
+                raise AssemblerError(f"{mnemonic} outside of .bss")
+            self.bss_size += reserve_sizes[mnemonic] * parse_number(rest)
+            return
+        if self.section == ".bss":
+            raise AssemblerError("only resb, resw, resd and resq can be in .bss")
+        if mnemonic in data_sizes:
+            self.emit_data(data_sizes[mnemonic], split_operands(rest))
+            return
+        self.emit_instruction(mnemonic, [parse_operand(operand) for operand in split_operands(rest)])
+
+    def emit_data(self, size: int, items: list[str]) -> None:
+        output = self.sections[self.section]
+        for item in items:
+            if len(item) >= 2 and item[0] == item[-1] and item[0] in "'\"`" and (size == 1 or len(item) > size + 2):
+                encoded = item[1:-1].encode()
+                output += encoded + b"\x00" * (-len(encoded) % size)
+                continue
+            operand = parse_operand(item)
+            if not isinstance(operand, Immediate):
+                raise AssemblerError(f"invalid data: {item}")
+            if operand.label is not None:
+                if size not in (4, 8):
+                    raise AssemblerError("addresses only fit into dd or dq")
+                self.fixups.append(Fixup(self.section, len(output), "abs64" if size == 8 else "abs32", operand.label, operand.value))
+                output += b"\x00" * size
+            else:
+                output += (operand.value & ((1 << (size * 8)) - 1)).to_bytes(size, "little")
+
+    def emit(self, code: bytes | bytearray) -> None:
+        self.sections[self.section] += code
+
+    def encode_modrm(self, opcode: bytes, reg: int | Register, rm: Register | Memory, size: int | None,
+                     immediate: bytes = b"", extra_rex: bool = False) -> None:
+        """
+        emits an instruction with a ModRM byte: operand size prefix, REX prefix, opcode, ModRM, SIB, displacement, immediate,
+        reg is a register or the /n opcode extension, size is the operand size that decides the prefixes
+        """
+        if isinstance(reg, Register):
+            if reg.size == 1 and 4 <= reg.number < 8:
+                extra_rex = True # spl, bpl, sil and dil only exist with a REX prefix
+            reg = reg.number
+        rex = 0
+        if size == 8:
+            rex |= 0x08
+        if reg >= 8:
+            rex |= 0x04
+        tail = bytearray()
+        fixup = None
+        if isinstance(rm, Register):
+            if rm.number >= 8:
+                rex |= 0x01
+            if rm.size == 1 and 4 <= rm.number < 8:
+                extra_rex = True # spl, bpl, sil and dil only exist with a REX prefix
+            modrm = 0xC0 | (reg & 7) << 3 | (rm.number & 7)
+            tail.append(modrm)
+        else:
+            if rm.index is not None:
+                if rm.index.number == 4:
+                    raise AssemblerError("rsp can't be an index")
+                if rm.index.number >= 8:
+                    rex |= 0x02
+            if rm.base is not None and rm.base.number >= 8:
+                rex |= 0x01
+            scale_bits = {1: 0, 2: 1, 4: 2, 8: 3}[rm.scale]
+            displacement = rm.displacement
+            if rm.base is None:
+                # [disp32] and [index * scale + disp32] both go through a SIB byte without a base
+                index = rm.index.number & 7 if rm.index is not None else 4
+                tail += bytes((0x04 | (reg & 7) << 3, scale_bits << 6 | index << 3 | 5))
+                mode_size = 4
+            else:
+                if rm.label is not None or not fits_in_signed(displacement, 8):
+                    mode, mode_size = 0x80, 4
+                elif displacement != 0 or rm.base.number & 7 == 5: # rbp and r13 as a base always need a displacement
+                    mode, mode_size = 0x40, 1
+                else:
+                    mode, mode_size = 0x00, 0
+                if rm.index is not None or rm.base.number & 7 == 4: # rsp and r12 as a base always need a SIB byte
+                    index = rm.index.number & 7 if rm.index is not None else 4
+                    tail += bytes((mode | (reg & 7) << 3 | 4, scale_bits << 6 | index << 3 | (rm.base.number & 7)))
+                else:
+                    tail.append(mode | (reg & 7) << 3 | (rm.base.number & 7))
+            if rm.label is not None:
+                fixup = (len(tail), rm.label, displacement)
+                displacement = 0
+            if mode_size == 1:
+                tail += struct.pack("<b", displacement)
+            elif mode_size == 4:
+                tail += struct.pack("<i", displacement)
+
+        prefix = bytearray()
+        if size == 2:
+            prefix.append(0x66)
+        if rex or extra_rex:
+            prefix.append(0x40 | rex)
+        start = len(self.sections[self.section]) + len(prefix) + len(opcode)
+        if fixup is not None:
+            self.fixups.append(Fixup(self.section, start + fixup[0], "abs32", fixup[1], fixup[2]))
+        self.emit(prefix + opcode + tail + immediate)
+
+    def emit_jump(self, opcode: bytes, target: Immediate) -> None:
+        if target.label is None:
+            raise AssemblerError("jumps need a label")
+        self.emit(opcode)
+        self.fixups.append(Fixup(self.section, len(self.sections[self.section]), "rel32", target.label, target.value - 4))
+        self.emit(b"\x00\x00\x00\x00")
+
+    def immediate_bytes(self, immediate: Immediate, size: int, offset_in_instruction: int | None = None) -> bytes:
+        if immediate.label is not None:
+            raise AssemblerError("an address can only be used here by mov")
+        if not fits_in_signed(immediate.value, size * 8) and not 0 <= immediate.value < 1 << (size * 8):
+            raise AssemblerError(f"immediate doesn't fit into {size} bytes: {immediate.value}")
+        return (immediate.value & ((1 << (size * 8)) - 1)).to_bytes(size, "little")
+
+    def emit_instruction(self, mnemonic: str, operands: list) -> None:
+        count = len(operands)
+        sizes = [operand.size for operand in operands if isinstance(operand, (Register, Memory)) and operand.size is not None]
+
+        if mnemonic in no_operand_instructions and count == 0:
+            self.emit(no_operand_instructions[mnemonic])
+        elif mnemonic == "jmp" and count == 1:
+            self.emit_jump(b"\xe9", operands[0])
+        elif mnemonic == "call" and count == 1:
+            self.emit_jump(b"\xe8", operands[0])
+        elif mnemonic.startswith("j") and mnemonic[1:] in condition_codes and count == 1:
+            self.emit_jump(bytes((0x0F, 0x80 | condition_codes[mnemonic[1:]])), operands[0])
+        elif mnemonic.startswith("set") and mnemonic[3:] in condition_codes and count == 1:
+            self.encode_modrm(bytes((0x0F, 0x90 | condition_codes[mnemonic[3:]])), 0, operands[0], 1)
+        elif mnemonic.startswith("cmov") and mnemonic[4:] in condition_codes and count == 2:
+            destination, source = operands
+            self.encode_modrm(bytes((0x0F, 0x40 | condition_codes[mnemonic[4:]])), destination, source, destination.size)
+        elif mnemonic == "mov" and count == 2:
+            self.emit_mov(*operands)
+        elif mnemonic in ("push", "pop") and count == 1:
+            self.emit_push_pop(mnemonic, operands[0])
+        elif mnemonic in alu_operations and count == 2:
+            self.emit_alu(alu_operations[mnemonic], *operands)
+        elif mnemonic == "test" and count == 2:
+            destination, source = operands
+            size = destination.size or source.size
+            if isinstance(source, Immediate):
+                self.encode_modrm(b"\xf6" if size == 1 else b"\xf7", 0, destination, size, self.immediate_bytes(source, min(size, 4)))
+            else:
+                self.encode_modrm(b"\x84" if size == 1 else b"\x85", source, destination, size)
+        elif mnemonic in unary_operations and count == 1:
+            size = operands[0].size
+            if size is None:
+                raise AssemblerError("operand size not given")
+            self.encode_modrm(b"\xf6" if size == 1 else b"\xf7", unary_operations[mnemonic], operands[0], size)
+        elif mnemonic == "imul" and count in (2, 3):
+            if count == 2 and isinstance(operands[1], Immediate): # nasm's short form of imul reg, reg, imm
+                operands = [operands[0], operands[0], operands[1]]
+                count = 3
+            destination, source = operands[0], operands[1]
+            if count == 2:
+                self.encode_modrm(b"\x0f\xaf", destination, source, destination.size)
+            elif fits_in_signed(operands[2].value, 8):
+                self.encode_modrm(b"\x6b", destination, source, destination.size, self.immediate_bytes(operands[2], 1))
+            else:
+                self.encode_modrm(b"\x69", destination, source, destination.size, self.immediate_bytes(operands[2], min(destination.size, 4)))
+        elif mnemonic in ("inc", "dec") and count == 1:
+            size = operands[0].size
+            if size is None:
+                raise AssemblerError("operand size not given")
+            self.encode_modrm(b"\xfe" if size == 1 else b"\xff", 0 if mnemonic == "inc" else 1, operands[0], size)
+        elif mnemonic in shift_operations and count == 2:
+            destination, amount = operands
+            size = destination.size
+            extension = shift_operations[mnemonic]
+            if isinstance(amount, Register):
+                if amount.name != "cl":
+                    raise AssemblerError("shifts by a register only work with cl")
+                self.encode_modrm(b"\xd2" if size == 1 else b"\xd3", extension, destination, size)
+            elif amount.value == 1:
+                self.encode_modrm(b"\xd0" if size == 1 else b"\xd1", extension, destination, size)
+            else:
+                self.encode_modrm(b"\xc0" if size == 1 else b"\xc1", extension, destination, size, self.immediate_bytes(amount, 1))
+        elif mnemonic == "lea" and count == 2:
+            self.encode_modrm(b"\x8d", operands[0], operands[1], operands[0].size)
+        elif mnemonic in ("movzx", "movsx") and count == 2:
+            destination, source = operands
+            if source.size not in (1, 2):
+                raise AssemblerError("the source has to be a byte or a word")
+            opcode = (0xB6 if mnemonic == "movzx" else 0xBE) + (source.size == 2)
+            self.encode_modrm(bytes((0x0F, opcode)), destination, source, destination.size)
+        elif mnemonic == "movsxd" and count == 2:
+            self.encode_modrm(b"\x63", operands[0], operands[1], 8)
+        elif mnemonic == "xchg" and count == 2:
+            destination, source = operands
+            if isinstance(source, Memory):
+                destination, source = source, destination
+            self.encode_modrm(b"\x86" if source.size == 1 else b"\x87", source, destination, source.size)
+        else:
+            raise AssemblerError(f"unsupported instruction {mnemonic} with {count} operands")
+
+    def emit_mov(self, destination, source) -> None:
+        if isinstance(source, Immediate):
+            if isinstance(destination, Register):
+                size = destination.size
+                number = destination.number
+                rex_b = b"\x41" if number >= 8 else b""
+                if source.label is not None:
+                    if size != 8:
+                        raise AssemblerError("addresses only fit into 64 bit registers")
+                    self.encode_modrm(b"\xc7", 0, destination, 8)
+                    self.fixups.append(Fixup(self.section, len(self.sections[self.section]), "abs32", source.label, source.value))
+                    self.emit(b"\x00\x00\x00\x00")
+                elif size == 8 and 0 <= source.value < 1 << 32:
+                    self.emit(rex_b + bytes((0xB8 | number & 7,)) + source.value.to_bytes(4, "little")) # like nasm, written as the 32 bit mov that zero extends
+                elif size == 8 and fits_in_signed(source.value, 32):
+                    self.encode_modrm(b"\xc7", 0, destination, 8, self.immediate_bytes(source, 4))
+                elif size == 8:
+                    self.emit(bytes((0x49 if number >= 8 else 0x48, 0xB8 | number & 7)) + self.immediate_bytes(source, 8))
+                elif size == 1:
+                    prefix = b"\x41" if number >= 8 else b"\x40" if 4 <= number < 8 else b""
+                    self.emit(prefix + bytes((0xB0 | number & 7,)) + self.immediate_bytes(source, 1))
+                else:
+                    self.emit((b"\x66" if size == 2 else b"") + rex_b + bytes((0xB8 | number & 7,)) + self.immediate_bytes(source, size))
+            else:
+                if destination.size is None:
+                    raise AssemblerError("operand size not given")
+                size = destination.size
+                self.encode_modrm(b"\xc6" if size == 1 else b"\xc7", 0, destination, size, self.immediate_bytes(source, min(size, 4)))
+        elif isinstance(source, Register):
+            self.encode_modrm(b"\x88" if source.size == 1 else b"\x89", source, destination, source.size)
+        else:
+            self.encode_modrm(b"\x8a" if destination.size == 1 else b"\x8b", destination, source, destination.size)
+
+    def emit_push_pop(self, mnemonic: str, operand) -> None:
+        if isinstance(operand, Register):
+            if operand.size not in (2, 8):
+                raise AssemblerError(f"can't {mnemonic} a {operand.size} byte register")
+            prefix = (b"\x66" if operand.size == 2 else b"") + (b"\x41" if operand.number >= 8 else b"")
+            self.emit(prefix + bytes(((0x50 if mnemonic == "push" else 0x58) | operand.number & 7,)))
+        elif isinstance(operand, Memory):
+            size = operand.size or 8
+            #NOTE: push and pop are 64 bit by default so only the 16 bit version needs a size (the 0x66 prefix) and never REX.W
+            self.encode_modrm(b"\xff" if mnemonic == "push" else b"\x8f", 6 if mnemonic == "push" else 0, operand, 2 if size == 2 else None)
+        elif mnemonic == "push":
+            if fits_in_signed(operand.value, 8) and operand.label is None:
+                self.emit(b"\x6a" + self.immediate_bytes(operand, 1))
+            else:
+                self.emit(b"\x68" + self.immediate_bytes(operand, 4))
+        else:
+            raise AssemblerError("can't pop into an immediate")
+
+    def emit_alu(self, extension: int, destination, source) -> None:
+        size = destination.size or (source.size if not isinstance(source, Immediate) else None)
+        if size is None:
+            raise AssemblerError("operand size not given")
+        if isinstance(source, Immediate):
+            if size != 1 and fits_in_signed(source.value, 8):
+                self.encode_modrm(b"\x83", extension, destination, size, self.immediate_bytes(source, 1))
+            else:
+                self.encode_modrm(b"\x80" if size == 1 else b"\x81", extension, destination, size, self.immediate_bytes(source, min(size, 4)))
+        elif isinstance(source, Register):
+            self.encode_modrm(bytes((extension << 3 | (0 if size == 1 else 1),)), source, destination, size)
+        else:
+            self.encode_modrm(bytes((extension << 3 | (2 if size == 1 else 3),)), destination, source, size)
+
+    def link(self, entry: str = "_start") -> bytes:
+        """
+        lays the sections out, patches every reference to a label and returns the bytes of the executable
+        """
+        self.finish()
+        text = self.sections[".text"]
+        data = self.sections[".data"]
+        segment_count = 2 if data or self.bss_size else 1
+        header_size = 64 + 56 * segment_count
+        text_offset = header_size + (-header_size % 16)
+        data_offset = text_offset + len(text) + (-(text_offset + len(text)) % page_size)
+        bss_offset = len(data) + (-len(data) % 16) # from the start of the data segment
+        addresses = {
+            ".text": base_address + text_offset,
+            ".data": base_address + data_offset,
+            ".bss": base_address + data_offset + bss_offset,
+        }
+
+        def address_of(label: str) -> int:
+            if label not in self.labels:
+                raise AssemblerError(f"undefined label: {label}")
+            section, offset = self.labels[label]
+            return addresses[section] + offset
+
+        for fixup in self.fixups:
+            section = self.sections[fixup.section]
+            target = address_of(fixup.label) + fixup.addend
+            if fixup.kind == "rel32":
+                value = target - (addresses[fixup.section] + fixup.offset)
+                section[fixup.offset:fixup.offset + 4] = struct.pack("<i", value)
+            elif fixup.kind == "abs32":
+                section[fixup.offset:fixup.offset + 4] = struct.pack("<i", target)
+            else:
+                section[fixup.offset:fixup.offset + 8] = struct.pack("<Q", target)
+
+        # section headers after the contents so tools like objdump and gdb can find the code
+        names = b"\0.text\0.data\0.bss\0.shstrtab\0"
+        file_end = data_offset + len(data) if segment_count == 2 else text_offset + len(text)
+        names_offset = file_end
+        section_header_offset = names_offset + len(names) + (-(names_offset + len(names)) % 8)
+        section_headers = [
+            struct.pack("<IIQQQQIIQQ", 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+            struct.pack("<IIQQQQIIQQ", 1, 1, 6, addresses[".text"], text_offset, len(text), 0, 0, 16, 0),
+            struct.pack("<IIQQQQIIQQ", 7, 1, 3, addresses[".data"], data_offset, len(data), 0, 0, 16, 0),
+            struct.pack("<IIQQQQIIQQ", 13, 8, 3, addresses[".bss"], data_offset + bss_offset, self.bss_size, 0, 0, 16, 0),
+            struct.pack("<IIQQQQIIQQ", 18, 3, 0, 0, names_offset, len(names), 0, 0, 1, 0),
+        ]
+
+        elf_header = struct.pack("<4sBBBBB7sHHIQQQIHHHHHH", b"\x7fELF", 2, 1, 1, 0, 0, b"\0" * 7,
+                                 2, 0x3E, 1, address_of(entry), 64, section_header_offset, 0,
+                                 64, 56, segment_count, 64, len(section_headers), len(section_headers) - 1)
+        program_headers = struct.pack("<IIQQQQQQ", 1, 5, 0, base_address, base_address, text_offset + len(text), text_offset + len(text), page_size)
+        if segment_count == 2:
+            program_headers += struct.pack("<IIQQQQQQ", 1, 6, data_offset, addresses[".data"], addresses[".data"],
+                                           len(data), bss_offset + self.bss_size, page_size)
+
+        image = bytearray(elf_header + program_headers)
+        image += b"\0" * (text_offset - len(image)) + text
+        if segment_count == 2:
+            image += b"\0" * (data_offset - len(image)) + data
+        image += names + b"\0" * (section_header_offset - names_offset - len(names))
+        image += b"".join(section_headers)
+        return bytes(image)
+
+    def write_executable(self, filename: str, entry: str = "_start") -> None:
+        image = self.link(entry)
+        with open(filename, "wb") as f:
+            f.write(image)
+        os.chmod(filename, 0o755)
@@ -0,0 +1,21 @@
+"""
+benchmarks of the compiler, run from the src directory:
+
+    python -m hdzbench [--axes statements,nesting_depth] [--repeat R] [--quick] [--output results.json]
+                       [--check baseline.json] [--threshold 0.25] [--baseline REV]
+    python -m hdzbench --check-division
+    python -m hdzbench --check-levels
+    python -m hdzbench --print-numbers [--repeat R] [--quick]
+
+every axis (statements, expression_length, nesting_depth, variable_count) generates programs of growing size,
+the tokenizer, parser and generator are timed and their peak memory is recorded separately for every program,
+--output stores the results as json, --check compares them to stored results and fails if a phase regressed by more than --threshold,
+--baseline checks out the compiler sources of a git revision into a temporary directory and runs the same suite against them,
+--check-division compiles and runs a program that compares multiplying, dividing and taking the remainder by constants with imul and idiv
+on edge values at every -O level,
+--check-levels compiles test.hdz and programs with loops right after each other at every -O level and fails when their output or exit code differs,
+--print-numbers times compiled programs printing numbers with hutorcislo against the same numbers printed digit by digit in a hadzik loop
+"""
+from hdzbench.programs import axes, generate_source
+from hdzbench.measure import phases, measure_phases, find_regressions
+from hdzbench.suite import run_suite, run_at_revision
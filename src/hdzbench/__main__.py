@@ -0,0 +1,87 @@
+import sys
+import json
+
+from hdzbench.programs import axes
+from hdzbench.measure import phases, find_regressions
+from hdzbench.suite import run_suite, run_at_revision
+from hdzbench.division import check_division
+from hdzbench.levels import check_levels
+from hdzbench.runtime import run_print_numbers
+
+
+def print_report(name: str, results: dict) -> None:
+    print(f"{name} (python {results['python']}, best of {results['repeat']})")
+    print(f"    {'case':26} {'lines':>7} {'tokens':>8}" + "".join(f" {phase + ' ms':>13} {'peak KB':>9}" for phase in phases))
+    for case, result in results["cases"].items():
+        print(f"    {case:26} {result['lines']:>7} {result['tokens']:>8}" +
+              "".join(f" {result[phase]['seconds'] * 1000:>13.2f} {result[phase]['peak_bytes'] / 1024:>9.0f}" for phase in phases))
+
+
+def print_speedups(results: dict, baseline: dict) -> None:
+    print("speedup against the baseline (time / peak memory):")
+    for case, result in results["cases"].items():
+        if case not in baseline["cases"]:
+            continue
+        old = baseline["cases"][case]
+        print(f"    {case:26}" + "".join(
+            f" {phase} {old[phase]['seconds'] / result[phase]['seconds']:.2f}x / {old[phase]['peak_bytes'] / max(1, result[phase]['peak_bytes']):.2f}x"
+            for phase in phases))
+
+
+def main(args: list[str]) -> int:
+    def option(name: str, default: str | None) -> str | None:
+        return args[args.index(name) + 1] if name in args else default
+
+    if "--check-division" in args:
+        return check_division()
+    if "--check-levels" in args:
+        return check_levels()
+    if "--print-numbers" in args:
+        return run_print_numbers(int(option("--repeat", "3")), "--quick" in args)
+
+    axis_names = option("--axes", ",".join(axes)).split(",")
+    for axis in axis_names:
+        if axis not in axes:
+            print(f"unknown axis: {axis} (axes are {', '.join(axes)})")
+            return 1
+    repeat = int(option("--repeat", "3"))
+    quick = "--quick" in args
+    compiler_dir = option("--compiler-dir", None)
+    output = option("--output", None)
+    check = option("--check", None)
+    threshold = float(option("--threshold", "0.25"))
+    baseline = option("--baseline", None)
+
+    if compiler_dir is not None:
+        sys.path.insert(0, compiler_dir)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000)) # the deepest programs recurse in the parser and generator
+
+    results = run_suite(axis_names, repeat, quick)
+    if "--json" in args:
+        print(json.dumps(results))
+        return 0
+
+    print_report("current", results)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if baseline is not None:
+        suite_args = ["--axes", ",".join(axis_names), "--repeat", str(repeat)] + (["--quick"] if quick else [])
+        baseline_results = run_at_revision(baseline, suite_args)
+        print_report(baseline, baseline_results)
+        print_speedups(results, baseline_results)
+
+    if check is not None:
+        with open(check) as f:
+            regressions = find_regressions(results, json.load(f), threshold)
+        for regression in regressions:
+            print("regression: " + regression)
+        if regressions:
+            return 1
+        print(f"no phase regressed by more than {threshold:.0%} against {check}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,77 @@
+"""
+checks the code generated for multiplying, dividing and taking the remainder by constants against what imul and idiv give,
+every edge value is divided by every constant in a compiled program that prints . for a right result and X for a wrong one
+"""
+import tempfile
+import subprocess
+
+from hdzfold import wrap, divide, remainder
+from hdzbench.runtime import compile_native
+
+int_min: int = -(1 << 63)
+int_max: int = (1 << 63) - 1
+edge_values: tuple[int, ...] = (
+    0, 1, -1, 2, -2, 3, -3, 7, -7, 100, -100, 1023, -1025,
+    (1 << 31) - 1, -(1 << 31), 1 << 32, 1 << 62, -(1 << 62) + 1, int_max, int_min, int_max - 1, int_min + 1,
+    12345678901234567, -98765432109876543,
+)
+# powers of two, the multipliers of lea, small and large odd numbers and the ones around the 32 and 64 bit limits
+divisors: tuple[int, ...] = (
+    1, 2, -2, 4, 8, -16, 1024, 1 << 31, 1 << 32, 1 << 62, -(1 << 62),
+    3, -3, 5, 6, 7, -7, 9, 10, 12, 25, 100, 641, 1000, -1000, 6700417,
+    (1 << 31) - 1, -(1 << 31) + 1, (1 << 32) + 1, (1 << 62) + 1, -(1 << 62) - 1, int_max, int_min + 1,
+)
+factors: tuple[int, ...] = (0, 1, -1, 2, 3, 5, 6, 9, 10, 24, 40, 72, -4, -3, 7, 1000, (1 << 31) - 1, 1 << 32, (1 << 40) + 3, int_min)
+flag_divisors: tuple[int, ...] = (1, 2, 4, -4, 3, 7) # a bul can't be negative, so the power of two divisions are a plain shift and and
+
+
+def literal(value: int) -> str:
+    return f"-{-value}" if value < 0 else str(value)
+
+
+def generate_check() -> tuple[str, list[str]]:
+    """
+    the program and what every character it prints checks
+    """
+    lines = ["naj n = 0", "bul flag = pravda"]
+    cases: list[str] = []
+
+    def check(condition: str, case: str) -> None:
+        lines.append(f"kec({condition}){{ hutor('.') }} inac {{ hutor('X') }}")
+        cases.append(case)
+
+    for value in edge_values:
+        lines.append(f"n = {literal(value)}")
+        for divisor in divisors:
+            if value == int_min and divisor == -1:
+                continue # idiv crashes
+            check(f"n / {literal(divisor)} == {literal(divide(value, divisor))}", f"{value} / {divisor}")
+            check(f"n % {literal(divisor)} == {literal(remainder(value, divisor))}", f"{value} % {divisor}")
+        for factor in factors:
+            check(f"n * {literal(factor)} == {literal(wrap(value * factor))}", f"{value} * {factor}")
+    for flag in (1, 0):
+        lines.append(f"flag = {'pravda' if flag else 'klamstvo'}")
+        for divisor in flag_divisors:
+            check(f"flag / {literal(divisor)} == {literal(divide(flag, divisor))}", f"bul {flag} / {divisor}")
+            check(f"flag % {literal(divisor)} == {literal(remainder(flag, divisor))}", f"bul {flag} % {divisor}")
+    return "\n".join(lines) + "\n", cases
+
+
+def check_division(levels: tuple[str, ...] = ("-O0", "-O1", "-O2")) -> int:
+    """
+    compiles the check with the native backend at every level and runs it, returns 1 when a result was wrong
+    """
+    source, cases = generate_check()
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for level in levels:
+            path = compile_native(source, directory, "division", (level,))
+            output = subprocess.run([path], capture_output=True).stdout.decode("latin-1")
+            wrong = [case for case, result in zip(cases, output) if result != "."]
+            if len(output) != len(cases):
+                wrong.append(f"the program stopped after {len(output)} of {len(cases)} checks")
+            print(f"{level}: {len(cases)} checks, {len(wrong)} wrong")
+            for case in wrong:
+                print("    wrong: " + case)
+            failed = failed or bool(wrong)
+    return 1 if failed else 0
@@ -0,0 +1,59 @@
+"""
+checks that programs print the same and exit with the same code at every -O level, test.hdz and loops that leave
+straight into the next loop, which the loop passes of -O2 once broke (the exit of the first loop was put into the second one)
+"""
+import os
+import tempfile
+import subprocess
+
+from hdzbench.runtime import src_directory, compile_native
+
+# the kim counts a variable the furt doesn't touch down from 8, so it exits with 1
+back_to_back_loops: str = """naj s = 0
+naj k = 8
+furt(naj i = 0, i < 3, i++){
+    s = s + i
+}
+kim(k > 1){
+    k--
+}
+vychod(k)
+"""
+# three loops in a row that all change the same variables
+loop_chain: str = """naj a = 0
+naj b = 10
+kim(b > 5){
+    b--
+}
+furt(naj i = 0, i < 4, i++){
+    a = a + b
+}
+zrob {
+    b--
+    a++
+} kim(b > 0)
+hutorcislo(a)
+vychod(b)
+"""
+
+
+def check_levels(levels: tuple[str, ...] = ("-O0", "-O1", "-O2")) -> int:
+    """
+    compiles every program at every level and runs it, returns 1 when a level printed or exited differently from the first one
+    """
+    with open(os.path.join(src_directory, "test.hdz")) as f:
+        programs = {"test": f.read(), "back_to_back_loops": back_to_back_loops, "loop_chain": loop_chain}
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for name, source in programs.items():
+            results = {}
+            for level in levels:
+                run = subprocess.run([compile_native(source, directory, name, (level,))], capture_output=True)
+                results[level] = (run.stdout, run.returncode)
+            expected = results[levels[0]]
+            wrong = [level for level in levels if results[level] != expected]
+            print(f"{name}: exit code {expected[1]} at {levels[0]}, " + (f"different at {', '.join(wrong)}" if wrong else "the same at every level"))
+            for level in wrong:
+                print(f"    {level}: exit code {results[level][1]}, printed {results[level][0]!r}")
+            failed = failed or bool(wrong)
+    return 1 if failed else 0
@@ -0,0 +1,110 @@
+"""
+times every phase of the compiler on a program and records how much memory each phase allocates at its peak
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+import contextlib
+
+phases: tuple[str, ...] = ("lexer", "parser", "generator")
+minimum_total_seconds: float = 0.05 # fast phases are run more than repeat times until they took at least this long in total
+noise_floor_seconds: float = 0.002 # phases faster than this are too noisy to fail the regression check on time
+
+
+def best_time(function, repeat: int, setup=None) -> tuple[float, object]:
+    """
+    runs the function at least repeat times and returns the fastest time and the last result,
+    the result of setup (if given) is passed to the function and isn't timed
+    """
+    best = float("inf")
+    result = None
+    runs = 0
+    total = 0.0
+    while runs < repeat or total < minimum_total_seconds:
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        result = function(argument) if setup is not None else function()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return best, result
+
+
+def peak_memory(function, setup=None) -> int:
+    """
+    returns the most memory the function had allocated at once (in bytes), not counting what setup allocated
+    """
+    argument = setup() if setup is not None else None
+    tracemalloc.start()
+    try:
+        function(argument) if setup is not None else function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_phases(source: str, repeat: int) -> dict:
+    """
+    measures the tokenizer, the parser and the generator separately,
+    every phase gets its input prepared up front so only the phase itself is measured
+    """
+    from hdzlexer import Tokenizer
+    from hdzparser import Parser
+    import hdzgenerator
+    from hdzgenerator import Generator
+    try:
+        from hdzlower import Lowering # compilers with the ir lower the tree before generating, older ones generate from the tree
+    except ImportError:
+        Lowering = None
+    if Lowering is not None and os.path.dirname(sys.modules[Lowering.__module__].__file__) != os.path.dirname(hdzgenerator.__file__):
+        Lowering = None # found next to the benchmark instead of in the measured compiler
+
+    def tokenize():
+        return Tokenizer(source).tokenize()
+
+    def parse(tokens=None):
+        return Parser(tokens, source).parse_program()
+
+    def generate(program):
+        if Lowering is not None:
+            return Generator(Lowering(source).lower_program(program)).generate_program()
+        return Generator(program, source).generate_program()
+
+    def fresh_program():
+        return parse(tokenize()) # the generator changes the tree, so every run gets a new one
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()): # older versions of the compiler print debug output
+        seconds, tokens = best_time(tokenize, repeat)
+        results["lexer"] = {"seconds": seconds, "peak_bytes": peak_memory(tokenize)}
+        seconds, program = best_time(parse, repeat, tokenize)
+        results["parser"] = {"seconds": seconds, "peak_bytes": peak_memory(parse, tokenize)}
+        seconds, _ = best_time(generate, repeat, fresh_program)
+        results["generator"] = {"seconds": seconds, "peak_bytes": peak_memory(generate, fresh_program)}
+    results["lines"] = source.count("\n")
+    results["tokens"] = len(tokens)
+    results["statements"] = len(program.stmts)
+    return results
+
+
+def find_regressions(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    compares two suite results, returns a message for every phase of every case that got slower
+    or used more memory than the baseline by more than threshold (0.25 = 25%)
+    """
+    regressions = []
+    for case, result in current["cases"].items():
+        if case not in baseline["cases"]:
+            continue
+        for phase in phases:
+            for metric in ("seconds", "peak_bytes"):
+                new = result[phase][metric]
+                old = baseline["cases"][case][phase][metric]
+                if metric == "seconds" and max(old, new) < noise_floor_seconds:
+                    continue
+                if old > 0 and new > old * (1 + threshold):
+                    regressions.append(f"{case} {phase} {metric}: {old:.6g} -> {new:.6g} ({new / old - 1:+.0%})")
+    return regressions
@@ -0,0 +1,101 @@
+"""
+generators of valid hadzik programs, every axis grows one property of a program and keeps the rest small
+"""
+
+statement_block: str = """naj a{n} = {n} * (3 + 4) - 12 / 4 % 5
+bul b{n} = a{n} >= 10 aj a{n} != 12 abo ne pravda
+kec(b{n}){{
+    hutor('y')
+    a{n}++
+}}
+ikec (a{n} % 3 == 0){{
+    hutor('\\n')
+}}
+inac {{
+    a{n} = a{n} - 1 // decrement
+}}
+/* loop over
+   the values */
+furt(naj i{n} = 0, i{n} < 5, i{n}++){{
+    hutor(i{n} + 60)
+}}
+"""
+block_lines: int = statement_block.count("\n")
+
+binary_operators: tuple[str, ...] = ("+", "-", "*", "/", "%")
+
+
+def generate_source(lines: int) -> str:
+    """
+    generates a valid hadzik program of roughly the given amount of lines
+    """
+    return "".join(statement_block.format(n=n) for n in range(max(1, lines // block_lines)))
+
+
+def generate_statements(count: int) -> str:
+    """
+    count statements of every kind the language has, the statement_block repeated
+    """
+    return generate_source(count * block_lines // 6) # a block has 6 top level statements
+
+
+def generate_expression_length(operands: int) -> str:
+    """
+    a few declarations whose expressions have the given amount of operands,
+    the operands are paired up in parentheses so the trees aren't only left leaning
+    """
+    lines = ["naj x = 7", "naj y = 3"]
+    for statement in range(32):
+        terms = [("x", "y", str(operand % 97 + 1))[operand % 3] for operand in range(operands)]
+        operators = [binary_operators[(index + statement) % len(binary_operators)] for index in range(operands)]
+        groups = [f"({terms[index]} {operators[index]} {terms[index + 1]})" if index + 1 < operands else terms[index]
+                  for index in range(0, operands, 2)]
+        expression = groups[0]
+        for index, group in enumerate(groups[1:]):
+            expression += f" {operators[-1 - index]} {group}"
+        lines.append(f"naj e{statement} = {expression}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_nesting_depth(depth: int) -> str:
+    """
+    kec, kim and furt scopes nested into each other depth times, repeated a few times
+    """
+    lines = []
+    for repetition in range(4):
+        lines.append(f"naj v{repetition} = 20")
+        for level in range(depth):
+            indent = "    " * level
+            kind = level % 3
+            if kind == 0:
+                lines.append(f"{indent}kec (v{repetition} > {level % 7}) {{")
+            elif kind == 1:
+                lines.append(f"{indent}kim (v{repetition} > 10) {{")
+                lines.append(f"{indent}    v{repetition} = v{repetition} - 1")
+            else:
+                lines.append(f"{indent}furt(naj i{repetition}_{level} = 0, i{repetition}_{level} < 2, i{repetition}_{level}++){{")
+        lines.append("    " * depth + f"hutor(v{repetition} + 40)")
+        for level in reversed(range(depth)):
+            lines.append("    " * level + "}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_variable_count(count: int) -> str:
+    """
+    count variables that are declared one after another and read back, every one depends on earlier ones
+    """
+    lines = ["naj v0 = 1"]
+    for index in range(1, count):
+        lines.append(f"naj v{index} = v{index - 1} + v{index // 2} % 7")
+    for index in range(0, count, max(1, count // 16)):
+        lines.append(f"v{index} = v{count - 1 - index} - 1")
+    return "\n".join(lines) + "\n"
+
+
+# name of an axis -> the generator of its programs and the sizes measured by default
+axes: dict[str, tuple[callable, tuple[int, ...]]] = {
+    "statements": (generate_statements, (500, 5000, 20000)),
+    "expression_length": (generate_expression_length, (8, 64, 256)),
+    "nesting_depth": (generate_nesting_depth, (4, 16, 48)),
+    "variable_count": (generate_variable_count, (16, 256, 2048)),
+}
@@ -0,0 +1,76 @@
+"""
+times compiled hadzik programs instead of the compiler, every program is built with the native backend and run repeat times
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+src_directory: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+number_counts: tuple[int, ...] = (10000, 100000, 1000000)
+
+# prints one number a line, the numbers have from 1 to 10 digits and both signs
+print_numbers_source: str = """furt(naj i = 0, i < {count}, i++){{
+    naj n = i * i * 7919 - {count} * 13
+    {print}
+    hutor('\\n')
+}}
+"""
+hutorcislo_print: str = "hutorcislo(n)"
+# what printing a number takes without hutorcislo: find the highest power of ten and divide it out digit by digit
+naive_print: str = """kec(n < 0){
+        hutor('-')
+        n = 0 - n
+    }
+    naj p = 1
+    kim(p <= n / 10){
+        p = p * 10
+    }
+    kim(p > 0){
+        hutor(48 + n / p % 10)
+        p = p / 10
+    }"""
+
+
+def compile_native(source: str, directory: str, name: str, flags: tuple[str, ...] = ()) -> str:
+    """
+    writes the source to the directory, builds it with hdz.py --native and returns the path of the executable
+    """
+    path = os.path.join(directory, name + ".hdz")
+    with open(path, "w") as f:
+        f.write(source)
+    subprocess.run([sys.executable, "hdz.py", path, "--native", "--no-cache", *flags], capture_output=True, check=True, cwd=src_directory)
+    return os.path.join(directory, name)
+
+
+def time_program(path: str, repeat: int) -> float:
+    """
+    the best wall time of repeat runs, the output goes to /dev/null so a pipe doesn't slow the program down
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([path], stdout=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_print_numbers(repeat: int, quick: bool = False, flags: tuple[str, ...] = ("-O2",)) -> int:
+    """
+    compares hutorcislo with printing the digits in a hadzik loop, returns 1 when the two programs printed something else
+    """
+    print(f"printing numbers (best of {repeat}, {' '.join(flags)})")
+    print(f"    {'count':>9} {'hutorcislo ms':>14} {'naive loop ms':>14} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in number_counts[:2] if quick else number_counts:
+            fast = compile_native(print_numbers_source.format(count=count, print=hutorcislo_print), directory, "hutorcislo", flags)
+            naive = compile_native(print_numbers_source.format(count=count, print=naive_print), directory, "naive", flags)
+            if subprocess.run([fast], capture_output=True).stdout != subprocess.run([naive], capture_output=True).stdout:
+                print(f"    {count:>9} the programs printed different numbers")
+                return 1
+            fast_seconds = time_program(fast, repeat)
+            naive_seconds = time_program(naive, repeat)
+            print(f"    {count:>9} {fast_seconds * 1000:>14.2f} {naive_seconds * 1000:>14.2f} {naive_seconds / fast_seconds:>7.1f}x")
+    return 0
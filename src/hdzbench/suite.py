@@ -0,0 +1,43 @@
+"""
+runs the benchmark programs of every axis and collects the results
+"""
+import os
+import io
+import sys
+import json
+import platform
+import tarfile
+import tempfile
+import subprocess
+
+from hdzbench.programs import axes
+from hdzbench.measure import measure_phases
+
+src_directory: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_suite(axis_names: list[str], repeat: int, quick: bool = False) -> dict:
+    """
+    measures every size of every axis, quick only measures the two smallest sizes
+    """
+    cases = {}
+    for axis in axis_names:
+        generate, sizes = axes[axis]
+        for size in sizes[:2] if quick else sizes:
+            cases[f"{axis}/{size}"] = {"axis": axis, "size": size, **measure_phases(generate(size), repeat)}
+    return {"python": platform.python_version(), "repeat": repeat, "cases": cases}
+
+
+def run_at_revision(revision: str, args: list[str]) -> dict:
+    """
+    runs this benchmark in a child process against the compiler sources of a git revision,
+    args are the suite arguments (axes, repeat, quick) passed on to the child
+    """
+    archive = subprocess.run(["git", "archive", revision + ":src"], capture_output=True, check=True,
+                             cwd=os.path.dirname(src_directory)).stdout
+    with tempfile.TemporaryDirectory() as directory:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(directory)
+        child = subprocess.run([sys.executable, "-m", "hdzbench", "--json", "--compiler-dir", directory, *args],
+                               capture_output=True, check=True, text=True, cwd=src_directory)
+    return json.loads(child.stdout)
@@ -0,0 +1,100 @@
+import os
+import glob
+import shutil
+import hashlib
+import tempfile
+
+
+class BuildCache:
+    """
+    a content addressed cache of compiled programs, an entry is a directory named after the hash of
+    the source, the compiler sources and the flags that change the output, it holds the .asm, the .o and the executable,
+    entries are evicted least recently used first (by the modification time of their directory) once the cache is over max_size
+    """
+    directory: str = os.environ.get("HDZ_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "hdz"))
+    max_size: int = 256 * 1024 * 1024 # in bytes
+    artifacts: tuple[str, ...] = (".asm", ".o", "") # suffixes of the stored files, the executable has none
+    neutral_flags: tuple[str, ...] = ("--no-cache",) # flags that don't change the compiled program
+
+    compiler_hash: str | None = None
+
+    def __init__(self, directory: str | None = None, max_size: int | None = None, artifacts: tuple[str, ...] | None = None) -> None:
+        self.directory: str = directory if directory is not None else self.directory
+        self.max_size: int = max_size if max_size is not None else self.max_size
+        self.artifacts: tuple[str, ...] = artifacts if artifacts is not None else self.artifacts
+
+    @classmethod
+    def get_compiler_hash(cls) -> str:
+        """
+        hashes the sources of the compiler so any change to the compiler invalidates every entry
+        """
+        if cls.compiler_hash is None:
+            digest = hashlib.sha256()
+            for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "hdz*.py"))):
+                digest.update(os.path.basename(path).encode() + b"\0")
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+            cls.compiler_hash = digest.hexdigest()
+        return cls.compiler_hash
+
+    def key(self, source: str, flags: list[str]) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.get_compiler_hash().encode() + b"\0")
+        digest.update("\0".join(sorted(flag for flag in flags if not flag.startswith(self.neutral_flags))).encode() + b"\0")
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def restore(self, key: str, output_base: str) -> bool:
+        """
+        copies the cached files of the key next to the source as output_base.asm, output_base.o and output_base,
+        returns False if the key isn't cached
+        """
+        entry = self.entry_path(key)
+        if not all(os.path.isfile(os.path.join(entry, "program" + suffix)) for suffix in self.artifacts):
+            return False
+        for suffix in self.artifacts:
+            shutil.copy2(os.path.join(entry, "program" + suffix), output_base + suffix)
+        os.utime(entry) # marks the entry as recently used
+        return True
+
+    def store(self, key: str, output_base: str) -> None:
+        """
+        copies the compiled files into the cache, the entry is built in a temporary directory and renamed into place
+        so a cut off write or another compiler running at the same time never leaves a half written entry
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.directory)
+        try:
+            for suffix in self.artifacts:
+                shutil.copy2(output_base + suffix, os.path.join(staging, "program" + suffix))
+            os.replace(staging, self.entry_path(key))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True) # the entry already exists or a file is missing, either way nothing gets cached
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        removes the least recently used entries until the cache fits into max_size
+        """
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+            except OSError:
+                continue # removed by another compile that's evicting at the same time
+            entries.append((os.path.getmtime(entry), size, entry))
+            total_size += size
+        entries.sort()
+        for _, size, entry in entries:
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
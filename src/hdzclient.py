@@ -0,0 +1,52 @@
+"""
+thin client of the compile server, takes the same arguments as hdz.py:
+
+    python hdzclient.py file.hdz [flags]
+
+sends them to the server started by hdzserver.py and prints what the compiler printed,
+when no server is running (or the compiler changed since it started) it compiles in this process like hdz.py,
+only the standard library modules needed to talk to the server are imported before that
+"""
+import os
+import sys
+import json
+import socket
+
+
+def socket_path() -> str:
+    return os.environ.get("HDZ_SOCKET", f"/tmp/hdz-{os.getuid()}.sock")
+
+
+def request_compile(request: dict, path: str) -> dict | None:
+    """
+    sends one request to the server and returns its response, returns None if theres no server to answer it
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(path)
+            connection.sendall(json.dumps(request).encode() + b"\n")
+            connection.shutdown(socket.SHUT_WR)
+            response = b""
+            while chunk := connection.recv(1 << 16):
+                response += chunk
+    except OSError: # no socket, nobody listening on it or the server went away
+        return None
+    if not response:
+        return None
+    response = json.loads(response)
+    if response.get("stale"): # the server shut down because its compiler is out of date
+        return None
+    return response
+
+
+def main(args: list[str]) -> int:
+    response = request_compile({"cwd": os.getcwd(), "args": args}, socket_path())
+    if response is None:
+        import hdz
+        return hdz.main(args)
+    sys.stdout.write(response["output"])
+    return response["returncode"]
+
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -1,25 +1,97 @@
+from bisect import bisect_right
+
+
+class LineIndex:
+    """
+    offsets of the first character of every line in a file,
+    built once on first use and shared by every stage so any offset maps to a line and column with a binary search
+    """
+    def __init__(self, file_content: str) -> None:
+        self.file_content: str = file_content
+        self.line_starts: list[int] | None = None
+
+    def get_line_starts(self) -> list[int]:
+        if self.line_starts is None:
+            line_starts: list[int] = [0]
+            newline = self.file_content.find("\n")
+            while newline != -1:
+                line_starts.append(newline + 1)
+                newline = self.file_content.find("\n", newline + 1)
+            self.line_starts = line_starts
+        return self.line_starts
+
+    def line_of(self, offset: int) -> int:
+        """
+        returns the line number (starting from 1) of the character at the offset
+        """
+        return bisect_right(self.get_line_starts(), offset)
+
+    def position_of(self, offset: int) -> tuple[int, int]:
+        """
+        returns the line and column number (both starting from 1) of the character at the offset
+        """
+        line = self.line_of(offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+    def line_text(self, line: int) -> str:
+        """
+        returns the content of the line without the newline character
+        """
+        line_starts = self.get_line_starts()
+        line = min(max(line, 1), len(line_starts))
+        end = line_starts[line] - 1 if line < len(line_starts) else len(self.file_content)
+        return self.file_content[line_starts[line - 1]:end]
+
+
+class CompileError(Exception):
+    """
+    an error in the compiled program, the message is the whole report (the line, a caret and the error),
+    line and column are where it happened (column is -1 if the error is about the whole line)
+    """
+    def __init__(self, message: str, line: int, column: int) -> None:
+        super().__init__(message)
+        self.message: str = message
+        self.line: int = line
+        self.column: int = column
+
 
 class ErrorHandler:
     dialect_errors: bool = False
     translate: dict[str, str] = {"Syntax": "NapisanePlano", "Value": "HodnotaPlana", "Generator": "VyrobaPlana", "expected": "tu malo buc toto", "Parsing": "DzelenePlane"}
-    def __init__(self, file: str) -> None:
+    def __init__(self, file: str, line_index: LineIndex | None = None) -> None:
         self.file_content: str = file
+        self.line_index: LineIndex = line_index if line_index is not None else LineIndex(file)
         self.line_number: int = 1
         self.column_number: int = 0
 
+    def move_to(self, offset: int) -> None:
+        """
+        sets the line and column number to the position of the offset in the file
+        """
+        self.line_number, self.column_number = self.line_index.position_of(offset)
+
     def find_line(self) -> str:
-        file_content = self.file_content.splitlines()
-        return file_content[self.line_number - 1] if self.line_number - 1 < len(file_content) else file_content[-1]
+        return self.line_index.line_text(self.line_number)
+
+    def raise_error_at(self, token, type: str, details: str) -> None:
+        """
+        raises an error pointing at the start of the token in the source
+        """
+        self.move_to(token.start)
+        self.raise_error(type, details)
 
     def raise_error(self, type: str, details: str) -> None:
+        """
+        raises a CompileError with the wrong line, a caret under the error and the message,
+        the caller at the top (hdz.py or the compile server) prints it
+        """
         wrong_line = self.find_line()
-        print(wrong_line)
-        if self.column_number != -1:
-            print("^".rjust(self.column_number))
-            print(f"{type}Error: (line {self.line_number} column {self.column_number}) {details}" if
-                    not self.dialect_errors else f"Joj bysťu {self.translate[type]}: (lajna {self.line_number} stlupik {self.column_number}) {details}")
+        has_column = self.column_number != -1
+        if not self.dialect_errors:
+            position = f"line {self.line_number}" + (f" column {self.column_number}" if has_column else "")
+            error = f"{type}Error: ({position}) {details}"
         else:
-            print("^" * len(wrong_line))
-            print(f"{type}Error: (line {self.line_number}) {details}" if
-                    not self.dialect_errors else f"Joj bysťu {self.translate[type]}: (lajna {self.line_number}) {details}")
-        exit(1)
+            position = f"lajna {self.line_number}" + (f" stlupik {self.column_number}" if has_column else "")
+            error = f"Joj bysťu {self.translate.get(type, type)}: ({position}) {details}"
+        caret = "^".rjust(self.column_number) if has_column else "^" * len(wrong_line)
+        raise CompileError(f"{wrong_line}\n{caret}\n{error}", self.line_number, self.column_number)
@@ -0,0 +1,402 @@
+from typing import Callable, Iterator
+import hdzparser as prs
+import hdztokentypes as tt
+from hdzlexer import Token
+
+
+int_min: int = -(1 << 63)
+int_max: int = (1 << 63) - 1
+
+
+def wrap(value: int) -> int:
+    """
+    cuts a python int down to a 64 bit signed integer, like the registers do
+    """
+    value &= (1 << 64) - 1
+    return value - (1 << 64) if value > int_max else value
+
+
+def divide(lhs: int, rhs: int) -> int:
+    """
+    the quotient of idiv, rounded towards zero
+    """
+    quotient = abs(lhs) // abs(rhs)
+    return quotient if (lhs < 0) == (rhs < 0) else -quotient
+
+
+def remainder(lhs: int, rhs: int) -> int:
+    """
+    the remainder of idiv, it has the sign of the lhs
+    """
+    return lhs - divide(lhs, rhs) * rhs
+
+
+def traps(lhs: int, rhs: int) -> bool:
+    """
+    idiv raises a division error when dividing by zero and when the quotient doesn't fit (the smallest number divided by -1)
+    """
+    return rhs == 0 or (lhs == int_min and rhs == -1)
+
+
+# how every arithmetic node is evaluated at compile time
+arithmetic: dict[type, callable] = {
+    prs.NodeBinExprAdd: lambda lhs, rhs: wrap(lhs + rhs),
+    prs.NodeBinExprSub: lambda lhs, rhs: wrap(lhs - rhs),
+    prs.NodeBinExprMulti: lambda lhs, rhs: wrap(lhs * rhs),
+    prs.NodeBinExprDiv: divide,
+    prs.NodeBinExprMod: remainder,
+}
+
+comparisons: list[Callable[[int, int], bool] | None] = [None] * tt.token_type_count # indexed by the token type of the comparison
+comparisons[tt.is_equal] = lambda lhs, rhs: lhs == rhs
+comparisons[tt.is_not_equal] = lambda lhs, rhs: lhs != rhs
+comparisons[tt.larger_than] = lambda lhs, rhs: lhs > rhs
+comparisons[tt.less_than] = lambda lhs, rhs: lhs < rhs
+comparisons[tt.larger_than_or_eq] = lambda lhs, rhs: lhs >= rhs
+comparisons[tt.less_than_or_eq] = lambda lhs, rhs: lhs <= rhs
+
+# the comparison that gives the same result with its sides swapped
+mirrored_comparisons: dict[int, int] = {
+    tt.is_equal: tt.is_equal, tt.is_not_equal: tt.is_not_equal,
+    tt.larger_than: tt.less_than, tt.less_than: tt.larger_than,
+    tt.larger_than_or_eq: tt.less_than_or_eq, tt.less_than_or_eq: tt.larger_than_or_eq,
+}
+
+
+def first_token(expression: prs.NodeExpr) -> Token:
+    """
+    the leftmost token of an expression, new nodes take their position from it so errors still point into the source
+    """
+    node = expression.var
+    while True:
+        if isinstance(node, prs.NodeExpr):
+            node = node.var
+        elif isinstance(node, prs.NodeTerm):
+            node = node.var
+        elif isinstance(node, (prs.NodeBinExpr, prs.NodeLogicExpr)):
+            node = node.var.lhs
+        elif isinstance(node, prs.NodeTermParen):
+            node = node.expr
+        elif isinstance(node, prs.NodeTermNot):
+            node = node.term
+        else:
+            return node.int_lit if isinstance(node, prs.NodeTermInt) else node.ident if isinstance(node, prs.NodeTermIdent) else node.bool
+
+
+def int_node(value: int, position: Token) -> prs.NodeExpr:
+    return prs.NodeExpr(prs.NodeTerm(prs.NodeTermInt(Token(tt.int_lit, str(value), position.start, position.end))))
+
+
+def bool_node(value: bool, position: Token) -> prs.NodeExpr:
+    return prs.NodeExpr(prs.NodeTerm(prs.NodeTermBool(Token(tt.true if value else tt.false, int(value), position.start, position.end))))
+
+
+def constant_value(expression: prs.NodeExpr) -> int | None:
+    """
+    the value of an expression that is a single literal, None if its anything else or doesn't fit into 64 bits
+    """
+    term = expression.var
+    if not isinstance(term, prs.NodeTerm):
+        return None
+    if isinstance(term.var, prs.NodeTermInt):
+        value = int(term.var.int_lit.value)
+        value = -value if term.negative else value
+        return value if int_min <= value <= int_max else None
+    if isinstance(term.var, prs.NodeTermBool):
+        return int(term.var.bool.value) # the generator ignores a minus in front of a bool
+    return None
+
+
+def is_boolean(expression: prs.NodeExpr) -> bool:
+    """
+    if the expression always results in 0 or 1
+    """
+    node = expression.var
+    return isinstance(node, prs.NodeLogicExpr) or (isinstance(node, prs.NodeTerm) and isinstance(node.var, (prs.NodeTermBool, prs.NodeTermNot)))
+
+
+class ConstantFolder:
+    """
+    evaluates the parts of expressions that only use literals at compile time with the semantics of the generated code
+    (64 bit wrap around, idiv truncation, the remainder has the sign of the lhs), and applies algebraic identities
+    (x + 0, x * 1, -(-x), constants gathered at the end of + and * chains, ...),
+    a subexpression is only dropped (like in x * 0) when it can't fail at runtime: every variable in it is declared
+    and it doesn't divide by anything that could be zero, so errors and division crashes stay where they were,
+    divisions that would crash are left for the runtime too
+    """
+    def __init__(self) -> None:
+        self.scopes: list[set[str]] = [set()] # names declared in every scope the folder is in
+        self.folded: int = 0 # how many nodes were replaced
+
+        self.statement_folders: dict[type, callable] = {
+            prs.NodeStmtExit: self.fold_exit,
+            prs.NodeStmtLet: self.fold_let,
+            prs.NodeScope: self.fold_scope,
+            prs.NodeStmtIf: self.fold_if_statement,
+            prs.NodeStmtReassign: self.fold_reassign,
+            prs.NodeStmtWhile: self.fold_while,
+            prs.NodeStmtDoWhile: self.fold_do_while,
+            prs.NodeStmtFor: self.fold_for,
+            prs.NodeStmtPrint: self.fold_print,
+            prs.NodeStmtBreak: lambda statement: None,
+        }
+        self.expression_folders: dict[type, callable] = {
+            prs.NodeTerm: self.fold_term,
+            prs.NodeBinExpr: self.fold_binary_expression,
+            prs.NodeLogicExpr: self.fold_logical_expression,
+        }
+
+    def fold_program(self, program: prs.NodeProgram):
+        """
+        folds a whole program in place, a program that hands out its statements one at a time
+        (like the one of an AstArena) is folded statement by statement as the generator asks for them
+        """
+        if isinstance(program, prs.NodeProgram):
+            for stmt in program.stmts:
+                self.fold_statement(stmt)
+            return program
+        return FoldedProgram(self, program)
+
+    def fold_statement(self, statement: prs.NodeStmt) -> prs.NodeStmt:
+        self.statement_folders[type(statement.stmt_var)](statement.stmt_var)
+        return statement
+
+    def fold_statements(self, statements: list[prs.NodeStmt]) -> None:
+        self.scopes.append(set())
+        for stmt in statements:
+            self.fold_statement(stmt)
+        self.scopes.pop()
+
+    def fold_exit(self, exit_stmt: prs.NodeStmtExit) -> None:
+        exit_stmt.expr = self.fold_expression(exit_stmt.expr)
+
+    def fold_let(self, let_stmt: prs.NodeStmtLet) -> None:
+        # a naj of a logical expression and a bul of an arithmetic one are errors, folding could hide them
+        invalid = prs.NodeLogicExpr if let_stmt.type_.type == tt.let else prs.NodeBinExpr
+        if not isinstance(let_stmt.expr.var, invalid):
+            let_stmt.expr = self.fold_expression(let_stmt.expr)
+        self.scopes[-1].add(let_stmt.ident.value)
+
+    def fold_scope(self, scope: prs.NodeScope) -> None:
+        self.fold_statements(scope.stmts)
+
+    def fold_if_statement(self, if_stmt: prs.NodeStmtIf) -> None:
+        if_stmt.expr = self.fold_expression(if_stmt.expr)
+        self.fold_scope(if_stmt.scope)
+        pred = if_stmt.ifpred
+        while pred is not None:
+            if isinstance(pred.var, prs.NodeIfPredElif):
+                pred.var.expr = self.fold_expression(pred.var.expr)
+                self.fold_scope(pred.var.scope)
+                pred = pred.var.pred
+            else:
+                self.fold_scope(pred.var.scope)
+                pred = None
+
+    def fold_reassign(self, reassign_stmt: prs.NodeStmtReassign) -> None:
+        if isinstance(reassign_stmt.var, prs.NodeStmtReassignEq):
+            reassign_stmt.var.expr = self.fold_expression(reassign_stmt.var.expr)
+
+    def fold_while(self, while_stmt: prs.NodeStmtWhile) -> None:
+        while_stmt.expr = self.fold_expression(while_stmt.expr)
+        self.fold_scope(while_stmt.scope)
+
+    def fold_do_while(self, do_while_stmt: prs.NodeStmtDoWhile) -> None:
+        self.fold_scope(do_while_stmt.scope)
+        do_while_stmt.expr = self.fold_expression(do_while_stmt.expr)
+
+    def fold_for(self, for_stmt: prs.NodeStmtFor) -> None:
+        self.scopes.append(set()) # the loop variable only exists inside the loop
+        self.fold_let(for_stmt.ident_def)
+        # the generator needs the condition to stay a comparison, only its sides are folded
+        for_stmt.condition.lhs = self.fold_expression(for_stmt.condition.lhs)
+        for_stmt.condition.rhs = self.fold_expression(for_stmt.condition.rhs)
+        self.fold_reassign(for_stmt.ident_assign)
+        self.fold_scope(for_stmt.scope)
+        self.scopes.pop()
+
+    def fold_print(self, print_stmt: prs.NodeStmtPrint) -> None:
+        if isinstance(print_stmt.content, prs.NodeExpr):
+            print_stmt.content = self.fold_expression(print_stmt.content)
+
+    def is_declared(self, name: str) -> bool:
+        return any(name in scope for scope in self.scopes)
+
+    def is_pure(self, expression: prs.NodeExpr | prs.NodeTerm) -> bool:
+        """
+        if evaluating the expression can't fail, so leaving it out doesn't change what the program does
+        """
+        node = expression.var
+        if isinstance(expression, prs.NodeTerm):
+            if isinstance(node, prs.NodeTermIdent):
+                return self.is_declared(node.ident.value)
+            if isinstance(node, prs.NodeTermParen):
+                return self.is_pure(node.expr)
+            if isinstance(node, prs.NodeTermNot):
+                return self.is_pure(node.term)
+            return True
+        if isinstance(node, prs.NodeTerm):
+            return self.is_pure(node)
+        operation = node.var
+        if type(operation) in (prs.NodeBinExprDiv, prs.NodeBinExprMod) and constant_value(operation.rhs) in (None, 0, -1):
+            return False
+        return self.is_pure(operation.lhs) and self.is_pure(operation.rhs)
+
+    def fold_expression(self, expression: prs.NodeExpr) -> prs.NodeExpr:
+        """
+        returns the folded expression, which can be a new node or the given one changed in place
+        """
+        return self.expression_folders[type(expression.var)](expression)
+
+    def negated(self, expression: prs.NodeExpr) -> prs.NodeExpr:
+        """
+        the expression with its sign flipped, a minus in front of a number, a variable or parentheses flips their sign
+        """
+        value = constant_value(expression)
+        if value is not None and isinstance(expression.var.var, prs.NodeTermInt):
+            return int_node(wrap(-value), first_token(expression))
+        term = expression.var
+        if isinstance(term, prs.NodeTerm) and isinstance(term.var, (prs.NodeTermIdent, prs.NodeTermParen)):
+            return prs.NodeExpr(prs.NodeTerm(term.var, not term.negative))
+        return prs.NodeExpr(prs.NodeTerm(prs.NodeTermParen(expression), True))
+
+    def fold_term(self, expression: prs.NodeExpr) -> prs.NodeExpr:
+        term: prs.NodeTerm = expression.var
+        node = term.var
+        if isinstance(node, prs.NodeTermParen):
+            inner = self.fold_expression(node.expr)
+            if not isinstance(inner.var, prs.NodeTerm):
+                node.expr = inner
+                return expression
+            self.folded += 1
+            return self.negated(inner) if term.negative else inner # parentheses around one term aren't needed, -(-x) is x
+        if isinstance(node, prs.NodeTermNot):
+            inner = self.fold_term(prs.NodeExpr(node.term))
+            value = constant_value(inner)
+            if value is not None:
+                self.folded += 1
+                return bool_node(value == 0, first_token(inner))
+            inner_node = inner.var.var
+            if isinstance(inner_node, prs.NodeTermNot) and is_boolean(prs.NodeExpr(inner_node.term)):
+                self.folded += 1
+                return prs.NodeExpr(inner_node.term) # ne ne x is x when x is already 0 or 1
+            node.term = inner.var
+            return expression
+        return expression
+
+    def fold_binary_expression(self, expression: prs.NodeExpr) -> prs.NodeExpr:
+        operation = expression.var.var
+        operation_type = type(operation)
+        operation.lhs = self.fold_expression(operation.lhs)
+        operation.rhs = self.fold_expression(operation.rhs)
+        lhs = constant_value(operation.lhs)
+        rhs = constant_value(operation.rhs)
+
+        if lhs is not None and rhs is not None:
+            if operation_type in (prs.NodeBinExprDiv, prs.NodeBinExprMod) and traps(lhs, rhs):
+                return expression # crashes at runtime like it always did
+            self.folded += 1
+            return int_node(arithmetic[operation_type](lhs, rhs), first_token(operation.lhs))
+
+        if operation_type is prs.NodeBinExprSub:
+            if rhs is not None: # x - c is x + -c so the constants of + and - chains can be gathered
+                operation = prs.NodeBinExprAdd(operation.lhs, int_node(wrap(-rhs), first_token(operation.rhs)))
+                operation_type = prs.NodeBinExprAdd
+                expression = prs.NodeExpr(prs.NodeBinExpr(operation))
+                rhs = wrap(-rhs)
+            elif lhs == 0:
+                self.folded += 1
+                return self.negated(operation.rhs)
+            elif self.same_variable(operation.lhs, operation.rhs):
+                self.folded += 1
+                return int_node(0, first_token(operation.lhs))
+
+        if operation_type in (prs.NodeBinExprAdd, prs.NodeBinExprMulti):
+            if lhs is not None: # constants go to the right where they can be an immediate operand
+                operation.lhs, operation.rhs = operation.rhs, operation.lhs
+                lhs, rhs = rhs, lhs
+            if rhs is not None:
+                inner = operation.lhs.var
+                if isinstance(inner, prs.NodeBinExpr) and type(inner.var) is operation_type and constant_value(inner.var.rhs) is not None:
+                    # (x + a) + b is x + (a + b), (x * a) * b is x * (a * b), both hold with wrap around
+                    rhs = arithmetic[operation_type](constant_value(inner.var.rhs), rhs)
+                    operation.lhs = inner.var.lhs
+                    operation.rhs = int_node(rhs, first_token(inner.var.rhs))
+                    self.folded += 1
+                identity = 0 if operation_type is prs.NodeBinExprAdd else 1
+                if rhs == identity:
+                    self.folded += 1
+                    return operation.lhs
+                if operation_type is prs.NodeBinExprMulti and rhs == -1:
+                    self.folded += 1
+                    return self.negated(operation.lhs)
+                if operation_type is prs.NodeBinExprMulti and rhs == 0 and self.is_pure(operation.lhs):
+                    self.folded += 1
+                    return int_node(0, first_token(operation.lhs))
+            return expression
+
+        if rhs == 1 and operation_type is prs.NodeBinExprDiv:
+            self.folded += 1
+            return operation.lhs
+        if rhs == 1 and self.is_pure(operation.lhs): # x % 1
+            self.folded += 1
+            return int_node(0, first_token(operation.lhs))
+        return expression
+
+    def fold_logical_expression(self, expression: prs.NodeExpr) -> prs.NodeExpr:
+        operation = expression.var.var
+        operation.lhs = self.fold_expression(operation.lhs)
+        operation.rhs = self.fold_expression(operation.rhs)
+        lhs = constant_value(operation.lhs)
+        rhs = constant_value(operation.rhs)
+
+        if isinstance(operation, prs.NodeBinExprComp):
+            if lhs is not None and rhs is not None:
+                self.folded += 1
+                return bool_node(comparisons[operation.comp_sign.type](lhs, rhs), first_token(operation.lhs))
+            if lhs is not None and operation.comp_sign.type in mirrored_comparisons: # the constant goes to the right
+                sign = operation.comp_sign
+                operation.comp_sign = Token(mirrored_comparisons[sign.type], sign.value, sign.start, sign.end)
+                operation.lhs, operation.rhs = operation.rhs, operation.lhs
+            return expression
+
+        is_and = operation.logical_operator.type == tt.and_
+        if lhs is not None and rhs is not None:
+            self.folded += 1
+            return bool_node((lhs != 0 and rhs != 0) if is_and else (lhs != 0 or rhs != 0), first_token(operation.lhs))
+        constant, other = (lhs, operation.rhs) if lhs is not None else (rhs, operation.lhs)
+        if constant is None:
+            return expression
+        if (constant != 0) != is_and: # klamstvo aj x, pravda abo x
+            if self.is_pure(other):
+                self.folded += 1
+                return bool_node(not is_and, first_token(operation.lhs))
+        elif is_boolean(other): # pravda aj x, klamstvo abo x
+            self.folded += 1
+            return other
+        return expression
+
+    def same_variable(self, lhs: prs.NodeExpr, rhs: prs.NodeExpr) -> bool:
+        """
+        if both sides are the same declared variable with the same sign, so x - x is 0
+        """
+        if not isinstance(lhs.var, prs.NodeTerm) or not isinstance(rhs.var, prs.NodeTerm):
+            return False
+        lhs_term, rhs_term = lhs.var, rhs.var
+        return (isinstance(lhs_term.var, prs.NodeTermIdent) and isinstance(rhs_term.var, prs.NodeTermIdent)
+                and lhs_term.var.ident.value == rhs_term.var.ident.value and lhs_term.negative == rhs_term.negative
+                and self.is_declared(lhs_term.var.ident.value))
+
+
+class FoldedProgram:
+    """
+    a program whose statements are folded one at a time as they are taken from the program under it
+    """
+    def __init__(self, folder: ConstantFolder, program) -> None:
+        self.folder: ConstantFolder = folder
+        self.program = program
+
+    @property
+    def stmts(self) -> Iterator[prs.NodeStmt]:
+        for stmt in self.program.stmts:
+            yield self.folder.fold_statement(stmt)
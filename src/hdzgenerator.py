@@ -1,486 +1,646 @@
-from hdzerrors import ErrorHandler
-import hdzparser as prs
-from collections import OrderedDict
-import hdztokentypes as tt
-
-
-class Generator(ErrorHandler):
-    def __init__(self, program: prs.NodeProgram, file_content: str) -> None:
-        super().__init__(file_content)
-        self.main_program: prs.NodeProgram = program
-        self.output: list = []
-
-        self.column_number = -1
-        
-        self.stack_size: int = 0 # uses whole 8 bytes (half of a word) as a unit
-        self.stack_item_sizes: list[int] = [] # same as above
-
-        self.variables: OrderedDict[str, tuple[int, str, int]] = OrderedDict() #tuples content is location and word size and size in bytes
-        self.scopes: list[int] = []
-        
-        self.label_count: int = 0
-        self.loop_end_labels: list[str] = []
-        
-        self.data_section_index: int = 1
-        self.bss_section_index: int = 2
-
-        self.registers_64bit: tuple[str] = ("rax", "rbx", "rcx", "rdx", "rsi", "rdi", "rsp", "rbp", "r8", "r9", "r10", "r11", "r12", "r13", "r14", "r15")
-        self.registers_16bit: tuple[str] = ("ax", "bx", "cx", "dx", "si", "di", "sp", "bp", "r8w", "r9w", "r10w", "r11w", "r12w", "r13w", "r14w", "r15w")
-    
-    def push(self, content: str):
+import hdzir as ir
+from collections import Counter
+from heapq import heappush, heappop
+from hdzregalloc import RegisterAllocator
+from hdztrace import Trace
+from typing import TextIO
+
+
+# instruction of every arithmetic opcode that works on two registers (or a register and an immediate / memory), the result replaces the lhs
+binary_instructions: dict[str, str] = {
+    "add": "add",
+    "sub": "sub",
+    "mul": "imul", # the low 64 bits are the same as with mul and rax and rdx stay free
+}
+# division goes through rax and rdx, idiv leaves the quotient in rax and the remainder in rdx,
+# cqo sign extends the lhs into rdx first so negative numbers get divided correctly
+#NOTE: idiv is used because div only works with unsigned numbers
+division_results: dict[str, str] = {
+    "div": "rax",
+    "mod": "rdx",
+}
+# multipliers lea does in one instruction as [x + x*2], [x + x*4] and [x + x*8]
+lea_multipliers: dict[int, int] = {3: 2, 5: 4, 9: 8}
+# divisors that keep the plain idiv, 0 has to crash like before and the lhs -9223372036854775808 crashes with -1 too,
+# -9223372036854775808 itself has no magic number
+idiv_divisors: frozenset[int] = frozenset((0, -1, -(1 << 63)))
+# the condition code of every comparison opcode, used by setcc and jcc
+condition_codes: dict[str, str] = {"eq": "e", "ne": "ne", "lt": "l", "le": "le", "gt": "g", "ge": "ge"}
+inverted_condition_codes: dict[str, str] = {"e": "ne", "ne": "e", "l": "ge", "le": "g", "g": "le", "ge": "l"} # for jumping when its false
+logic_instructions: dict[str, str] = {"and": "and", "or": "or"} # combine the two setne bytes
+
+word_registers: dict[str, str] = {"rax": "ax", "rbx": "bx", "rcx": "cx", "rsi": "si", "rdi": "di", **{f"r{number}": f"r{number}w" for number in range(8, 16)}}
+byte_registers: dict[str, str] = {"rax": "al", "rbx": "bl", "rcx": "cl", "rsi": "sil", "rdi": "dil", **{f"r{number}": f"r{number}b" for number in range(8, 16)}}
+scratch_register: str = "r11" # holds constants that don't fit into an instruction, never holds a temp
+
+# hutor appends to a buffer in .bss instead of making a write syscall for every byte, output_flush writes it out
+# when its full and before every exit
+output_buffer_size: int = 4096
+output_flush: str = """output_flush:
+    push rdi
+    push rsi
+    push rdx
+    push rcx
+    push r11
+    mov rsi, output_buffer
+    mov rdx, QWORD [output_length]
+output_flush_loop:
+    test rdx, rdx
+    jle output_flush_done
+    mov rax, 1
+    mov rdi, 1
+    syscall
+    test rax, rax
+    jle output_flush_done
+    add rsi, rax
+    sub rdx, rax
+    jmp output_flush_loop
+output_flush_done:
+    mov QWORD [output_length], 0
+    pop r11
+    pop rcx
+    pop rdx
+    pop rsi
+    pop rdi
+    ret
+"""
+# hutorcislo: writes rax as a signed decimal number into the output buffer, only changes rax and rdx,
+# two digits at a time from the digit_pairs table in .data, dividing by 100 with a multiply by its reciprocal instead of idiv
+# ((n >> 2) * 0x28F5C28F5C28F5C3 >> 66 is n / 100 for every unsigned 64 bit n), the digits are written backwards into number_digits
+# and copied to the buffer as three qwords whatever their length, so both have 24 bytes of room behind them
+number_slack: int = 24
+output_number: str = f"""output_number:
+    push rcx
+    push rsi
+    push rdi
+    push r8
+    mov rcx, rax
+    mov rdi, number_digits + 24
+    test rax, rax
+    jns output_number_pairs
+    neg rax
+output_number_pairs:
+    cmp rax, 100
+    jb output_number_last
+    mov rsi, rax
+    shr rax, 2
+    mov rdx, {0x28F5C28F5C28F5C3}
+    mul rdx
+    shr rdx, 2
+    imul r8, rdx, 100
+    sub rsi, r8
+    movzx r8, WORD [digit_pairs + rsi*2]
+    sub rdi, 2
+    mov WORD [rdi], r8w
+    mov rax, rdx
+    jmp output_number_pairs
+output_number_last:
+    cmp rax, 10
+    jb output_number_digit
+    movzx r8, WORD [digit_pairs + rax*2]
+    sub rdi, 2
+    mov WORD [rdi], r8w
+    jmp output_number_sign
+output_number_digit:
+    add rax, 48
+    dec rdi
+    mov BYTE [rdi], al
+output_number_sign:
+    test rcx, rcx
+    jns output_number_copy
+    dec rdi
+    mov BYTE [rdi], 45
+output_number_copy:
+    mov rsi, number_digits + 24
+    sub rsi, rdi
+    mov rax, QWORD [output_length]
+    add rax, rsi
+    cmp rax, {output_buffer_size}
+    jb output_number_room
+    call output_flush
+output_number_room:
+    mov rcx, QWORD [output_length]
+    mov rax, QWORD [rdi]
+    mov QWORD [output_buffer + rcx], rax
+    mov rax, QWORD [rdi + 8]
+    mov QWORD [output_buffer + rcx + 8], rax
+    mov rax, QWORD [rdi + 16]
+    mov QWORD [output_buffer + rcx + 16], rax
+    add rcx, rsi
+    mov QWORD [output_length], rcx
+    pop r8
+    pop rdi
+    pop rsi
+    pop rcx
+    ret
+"""
+digit_pairs: str = "".join(f"{number:02}" for number in range(100))
+
+int32_min: int = -(1 << 31)
+int32_max: int = (1 << 31) - 1
+
+
+def power_of_two(value: int) -> int | None:
+    """
+    the exponent when the value is a positive power of two
+    """
+    return value.bit_length() - 1 if value > 0 and value & (value - 1) == 0 else None
+
+
+def division_magic(divisor: int) -> tuple[int, int]:
+    """
+    the multiplier and shift that divide a signed 64 bit number by the divisor with a multiply high instead of idiv,
+    the high 64 bits of lhs * multiplier shifted right by shift are the quotient rounded down, adding its sign bit rounds it towards 0
+    like idiv does (hackers delight, chapter 10), the divisor can't be 0, 1, -1 or a power of two
+    """
+    two_63 = 1 << 63
+    absolute = abs(divisor)
+    t = two_63 + (divisor < 0)
+    anc = t - 1 - t % absolute # the largest dividend whose remainder is absolute - 1
+    p = 63
+    q1, r1 = divmod(two_63, anc)
+    q2, r2 = divmod(two_63, absolute)
+    while True:
+        p += 1
+        q1, r1 = 2 * q1, 2 * r1
+        if r1 >= anc:
+            q1, r1 = q1 + 1, r1 - anc
+        q2, r2 = 2 * q2, 2 * r2
+        if r2 >= absolute:
+            q2, r2 = q2 + 1, r2 - absolute
+        delta = absolute - r2
+        if not (q1 < delta or q1 == delta and r1 == 0):
+            break
+    multiplier = (q2 + 1) & ((1 << 64) - 1)
+    if divisor < 0:
+        multiplier = -multiplier & ((1 << 64) - 1)
+    return multiplier - (1 << 64) if multiplier >= two_63 else multiplier, p - 64
+
+
+class StreamOutput:
+    """
+    an output sink that writes the assembly straight to a stream instead of keeping it in a list,
+    has the same append method as a list so the generator doesn't care which one it gets
+    """
+    def __init__(self, stream: TextIO) -> None:
+        self.stream: TextIO = stream
+        self.append = stream.write
+
+
+class TeeOutput:
+    """
+    an output sink that passes the assembly on to several other sinks, like a file and the native assembler
+    """
+    def __init__(self, *outputs) -> None:
+        self.outputs: tuple = outputs
+
+    def append(self, text: str) -> None:
+        for output in self.outputs:
+            output.append(text)
+
+
+def is_memory(operand: str) -> bool:
+    return operand.endswith("]")
+
+
+class Generator:
+    """
+    turns the ir into nasm assembly: temps get registers from the register allocator (or spill slots),
+    every slot gets a fixed place below rbp in the frame that is reserved once at the start, so rsp never moves and leaving a scope costs nothing,
+    rax and rdx are used for division and for values that are in memory, r11 for constants that don't fit into an instruction
+    """
+    def __init__(self, function: ir.Function, output: list | StreamOutput | TeeOutput | None = None) -> None:
+        self.function: ir.Function = function
+        self.output: list | StreamOutput | TeeOutput = output if output is not None else [] # anything with an append method that takes strings
+
+        self.locations: dict[ir.Temp, str] = {} # register or memory operand of every temp
+        self.slot_offsets: dict[ir.Slot, int] = {}
+        self.frame_size: int = 0
+        self.spill_count: int = 0
+        self.buffered: bool = False # the program prints, so it has the output buffer and flushes it before exiting
+        self.print_count: int = 0 # numbers the labels that skip the flush
+        self.nonnegative: set[ir.Temp] = set() # temps a division by a power of two can shift and and without fixing up the sign
+        self.flag_conditions: dict[ir.Temp, str] = {} # comparisons only the branch right after them uses, it jumps on their flags so they are never set
+        self.next_block: ir.Block | None = None # the block laid out after the one being generated, jumps to it are left out
+
+        # generator of every opcode, looked up by the opcode so no if chains are walked
+        self.instruction_generators: dict[str, callable] = {
+            "add": self.generate_arithmetic,
+            "sub": self.generate_arithmetic,
+            "mul": self.generate_arithmetic,
+            "div": self.generate_division,
+            "mod": self.generate_division,
+            "neg": self.generate_negation,
+            "and": self.generate_logic,
+            "or": self.generate_logic,
+            "not": self.generate_not,
+            "copy": self.generate_copy,
+            "load": self.generate_load,
+            "store": self.generate_store,
+            "inc": self.generate_step,
+            "dec": self.generate_step,
+            "print": self.generate_print,
+            "print_number": self.generate_print_number,
+            "jump": self.generate_jump,
+            "branch": self.generate_branch,
+            "exit": self.generate_exit,
+            **{opcode: self.generate_comparison for opcode in condition_codes},
+        }
+
+    def layout_frame(self) -> None:
         """
-        adds a push instruction to the output and updates the stack size 
+        gives every slot an aligned offset below rbp, the naj slots come first and the bul slots after them,
+        a slot whose scope has ended gives its place to the slots created after it, so variables of scopes that don't overlap share places
         """
-        #NOTE: size in bytes
-        if content in self.registers_64bit or content.startswith("QWORD"):
-            size = 8
-        elif content in self.registers_16bit or content.startswith("WORD"):
-            size = 2
-        else:
-            raise ValueError("invalid register")
-        self.output.append("    push " + content + "\n")
-        self.stack_size += size
-        self.stack_item_sizes.append(size)
-        print("push", self.stack_size, self.stack_item_sizes, self.variables)
-
-    def pop(self, content: str):
+        places: dict[ir.Slot, int] = {}
+        free: dict[int, list[int]] = {8: [], 2: []} # places of ended scopes, by size
+        counts: dict[int, int] = {8: 0, 2: 0}
+        ending: list[tuple[int, int, ir.Slot]] = [] # heap of the slots that are in a scope, by where their scope ends
+        for slot in sorted(self.function.slots, key=lambda slot: slot.scope_start): # so the scopes of the slots in ending have begun
+            while ending and ending[0][0] <= slot.scope_start:
+                ended = heappop(ending)[2]
+                free[ended.size].append(places[ended])
+            if free[slot.size]:
+                places[slot] = free[slot.size].pop()
+            else:
+                places[slot] = counts[slot.size]
+                counts[slot.size] += 1
+            if slot.scope_end is not None:
+                heappush(ending, (slot.scope_end, slot.number, slot))
+        for slot, place in places.items():
+            self.slot_offsets[slot] = 8 * (place + 1) if slot.size == 8 else 8 * counts[8] + 2 * (place + 1)
+        used = 8 * counts[8] + 2 * counts[2]
+        #NOTE: the pushed rbp takes 8 bytes, so rsp is 16 byte aligned again after the frame
+        self.frame_size = ((used + 8 + 15) & ~15) - 8 if used else 0
+
+    def fused_comparisons(self) -> dict[ir.Temp, str]:
         """
-        adds a pop instruction to the output and updates the stack size 
+        the dests of the comparisons that end up in the branch right after them and nowhere else, with their opcodes
         """
-        self.output.append("    pop " + content + "\n")
-        self.stack_size -= self.stack_item_sizes.pop() # removes and gives the last number
-        print("pop", self.stack_size, self.stack_item_sizes, self.variables)
-
-    def create_label(self) -> str:
+        uses = Counter(temp for block in self.function.blocks for instruction in block.instructions for temp in instruction.uses())
+        fused: dict[ir.Temp, str] = {}
+        for block in self.function.blocks:
+            if len(block.instructions) < 2:
+                continue
+            comparison, branch = block.instructions[-2:]
+            if branch.opcode == "branch" and comparison.opcode in condition_codes and branch.args[0] == comparison.dest and uses[comparison.dest] == 1:
+                fused[comparison.dest] = comparison.opcode
+        return fused
+
+    def slot_operand(self, slot: ir.Slot) -> str:
+        return f"{'QWORD' if slot.size == 8 else 'WORD'} [rbp - {self.slot_offsets[slot]}]"
+
+    def operand(self, value: ir.Temp | ir.Const) -> str:
         """
-        returns a name for a new label based on the amount of labels already created
+        where a value is: a register, a memory operand or the constant itself
         """
-        self.label_count += 1
-        return "label" + str(self.label_count)
+        return self.locations[value] if type(value) is ir.Temp else str(value.value)
 
-    def begin_scope(self) -> None:
+    def source(self, value: ir.Temp | ir.Const) -> str:
         """
-        only used in the generate_scope() method,
-        adds the amount of variables to the scopes list 
-        so the end scopes function knows how many variables it should delete
+        an operand that can be the second operand of an instruction, constants that don't fit into 32 bits are moved to the scratch register
         """
-        self.scopes.append(len(self.variables))
+        if type(value) is ir.Const and not int32_min <= value.value <= int32_max:
+            self.output.append(f"    mov {scratch_register}, {value.value}\n")
+            return scratch_register
+        return self.operand(value)
 
-    def end_scope(self) -> None:
+    def move(self, destination: str, value: ir.Temp | ir.Const) -> None:
         """
-        only used in the generate_scope() method,
-        removes the last scopes variables from memory (by moving the stack pointer),
-        removes itself from the generators list of scopes,
-        removes the aforementioned variables from the generators dictionary
-        returns prematurely if theres nothing to remove
+        moves a value to a register or to memory, through rax when both sides are in memory
         """
-        pop_count: int = len(self.variables) - self.scopes[-1]
-        if pop_count == 0:
-            return # nothing to remove, if its not here then slice accepts all of the stack -> list[0:] == list
-
-        popped_size: int = sum(self.stack_item_sizes[-pop_count:])
-        self.output.append("    add rsp, " + str(popped_size) + "\n")
-        self.stack_size -= popped_size
-        for _ in range(pop_count):
-            self.variables.popitem()
-            self.stack_item_sizes.pop()
-        del self.scopes[-1]
-
-    def generate_boolean(self, bool: prs.NodeTermBool) -> None:
-        self.output.append(f"    mov ax, {bool.bool.value}\n")
-        self.push("ax")
-
-    def generate_term(self, term: prs.NodeTerm) -> None:
+        source = self.operand(value)
+        if source == destination:
+            return
+        if is_memory(destination) and (is_memory(source) or type(value) is ir.Const and not int32_min <= value.value <= int32_max):
+            self.output.append(f"    mov rax, {source}\n")
+            source = "rax"
+        self.output.append(f"    mov {destination}, {source}\n")
+
+    def work_register(self, dest: ir.Temp) -> str:
         """
-        generates a term, a term being a variable or a number, 
-        gets pushed on to of the stack
+        the register a result is computed in, rax when the dest is spilled (its stored afterwards with finish)
         """
-        print(term.var)
-        if isinstance(term.var, prs.NodeTermInt):
-            if term.negative:
-                term.var.int_lit.value = "-" + term.var.int_lit.value
-            self.output.append(f"    mov rax, {term.var.int_lit.value}\n")
-            self.push("rax")
-        elif isinstance(term.var, prs.NodeTermIdent):
-            if term.var.ident.value not in self.variables.keys():
-                self.raise_error("Value", f"variable was not declared: {term.var.ident.value}")
-            location, word_size, byte_size = self.variables[term.var.ident.value]
-            self.push(f"{word_size} [rsp + {self.stack_size - location - byte_size}]") # QWORD 64 bits (word = 16 bits)
-            if term.negative:
-                self.pop("rbx")
-                self.output.append("    mov rax, -1\n")
-                self.output.append("    mul rbx\n")
-                self.push("rax")
-        elif isinstance(term.var, prs.NodeTermBool):
-            self.output.append(f"    mov ax, {term.var.bool.value}\n")
-            self.push("ax")
-        elif isinstance(term.var, prs.NodeTermParen):
-            self.generate_expression(term.var.expr)
-            if term.negative:
-                self.pop("rbx")
-                self.output.append("    mov rax, -1\n")
-                self.output.append("    mul rbx\n")
-                self.push("rax")
-        elif isinstance(term.var, prs.NodeTermNot):
-            self.generate_term(term.var.term)
-            self.pop("rbx")
-            self.output.append("    xor eax, eax\n")
-            self.output.append("    test rbx, rbx\n")
-            self.output.append("    sete al\n")
-            self.output.append("    movzx rax, al\n")
-            self.push("rax")
-    
-    def generate_comparison_expression(self, comparison: prs.NodeBinExprComp) -> None:
+        location = self.locations[dest]
+        return "rax" if is_memory(location) else location
+
+    def finish(self, dest: ir.Temp, register: str) -> None:
+        if self.locations[dest] != register:
+            self.output.append(f"    mov {self.locations[dest]}, {register}\n")
+
+    def generate_test(self, value: ir.Temp | ir.Const) -> None:
         """
-        generates a comparison expression that pushes a 16bit value onto the stack,
-        type of binary expression that returns 1 or 0 depending on if its true or false
+        sets the zero flag when the value is 0
         """
-        self.generate_expression(comparison.rhs)
-        self.generate_expression(comparison.lhs)
-        self.pop("rax")
-        self.pop("rbx")
-        self.output.append("    cmp rax, rbx\n")
-        if comparison.comp_sign.type == tt.is_equal:
-            self.output.append("    sete al\n")
-        elif comparison.comp_sign.type == tt.is_not_equal:
-            self.output.append("    setne al\n")
-        elif comparison.comp_sign.type == tt.larger_than:
-            self.output.append("    setg al\n")
-        elif comparison.comp_sign.type == tt.less_than:
-            self.output.append("    setl al\n")
-        elif comparison.comp_sign.type == tt.larger_than_or_eq:
-            self.output.append("    setge al\n")
-        elif comparison.comp_sign.type == tt.less_than_or_eq:
-            self.output.append("    setle al\n")
+        operand = self.operand(value)
+        if is_memory(operand):
+            self.output.append(f"    cmp {operand}, 0\n")
         else:
-            self.raise_error("Syntax", "Invalid comparison expression")
-        #self.output.append("    movzx rax, al\n")
-        self.push("ax")
+            if type(value) is ir.Const:
+                self.output.append(f"    mov {scratch_register}, {operand}\n")
+                operand = scratch_register
+            self.output.append(f"    test {operand}, {operand}\n")
+
+    def generate_arithmetic(self, instruction: ir.Instruction) -> None:
+        lhs, rhs = instruction.args
+        if instruction.opcode == "mul" and type(lhs) is ir.Const and type(rhs) is ir.Temp:
+            lhs, rhs = rhs, lhs
+        if instruction.opcode == "mul" and type(rhs) is ir.Const and type(lhs) is ir.Temp and self.generate_multiplication(instruction.dest, lhs, rhs.value):
+            return
+        work = self.work_register(instruction.dest)
+        if self.operand(rhs) == work and self.operand(lhs) != work:
+            if instruction.opcode == "sub":
+                work = "rax" # moving the lhs in would overwrite the rhs
+            else:
+                lhs, rhs = rhs, lhs # add and mul don't care about the order
+        self.move(work, lhs)
+        self.output.append(f"    {binary_instructions[instruction.opcode]} {work}, {self.source(rhs)}\n")
+        self.finish(instruction.dest, work)
 
-    def generate_binary_logical_expression(self, logic_expr: prs.NodeBinExprLogic) -> None: #TODO: rename ths mess
+    def generate_multiplication(self, dest: ir.Temp, value: ir.Temp, factor: int) -> bool:
         """
-        generates an eval for a logical expression (AND or OR) that pushes a 16bit value onto the stack,
-        its result can be either 1 or 0
+        multiplies by a constant with shifts, lea or an imul with an immediate instead of moving the value first,
+        returns False when the factor needs the plain imul
         """
-        self.generate_expression(logic_expr.rhs)
-        self.generate_expression(logic_expr.lhs)
-        self.pop("rax")
-        self.pop("rbx")
-        self.output.append("    mov rcx, rax\n")
-        self.output.append("    test rbx, rbx\n")
-        if logic_expr.logical_operator.type == tt.and_:
-            self.output.append("    cmovz rcx, rbx\n")
-        elif logic_expr.logical_operator.type == tt.or_:
-            self.output.append("    cmovnz rcx, rbx\n")
+        work = self.work_register(dest)
+        shift = power_of_two(abs(factor))
+        trailing_zeros = (factor & -factor).bit_length() - 1 if factor else 0
+        odd = factor >> trailing_zeros
+        if shift is not None:
+            self.move(work, value)
+            if shift:
+                self.output.append(f"    shl {work}, {shift}\n")
+            if factor < 0:
+                self.output.append(f"    neg {work}\n")
+        elif odd in lea_multipliers: # 3, 5 and 9 times a power of two
+            base = self.operand(value)
+            if is_memory(base):
+                self.move(work, value)
+                base = work
+            self.output.append(f"    lea {work}, [{base} + {base}*{lea_multipliers[odd]}]\n")
+            if trailing_zeros:
+                self.output.append(f"    shl {work}, {trailing_zeros}\n")
+        elif int32_min <= factor <= int32_max:
+            self.output.append(f"    imul {work}, {self.operand(value)}, {factor}\n")
         else:
-            self.raise_error("Syntax", "Invalid logic expression")
-        self.output.append("    test rcx, rcx\n")
-        self.output.append("    setne al\n")
-        #self.output.append("    movzx rax, al\n")
-        self.push("ax")
+            return False
+        self.finish(dest, work)
+        return True
+
+    def generate_division(self, instruction: ir.Instruction) -> None:
+        lhs, rhs = instruction.args
+        if type(rhs) is ir.Const and rhs.value not in idiv_divisors:
+            if rhs.value == 1:
+                self.move(self.locations[instruction.dest], lhs if instruction.opcode == "div" else ir.Const(0))
+            elif power_of_two(abs(rhs.value)) is not None:
+                self.generate_power_of_two_division(instruction, lhs, rhs.value)
+            else:
+                self.generate_magic_division(instruction, lhs, rhs.value)
+            return
+        self.move("rax", lhs)
+        divisor = self.operand(rhs)
+        if type(rhs) is ir.Const:
+            self.output.append(f"    mov {scratch_register}, {divisor}\n")
+            divisor = scratch_register
+        self.output.append(f"    cqo\n    idiv {divisor}\n")
+        self.finish(instruction.dest, division_results[instruction.opcode])
+
+    def generate_power_of_two_division(self, instruction: ir.Instruction, lhs: ir.Temp | ir.Const, divisor: int) -> None:
+        """
+        a shift rounds down, so a negative lhs gets divisor - 1 added first to round towards 0 like idiv,
+        the remainder is the lhs minus the rounded lhs with the low bits cleared,
+        a lhs that can't be negative only needs the shift or an and
+        """
+        shift = power_of_two(abs(divisor))
+        if type(lhs) is ir.Const and lhs.value >= 0 or lhs in self.nonnegative:
+            work = self.work_register(instruction.dest)
+            self.move(work, lhs)
+            if instruction.opcode == "div":
+                self.output.append(f"    shr {work}, {shift}\n")
+                if divisor < 0:
+                    self.output.append(f"    neg {work}\n")
+            else:
+                self.output.append(f"    and {work}, {self.source(ir.Const((1 << shift) - 1))}\n")
+            self.finish(instruction.dest, work)
+            return
+        self.move("rax", lhs)
+        self.output.append("    mov rdx, rax\n")
+        if shift > 1:
+            self.output.append("    sar rdx, 63\n")
+        self.output.append(f"    shr rdx, {64 - shift}\n") # divisor - 1 when the lhs is negative, 0 otherwise
+        if instruction.opcode == "div":
+            self.output.append(f"    add rax, rdx\n    sar rax, {shift}\n")
+            if divisor < 0:
+                self.output.append("    neg rax\n")
+        else:
+            self.output.append(f"    add rdx, rax\n    and rdx, {self.source(ir.Const(-(1 << shift)))}\n    sub rax, rdx\n")
+        self.finish(instruction.dest, "rax")
 
-    def generate_binary_expression(self, bin_expr: prs.NodeBinExpr) -> None:
+    def generate_magic_division(self, instruction: ir.Instruction, lhs: ir.Temp | ir.Const, divisor: int) -> None:
         """
-        generates a binary expression that gets pushed on top of the stack
+        divides with a multiply high by the magic number of the divisor, the quotient ends up in rdx,
+        the remainder is the lhs minus quotient * divisor
         """
-        if isinstance(bin_expr.var, prs.NodeBinExprAdd):
-            self.generate_expression(bin_expr.var.rhs)
-            self.generate_expression(bin_expr.var.lhs)
-            self.pop("rax")
-            self.pop("rbx")
-            self.output.append("    add rax, rbx\n")
-            self.push("rax")
-        elif isinstance(bin_expr.var, prs.NodeBinExprMulti):
-            self.generate_expression(bin_expr.var.rhs)
-            self.generate_expression(bin_expr.var.lhs)
-            self.pop("rax")
-            self.pop("rbx")
-            self.output.append("    mul rbx\n")
-            self.push("rax")
-        elif isinstance(bin_expr.var, prs.NodeBinExprSub):
-            self.generate_expression(bin_expr.var.rhs)
-            self.generate_expression(bin_expr.var.lhs)
-            self.pop("rax")
-            self.pop("rbx")
-            self.output.append("    sub rax, rbx\n")
-            self.push("rax")
-        elif isinstance(bin_expr.var, prs.NodeBinExprDiv):
-            self.generate_expression(bin_expr.var.rhs)
-            self.generate_expression(bin_expr.var.lhs)
-            self.pop("rax")
-            self.pop("rbx")
-            self.output.append("    idiv rbx\n") #NOTE: idiv is used because div only works with unsigned numbers
-            self.push("rax")
-        elif isinstance(bin_expr.var, prs.NodeBinExprMod):
-            self.generate_expression(bin_expr.var.rhs)
-            self.generate_expression(bin_expr.var.lhs)
-            self.pop("rax")
-            self.pop("rbx")
-            self.output.append("    mov rdx, 0\n")
-            self.output.append("    cqo\n") # sign extends so the modulus result can be negative
-            self.output.append("    idiv rbx\n")
-            self.push("rdx") # assembly stores the modulus in rdx after the standard division instruction
+        multiplier, shift = division_magic(divisor)
+        dividend = self.operand(lhs)
+        if type(lhs) is ir.Const:
+            self.output.append(f"    mov {scratch_register}, {dividend}\n")
+            dividend = scratch_register
+        self.output.append(f"    mov rax, {multiplier}\n    imul {dividend}\n")
+        # the multiplier is a 64 bit number read as signed, when its sign doesn't match the divisor the lhs corrects the high half
+        if divisor > 0 and multiplier < 0:
+            self.output.append(f"    add rdx, {dividend}\n")
+        elif divisor < 0 and multiplier > 0:
+            self.output.append(f"    sub rdx, {dividend}\n")
+        if shift:
+            self.output.append(f"    sar rdx, {shift}\n")
+        self.output.append("    mov rax, rdx\n    shr rax, 63\n    add rdx, rax\n")
+        if instruction.opcode == "div":
+            self.finish(instruction.dest, "rdx")
+            return
+        if int32_min <= divisor <= int32_max:
+            self.output.append(f"    imul rdx, rdx, {divisor}\n")
         else:
-            self.raise_error("Generator", "failed to generate binary expression")
+            self.output.append(f"    mov rax, {divisor}\n    imul rdx, rax\n")
+        self.output.append(f"    mov rax, {dividend}\n    sub rax, rdx\n")
+        self.finish(instruction.dest, "rax")
 
-    def generate_logical_expression(self, expression: prs.NodeLogicExpr):
-        if isinstance(expression.var, prs.NodeBinExprComp): 
-            self.generate_comparison_expression(expression.var)
-        elif isinstance(expression.var, prs.NodeBinExprLogic):
-            self.generate_binary_logical_expression(expression.var)
+    def generate_negation(self, instruction: ir.Instruction) -> None:
+        work = self.work_register(instruction.dest)
+        self.move(work, instruction.args[0])
+        self.output.append(f"    neg {work}\n")
+        self.finish(instruction.dest, work)
 
-    def generate_expression(self, expression: prs.NodeExpr) -> None:
+    def generate_comparison(self, instruction: ir.Instruction) -> None:
         """
-        generates an expression and pushes it on top of the stack
+        compares the sides and turns the flags into 1 or 0, unless the branch after it jumps on the flags
         """
-        if isinstance(expression.var, prs.NodeTerm):
-            self.generate_term(expression.var)
-        elif isinstance(expression.var, prs.NodeBinExpr):
-            self.generate_binary_expression(expression.var)
-        elif isinstance(expression.var, prs.NodeLogicExpr):
-            self.generate_logical_expression(expression.var)
-    
-    def generate_char(self, char: prs.NodeTermChar) -> None:
-        self.output.append(f"    mov rax, {char.char.value}\n")
-        self.push("rax")
-
-    def generate_scope(self, scope: prs.NodeScope) -> None:
-        self.begin_scope()
-        for stmt in scope.stmts:
-            self.generate_statement(stmt)
-        self.end_scope()
-
-    def generate_if_predicate(self, pred: prs.NodeIfPred, end_label: str) -> None:
+        lhs, rhs = instruction.args
+        right = self.source(rhs)
+        left = self.operand(lhs)
+        if type(lhs) is ir.Const or is_memory(left) and is_memory(right): # cmp needs the lhs in a register or memory and can't take two memory operands
+            self.output.append(f"    mov rax, {left}\n")
+            left = "rax"
+        self.output.append(f"    cmp {left}, {right}\n")
+        if instruction.dest in self.flag_conditions:
+            return
+        work = self.work_register(instruction.dest)
+        self.output.append(f"    set{condition_codes[instruction.opcode]} {byte_registers[work]}\n")
+        self.output.append(f"    movzx {work}, {byte_registers[work]}\n")
+        self.finish(instruction.dest, work)
+
+    def generate_not(self, instruction: ir.Instruction) -> None:
+        self.generate_test(instruction.args[0])
+        work = self.work_register(instruction.dest)
+        self.output.append(f"    sete {byte_registers[work]}\n")
+        self.output.append(f"    movzx {work}, {byte_registers[work]}\n")
+        self.finish(instruction.dest, work)
+
+    def generate_logic(self, instruction: ir.Instruction) -> None:
         """
-        generates the following statements connected to the if statement if there are any
+        aj and abo, both sides are turned into 1 or 0 (in al and dl) and combined
         """
-        if isinstance(pred.var, prs.NodeIfPredElif):
-            self.output.append("    ;elif\n")
-            self.generate_expression(pred.var.expr)
-            label = self.create_label()
-
-            self.pop("ax")
-            self.output.append("    test ax, ax\n")
-            
-            self.output.append("    jz " + label + "\n")
-            self.generate_scope(pred.var.scope)
-            self.output.append("    jmp " + end_label + "\n")
-            self.output.append(label + ":\n")
-            self.output.append("    ;/elif\n")
-            if pred.var.pred is not None:
-                self.generate_if_predicate(pred.var.pred, end_label)
-
-        elif isinstance(pred.var, prs.NodeIfPredElse):
-            self.output.append("    ;else\n")
-            self.generate_scope(pred.var.scope)
-            self.output.append("    ;/else\n")
-
-    def generate_let(self, let_stmt: prs.NodeStmtLet):
-        if let_stmt.ident.value in self.variables.keys():
-            self.raise_error("Syntax", f"variable has been already declared: {let_stmt.ident.value}")
-        location: int = self.stack_size # stack size changes after generating the expression, thats why its saved here
-
-        if let_stmt.type_.type == tt.let:
-            var_size: str = "QWORD"
-            byte_size: int = 8
-            if isinstance(let_stmt.expr.var, prs.NodeLogicExpr):
-                self.raise_error("Unexpected", "what ")
-            self.generate_expression(let_stmt.expr)
-        elif let_stmt.type_.type == tt.bool_def:
-            var_size: str = "WORD"
-            byte_size: int = 2
-            if isinstance(let_stmt.expr.var, prs.NodeBinExpr):
-                self.raise_error("Unexpected", "what ")
-            self.generate_expression(let_stmt.expr)
+        lhs, rhs = instruction.args
+        self.generate_test(lhs)
+        self.output.append("    setne al\n")
+        self.generate_test(rhs)
+        self.output.append("    setne dl\n")
+        self.output.append(f"    {logic_instructions[instruction.opcode]} al, dl\n")
+        work = self.work_register(instruction.dest)
+        self.output.append(f"    movzx {work}, al\n")
+        self.finish(instruction.dest, work)
+
+    def generate_copy(self, instruction: ir.Instruction) -> None:
+        self.move(self.locations[instruction.dest], instruction.args[0])
+
+    def generate_load(self, instruction: ir.Instruction) -> None:
+        slot = instruction.args[0]
+        work = self.work_register(instruction.dest)
+        self.output.append(f"    {'mov' if slot.size == 8 else 'movzx'} {work}, {self.slot_operand(slot)}\n")
+        self.finish(instruction.dest, work)
+
+    def generate_store(self, instruction: ir.Instruction) -> None:
+        slot, value = instruction.args
+        if slot.size == 8:
+            self.move(self.slot_operand(slot), value)
+            return
+        source = self.operand(value)
+        if type(value) is ir.Const:
+            source = str(value.value & 0xFFFF) # a bul keeps the low 16 bits
         else:
-            assert False
-        
-        self.variables.update({let_stmt.ident.value : (location, var_size, byte_size)})
-
-    def generate_reassign(self, reassign_stmt: prs.NodeStmtReassign):
-        self.output.append("    ;reassigning a variable\n")
-        if reassign_stmt.var.ident.value not in self.variables.keys():
-            self.raise_error("Value", "undeclared identifier: " + reassign_stmt.var.ident.value)
-        
-        if isinstance(reassign_stmt.var, prs.NodeStmtReassignEq):
-            self.generate_expression(reassign_stmt.var.expr)
-            self.pop("rax")
-            location, _, byte_size = self.variables[reassign_stmt.var.ident.value]
-            self.output.append(f"    mov [rsp + {self.stack_size - location - byte_size}], rax\n")
-        elif isinstance(reassign_stmt.var, (prs.NodeStmtReassignInc, prs.NodeStmtReassignDec)):
-            location, size, byte_size = self.variables[reassign_stmt.var.ident.value]
-            self.push(f"{size} [rsp + {self.stack_size - location - byte_size}]") # QWORD 64 bits (word = 16 bits)
-            self.pop("rax")
-            self.output.append("    inc rax\n" 
-                               if isinstance(reassign_stmt.var, prs.NodeStmtReassignInc) 
-                               else "    dec rax\n")
-            self.output.append(f"    mov [rsp + {self.stack_size - location - byte_size}], rax\n")
-        self.output.append("    ;/reassigning a variable\n")
-
-    def generate_exit(self, exit_stmt: prs.NodeStmtExit) -> None:
-        self.generate_expression(exit_stmt.expr)
-        self.output.append("    ; manual exit (vychod)\n")
-        self.output.append("    mov rax, 60\n")
-        self.pop("rdi")
-        self.output.append("    syscall\n")
+            if is_memory(source):
+                self.output.append(f"    mov rax, {source}\n")
+                source = "rax"
+            source = word_registers[source]
+        self.output.append(f"    mov {self.slot_operand(slot)}, {source}\n")
 
-    def generate_if_statement(self, if_stmt: prs.NodeStmtIf) -> None:
-        self.output.append("    ;if block\n")
-        self.generate_expression(if_stmt.expr)
-        label = self.create_label()
-
-        self.pop("ax") #TODO: make the comparison expressions use the correct size depending on type (if not used it mis-aligns the stack cuz when popping into rax it takes the top 64bits and cuts off a value misaliging the sack)
-        self.output.append("    test ax, ax\n")
-
-        self.output.append("    jz " + label + "\n")
-        self.generate_scope(if_stmt.scope)
-        
-        if if_stmt.ifpred is not None:
-            end_label = self.create_label()
-            self.output.append("    jmp " + end_label + "\n")
-            self.output.append(label + ":\n")
-            self.generate_if_predicate(if_stmt.ifpred, end_label)
-            self.output.append(end_label + ":\n")
-        else:
-            self.output.append(label + ":\n")
-        self.output.append("    ;/if block\n")
-
-    def generate_while(self, while_stmt: prs.NodeStmtWhile) -> None:
-        self.output.append("    ;while loop\n")
-        end_label = self.create_label()
-        reset_label = self.create_label()
-        self.loop_end_labels.append(end_label)
-
-        self.output.append(reset_label  + ":\n")
-
-        self.generate_expression(while_stmt.expr)
-        self.pop("ax")
-        self.output.append("    test ax, ax\n")
-        self.output.append(f"    jz {end_label}\n")
-
-        self.generate_scope(while_stmt.scope)
-        
-        self.output.append("    jmp " + reset_label + "\n")
-        self.output.append(end_label  + ":\n")
-        self.output.append("    ;/while loop\n")
-        self.loop_end_labels.pop()
-
-    def generate_do_while(self, do_while_stmt: prs.NodeStmtDoWhile) -> None:
-        self.output.append("    ;do while loop\n")
-        end_label = self.create_label()
-        reset_label = self.create_label()
-        self.loop_end_labels.append(end_label)
-
-        self.output.append(reset_label  + ":\n")
-
-        self.generate_scope(do_while_stmt.scope)
-
-        self.generate_expression(do_while_stmt.expr)
-        self.pop("ax")
-        self.output.append("    test ax, ax\n")
-        self.output.append(f"    jz {end_label}\n")
-
-        self.output.append("    jmp " + reset_label + "\n")
-        self.output.append(end_label  + ":\n")
-        self.output.append("    ;/do while loop\n")
-        self.loop_end_labels.pop()
-
-    def generate_for(self, for_stmt: prs.NodeStmtFor) -> None:
-        self.output.append("    ;for loop\n")
-        end_label = self.create_label()
-        reset_label = self.create_label()
-        self.loop_end_labels.append(end_label)
-
-        self.generate_let(for_stmt.ident_def)
-
-        self.output.append(reset_label  + ":\n")
-
-        self.generate_comparison_expression(for_stmt.condition)
-        
-        self.pop("ax")
-        self.output.append("    test ax, ax\n")
-        self.output.append(f"    jz {end_label}\n")
-
-        self.generate_scope(for_stmt.scope)
-        
-        self.generate_reassign(for_stmt.ident_assign)
-
-        self.output.append("    jmp " + reset_label + "\n")
-        self.output.append(end_label  + ":\n")
-        self.output.append("    add rsp, " + str(8) + "\n")
-        self.stack_size -= self.stack_item_sizes.pop() # does this to remove the variable after the i loop ends
-        self.variables.popitem()
-        self.output.append("    ;/for loop\n")
-        self.loop_end_labels.pop()
-
-    def generate_print(self, print_stmt: prs.NodeStmtPrint) -> None:
-        if isinstance(print_stmt.content, prs.NodeExpr):
-            self.generate_expression(print_stmt.content)
-        elif isinstance(print_stmt.content, prs.NodeTermChar):
-            self.generate_char(print_stmt.content)
-        expr_loc = f"rsp"
-        self.output.append("    ; printing\n")
-        self.output.append("    mov rax, 1\n")
-        self.output.append("    mov rdi, 1\n")
-        self.output.append(f"    mov rsi, {expr_loc}\n")
-        self.output.append("    mov rdx, 1\n")
-        self.output.append("    syscall\n")
-        pushed_res = self.stack_item_sizes.pop() #it removes the printed expression because it causes a mess in the stack when looping
-        self.output.append("    add rsp, " + str(pushed_res) + "\n") #removes the printed expression from the stack
-        self.stack_size -= pushed_res #lowers the stack size
-        self.output.append("    ; /printing\n")
+    def generate_step(self, instruction: ir.Instruction) -> None:
+        self.output.append(f"    {instruction.opcode} {self.slot_operand(instruction.args[0])}\n")
 
-    def generate_statement(self, statement: prs.NodeStmt) -> None:
+    def generate_print(self, instruction: ir.Instruction) -> None:
         """
-        generates a statement based on the node given
+        appends the low byte of the value to the output buffer and flushes it when its full,
+        only rax changes (and r11 for a spilled value), output_flush saves the registers the write syscall needs
         """
-        if isinstance(statement.stmt_var, prs.NodeStmtExit):
-            self.generate_exit(statement.stmt_var)
-
-        elif isinstance(statement.stmt_var, prs.NodeStmtLet):
-            self.generate_let(statement.stmt_var)
-        
-        elif isinstance(statement.stmt_var, prs.NodeScope):
-            self.generate_scope(statement.stmt_var)
-        
-        elif isinstance(statement.stmt_var, prs.NodeStmtIf):
-            self.generate_if_statement(statement.stmt_var)
-
-        elif isinstance(statement.stmt_var, prs.NodeStmtReassign):
-            self.generate_reassign(statement.stmt_var)
-
-        elif isinstance(statement.stmt_var, prs.NodeStmtWhile):
-            self.generate_while(statement.stmt_var)
-        
-        elif isinstance(statement.stmt_var, prs.NodeStmtDoWhile):
-            self.generate_do_while(statement.stmt_var)
-        
-        elif isinstance(statement.stmt_var, prs.NodeStmtFor):
-            self.generate_for(statement.stmt_var)
-        
-        elif isinstance(statement.stmt_var, prs.NodeStmtPrint):
-            self.generate_print(statement.stmt_var)
-
-        elif isinstance(statement.stmt_var, prs.NodeStmtBreak):
-            if self.loop_end_labels:
-                self.output.append("    ; break \n")
-                self.output.append("    jmp " + self.loop_end_labels[-1] + "\n")
-            else:
-                self.raise_error("Syntax", "cant break out of a loop when not inside one")
+        value = instruction.args[0]
+        if type(value) is ir.Const:
+            byte = str(value.value & 0xFF)
+        else:
+            location = self.locations[value]
+            if is_memory(location):
+                self.output.append(f"    mov {scratch_register}, {location}\n")
+                location = scratch_register
+            byte = byte_registers[location]
+        self.print_count += 1
+        self.output.append("    mov rax, QWORD [output_length]\n")
+        self.output.append(f"    mov BYTE [output_buffer + rax], {byte}\n")
+        self.output.append("    inc rax\n")
+        self.output.append("    mov QWORD [output_length], rax\n")
+        self.output.append(f"    cmp rax, {output_buffer_size}\n")
+        self.output.append(f"    jne printed{self.print_count}\n")
+        self.output.append("    call output_flush\n")
+        self.output.append(f"printed{self.print_count}:\n")
+
+    def generate_print_number(self, instruction: ir.Instruction) -> None:
+        self.move("rax", instruction.args[0])
+        self.output.append("    call output_number\n")
+
+    def generate_exit(self, instruction: ir.Instruction) -> None:
+        if self.buffered:
+            self.output.append("    call output_flush\n")
+        self.move("rdi", instruction.args[0])
+        self.output.append("    mov rax, 60\n")
+        self.output.append("    syscall\n")
 
-        elif statement.stmt_var == "new_line": # just used for tracking line numbers TODO: fix line number tracking in generator
-            self.line_number += 1
+    def generate_jump(self, instruction: ir.Instruction) -> None:
+        target = instruction.args[0]
+        if target is not self.next_block:
+            self.output.append(f"    jmp {target.label}\n")
+
+    def generate_branch(self, instruction: ir.Instruction) -> None:
+        condition, true_block, false_block = instruction.args
+        if type(condition) is ir.Const:
+            self.generate_jump(ir.Instruction("jump", None, (true_block if condition.value != 0 else false_block,)))
+            return
+        if condition in self.flag_conditions:
+            true_code = condition_codes[self.flag_conditions[condition]]
+            false_code = inverted_condition_codes[true_code]
+        else:
+            self.generate_test(condition)
+            true_code, false_code = "nz", "z"
+        if true_block is self.next_block:
+            self.output.append(f"    j{false_code} {false_block.label}\n")
+        else:
+            self.output.append(f"    j{true_code} {true_block.label}\n")
+            if false_block is not self.next_block:
+                self.output.append(f"    jmp {false_block.label}\n")
 
-    def generate_program(self) -> str:
+    def generate_program(self) -> str | None:
         """
-        generates the whole assembly based on the nodes that are given,
-        returns a string that contains the assembly
+        generates the whole assembly from the ir,
+        returns a string that contains the assembly when the output is a list,
+        returns None when the output is a stream because everything has been written to it already
         """
+        allocator = RegisterAllocator(self.function)
+        locations = allocator.allocate() # adds the spill slots to the function, so its done before the frame is laid out
+        self.spill_count = allocator.spill_count
+        self.nonnegative = ir.nonnegative_temps(self.function)
+        self.layout_frame()
+        self.flag_conditions = self.fused_comparisons()
+        self.locations = {temp: location if type(location) is str else self.slot_operand(location) for temp, location in locations.items()}
+
+        targets = {successor for block in self.function.blocks for successor in block.successors()}
+        opcodes = {instruction.opcode for block in self.function.blocks for instruction in block.instructions}
+        self.buffered = "print" in opcodes or "print_number" in opcodes
         self.output.append("section .data\n")
+        if "print_number" in opcodes:
+            self.output.append(f"    digit_pairs db \"{digit_pairs}\"\n")
         self.output.append("section .bss\n")
+        if self.buffered:
+            self.output.append(f"    output_buffer resb {output_buffer_size + (number_slack if 'print_number' in opcodes else 0)}\n")
+            self.output.append("    output_length resq 1\n")
+        if "print_number" in opcodes:
+            self.output.append(f"    number_digits resb {24 + number_slack}\n")
         self.output.append("section .text\n    global _start\n")
         self.output.append("_start:\n")
-        for stmt in self.main_program.stmts:
-            self.generate_statement(stmt)
-        self.output.append("    ; default exit\n    mov rax, 60\n    mov rdi, 0\n    syscall" )
-        return "".join(self.output)
+        if self.frame_size:
+            self.output.append(f"    push rbp\n    mov rbp, rsp\n    sub rsp, {self.frame_size}\n")
+        blocks = self.function.blocks
+        for index, block in enumerate(blocks):
+            self.next_block = blocks[index + 1] if index + 1 < len(blocks) else None
+            if block in targets:
+                self.output.append(block.label + ":\n")
+            for instruction in block.instructions:
+                if Trace.codegen >= 2:
+                    fields = {"locations": {str(temp): self.locations[temp] for temp in (*instruction.uses(), instruction.dest) if temp is not None}} if Trace.codegen >= 3 else {}
+                    Trace.record("codegen", "instruction", instruction=str(instruction), **fields)
+                self.instruction_generators[instruction.opcode](instruction)
+        if self.buffered:
+            self.output.append(output_flush)
+        if "print_number" in opcodes:
+            self.output.append(output_number)
+        if Trace.codegen:
+            Trace.record("codegen", "done", blocks=len(blocks), frame_size=self.frame_size, spills=self.spill_count)
+        if isinstance(self.output, list):
+            return "".join(self.output)
+        return None
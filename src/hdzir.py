@@ -0,0 +1,298 @@
+from dataclasses import dataclass, field
+from typing import Iterator
+
+
+# three address instructions: "dest = opcode args", every opcode has a fixed shape
+# arithmetic:  add sub mul div mod (dest, lhs, rhs), neg (dest, value)
+# comparisons: eq ne lt le gt ge (dest, lhs, rhs), the result is 1 or 0
+# logic:       and or (dest, lhs, rhs), not (dest, value), true is anything but 0, the result is 1 or 0
+# data:        copy (dest, value), load (dest, slot), store (slot, value), inc dec (slot)
+# output:      print (value), writes the low byte of the value, print_number (value), writes the value as a decimal number
+# terminators: jump (block), branch (condition, true block, false block), exit (value)
+arithmetic_opcodes: frozenset[str] = frozenset(("add", "sub", "mul", "div", "mod", "neg"))
+comparison_opcodes: frozenset[str] = frozenset(("eq", "ne", "lt", "le", "gt", "ge"))
+logic_opcodes: frozenset[str] = frozenset(("and", "or", "not"))
+terminator_opcodes: frozenset[str] = frozenset(("jump", "branch", "exit"))
+# instructions that do something besides setting their dest, they are never removed because their result isn't used
+#NOTE: div and mod are here because they crash the program when dividing by zero
+side_effect_opcodes: frozenset[str] = frozenset(("store", "inc", "dec", "print", "print_number", "div", "mod")) | terminator_opcodes
+boolean_opcodes: frozenset[str] = comparison_opcodes | logic_opcodes # always result in 1 or 0
+
+
+@dataclass(frozen=True, slots=True)
+class Temp:
+    """
+    a virtual register, the generator decides which real register (or spill slot) it lives in
+    """
+    number: int
+
+    def __str__(self) -> str:
+        return f"t{self.number}"
+
+
+@dataclass(frozen=True, slots=True)
+class Const:
+    value: int
+
+    def __str__(self) -> str:
+        return str(self.value)
+
+
+@dataclass(eq=False, slots=True)
+class Slot:
+    """
+    the place of a variable in the stack frame, every declaration gets its own slot even when names repeat in other scopes
+    """
+    name: str
+    size: int # 8 for naj, 2 for bul
+    number: int
+    # the part of the function the slot is used in, counted in slots created by the lowering, spill slots are used everywhere
+    scope_start: int = 0
+    scope_end: int | None = None # None when it lives until the end
+
+    def __str__(self) -> str:
+        return f"{self.name}.{self.number}"
+
+
+@dataclass(slots=True)
+class Instruction:
+    opcode: str
+    dest: Temp | None = None
+    args: tuple = () # Temps, Consts, Slots and for terminators the Blocks they go to
+
+    def uses(self) -> Iterator[Temp]:
+        for arg in self.args:
+            if type(arg) is Temp:
+                yield arg
+
+    def replace_uses(self, replacements: dict[Temp, "Temp | Const"]) -> None:
+        self.args = tuple(replacements.get(arg, arg) if type(arg) is Temp else arg for arg in self.args)
+
+    def __str__(self) -> str:
+        args = ", ".join(arg.label if type(arg) is Block else str(arg) for arg in self.args)
+        if self.dest is not None:
+            return f"{self.dest} = {self.opcode} {args}"
+        return f"{self.opcode} {args}"
+
+
+@dataclass(eq=False, slots=True)
+class Block:
+    """
+    a basic block, only its last instruction (a terminator) can leave it
+    """
+    label: str
+    instructions: list[Instruction] = field(default_factory=list)
+
+    @property
+    def terminator(self) -> Instruction:
+        return self.instructions[-1]
+
+    def successors(self) -> list["Block"]:
+        return [arg for arg in self.terminator.args if type(arg) is Block]
+
+
+@dataclass(slots=True)
+class Function:
+    """
+    the whole program as a control flow graph, blocks[0] is the entry and the list order is the order the generator lays them out in
+    """
+    blocks: list[Block] = field(default_factory=list)
+    slots: list[Slot] = field(default_factory=list)
+    temp_count: int = 0
+    label_count: int = 0
+
+    def new_temp(self) -> Temp:
+        self.temp_count += 1
+        return Temp(self.temp_count)
+
+    def new_block(self) -> Block:
+        """
+        creates a block without adding it to the layout
+        """
+        self.label_count += 1
+        return Block("label" + str(self.label_count))
+
+    def new_slot(self, name: str, size: int) -> Slot:
+        slot = Slot(name, size, len(self.slots))
+        self.slots.append(slot)
+        return slot
+
+    def instruction_count(self) -> int:
+        return sum(len(block.instructions) for block in self.blocks)
+
+    def __str__(self) -> str:
+        lines = [f"slots: {', '.join(f'{slot} ({slot.size})' for slot in self.slots)}"] if self.slots else []
+        for block in self.blocks:
+            lines.append(block.label + ":")
+            lines.extend("    " + str(instruction) for instruction in block.instructions)
+        return "\n".join(lines) + "\n"
+
+
+def predecessors(function: Function) -> dict[Block, list[Block]]:
+    result: dict[Block, list[Block]] = {block: [] for block in function.blocks}
+    for block in function.blocks:
+        for successor in block.successors():
+            result[successor].append(block)
+    return result
+
+
+def reverse_postorder(function: Function) -> list[Block]:
+    """
+    the blocks reachable from the entry, every block comes before its successors except along back edges (loops)
+    """
+    order: list[Block] = []
+    visited: set[Block] = {function.blocks[0]}
+    stack: list[tuple[Block, Iterator[Block]]] = [(function.blocks[0], iter(function.blocks[0].successors()))]
+    while stack: # walked with an explicit stack so long chains of blocks don't hit the recursion limit
+        block, successors = stack[-1]
+        for successor in successors:
+            if successor not in visited:
+                visited.add(successor)
+                stack.append((successor, iter(successor.successors())))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+
+def liveness(function: Function) -> tuple[dict[Block, set[Temp]], dict[Block, set[Temp]]]:
+    """
+    the temps that are live when every block starts and ends (their value is still used later), solved backwards until nothing changes
+    """
+    uses: dict[Block, set[Temp]] = {}
+    definitions: dict[Block, set[Temp]] = {}
+    for block in function.blocks:
+        used: set[Temp] = set()
+        defined: set[Temp] = set()
+        for instruction in block.instructions:
+            used.update(temp for temp in instruction.uses() if temp not in defined)
+            if instruction.dest is not None:
+                defined.add(instruction.dest)
+        uses[block] = used
+        definitions[block] = defined
+
+    live_in: dict[Block, set[Temp]] = {block: set(uses[block]) for block in function.blocks}
+    live_out: dict[Block, set[Temp]] = {block: set() for block in function.blocks}
+    order = list(reversed(function.blocks))
+    changed = True
+    while changed:
+        changed = False
+        for block in order:
+            out: set[Temp] = set()
+            for successor in block.successors():
+                out |= live_in[successor]
+            if out != live_out[block]:
+                live_out[block] = out
+                live_in[block] = uses[block] | (out - definitions[block])
+                changed = True
+    return live_in, live_out
+
+
+def immediate_dominators(function: Function) -> dict[Block, Block]:
+    """
+    the closest block every path from the entry to a reachable block has to go through, the entry is its own,
+    solved over the reverse postorder until nothing changes (cooper, harvey and kennedy)
+    """
+    order = reverse_postorder(function)
+    index = {block: position for position, block in enumerate(order)}
+    block_predecessors = predecessors(function)
+    entry = order[0]
+    dominators: dict[Block, Block] = {entry: entry}
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new_dominator = None
+            for predecessor in block_predecessors[block]:
+                if predecessor not in dominators:
+                    continue # not reached yet or not reachable at all
+                if new_dominator is None:
+                    new_dominator = predecessor
+                    continue
+                first, second = predecessor, new_dominator
+                while first is not second:
+                    while index[first] > index[second]:
+                        first = dominators[first]
+                    while index[second] > index[first]:
+                        second = dominators[second]
+                new_dominator = first
+            if dominators.get(block) is not new_dominator:
+                dominators[block] = new_dominator
+                changed = True
+    return dominators
+
+
+def dominates(dominators: dict[Block, Block], dominator: Block, block: Block) -> bool:
+    while block is not dominator:
+        parent = dominators.get(block)
+        if parent is None or parent is block:
+            return False
+        block = parent
+    return True
+
+
+@dataclass(eq=False, slots=True)
+class Loop:
+    """
+    a natural loop, the header is the only way into it and blocks has every block of it including the header
+    """
+    header: Block
+    blocks: set[Block]
+
+
+def natural_loops(function: Function) -> list[Loop]:
+    """
+    the loops the back edges (jumps to a block that dominates the jumping one) make, loops with the same header are one loop,
+    inner loops come before the loops they are in
+    """
+    dominators = immediate_dominators(function)
+    block_predecessors = predecessors(function)
+    index = {block: position for position, block in enumerate(reverse_postorder(function))}
+    loops: dict[Block, Loop] = {}
+    for block in function.blocks:
+        if block not in dominators:
+            continue
+        for successor in block.successors():
+            # only an edge going back in the reverse postorder can be a back edge, checking just those keeps long programs without loops fast
+            if index[successor] > index[block] or not dominates(dominators, successor, block):
+                continue
+            loop = loops.setdefault(successor, Loop(successor, {successor}))
+            stack = [block]
+            while stack: # everything that reaches the back edge without going through the header
+                member = stack.pop()
+                if member not in loop.blocks:
+                    loop.blocks.add(member)
+                    stack.extend(predecessor for predecessor in block_predecessors[member] if predecessor in dominators)
+    return sorted(loops.values(), key=lambda loop: len(loop.blocks))
+
+
+def nonnegative_temps(function: Function) -> set[Temp]:
+    """
+    the temps that can never be negative: results of comparisons and logic, loads of bul slots (they are zero extended)
+    and copies, divisions and remainders of those by positive constants,
+    starts from every temp and drops the ones with a set that could be negative until nothing changes
+    """
+    definitions = [instruction for block in function.blocks for instruction in block.instructions if instruction.dest is not None]
+    nonnegative = {instruction.dest for instruction in definitions}
+
+    def is_nonnegative(value) -> bool:
+        return value in nonnegative if type(value) is Temp else type(value) is Const and value.value >= 0
+
+    changed = True
+    while changed:
+        changed = False
+        for instruction in definitions:
+            if instruction.dest not in nonnegative:
+                continue
+            opcode, args = instruction.opcode, instruction.args
+            if opcode in boolean_opcodes or opcode == "load" and args[0].size == 2:
+                continue
+            if opcode == "copy" and is_nonnegative(args[0]):
+                continue
+            if opcode in ("div", "mod") and is_nonnegative(args[0]) and type(args[1]) is Const and args[1].value > 0:
+                continue
+            nonnegative.discard(instruction.dest)
+            changed = True
+    return nonnegative
@@ -1,3 +1,5 @@
+import re
+from typing import Iterator
 from dataclasses import dataclass
 import hdztokentypes as tt
 from hdzerrors import ErrorHandler
@@ -5,177 +7,79 @@ from hdzerrors import ErrorHandler
 
 @dataclass(slots=True)
 class Token:
-    type: str
+    type: int
     value: str | None = None
+    start: int = 0 # offset of the first character of the token in the file
+    end: int = 0 # offset right after the last character of the token
 
 
-def is_valid_keyword_content(char: str) -> bool:
-    """
-    used for checking the remaining character in an identifier / keyword
-    """
-    return char.isalpha() or char.isdigit() or char == "_"
+# every lexeme class is one named group, the groups are tried in order after skipping the spaces in front of a lexeme
+# and the last one catches any character the language doesn't know about
+token_pattern: re.Pattern = re.compile(r"""[ ]*(?:
+      (?P<word>[^\W\d]\w*)
+    | (?P<operator>==|!=|>=|<=|\+\+|--|[(){},=<>+\-*%]|/(?![/*]))
+    | (?P<number>[0-9]+)
+    | (?P<new_line>\n)
+    | (?P<line_comment>//[^\n]*)
+    | (?P<block_comment>/\*.*?\*/)
+    | (?P<unclosed_comment>/\*)
+    | (?P<char>'(?:\\.|[^\\])')
+    | (?P<unclosed_char>')
+    | (?P<unknown>.)
+    | (?P<end>\Z)
+)""", re.VERBOSE | re.DOTALL)
 
-
-def search_for_keyword(potential_keyword: str) -> Token:
-    """
-    sees if a keyword is in the tokens list, otherwise makes an identifier
-    """
-    if potential_keyword in tt.all_token_types:
-        return Token(type=potential_keyword, value=None)
-    else:
-        return Token(type=tt.identifier, value=potential_keyword)
+escape_sequences: dict[str, int] = {"n": 10, "t": 9} # ascii codes for newline and tab
 
 
 class Tokenizer(ErrorHandler):
-    def __init__(self, file_content: str) -> None:
-        super().__init__(file_content)
-        self.current_char: str | None = None
-        self.index: int = -1
-        self.advance()
-    
-    def advance(self):
+    def tokenize(self) -> list[Token]:
         """
-        changes the current char to the next one and increments the index and the column number
+        returns all of the tokens in the file as a list
         """
-        if self.current_char is not None and self.current_char == "\n":
-            self.line_number += 1
-            self.column_number = -1
-        self.index += 1
-        self.column_number += 1
-        self.current_char = self.file_content[self.index] if self.index < len(self.file_content) else None
+        return list(self.iter_tokens())
 
-    def look_ahead(self,step: int = 1) -> str | None:
+    def iter_tokens(self) -> Iterator[Token]:
         """
-        looks ahead step characters from the current character
+        scans the file with the master token pattern and yields the tokens one by one as they are found,
+        lexemes are sliced out of the file content by the regex engine instead of being built char by char,
+        tokens only remember where they start and end, line and column numbers are looked up when they are needed
         """
-        return self.file_content[self.index + step] if self.index + step < len(self.file_content) else None
-
-    def tokenize(self):
-        tokens: list[Token] = []
-        while self.current_char is not None:
-            char: str = self.current_char
-            buffer = ""
+        keywords = tt.keywords
+        operators = tt.operators
+        identifier = tt.identifier
 
-            if char.isalpha() or char == "_": #makes keywords, if not a keyword makes an identifier
-                buffer += char
-                self.advance()
-                while is_valid_keyword_content(self.current_char):
-                    buffer += self.current_char
-                    self.advance()
-                tokens.append(search_for_keyword(buffer))
-                buffer = ""
-            
-            elif char.isnumeric(): #makes numbers, ints only for now
-                buffer += char
-                self.advance()
-                while self.current_char.isnumeric():  # or self.current_char == ".":
-                    buffer += self.current_char
-                    self.advance()
-                type_of_number = tt.int_lit  # if "." not in buffer else tt.floating_number
-                tokens.append(Token(type=type_of_number, value=buffer))
-                buffer = ""
-            
-            elif char == "'":
-                self.advance()
-                if self.current_char == "\\":
-                    self.advance()
-                    if self.current_char == "n":
-                        ascii_value = 10 # ascii code for newline
-                    elif self.current_char == "t":
-                        ascii_value = 9
-                    else:
-                        ascii_value = ord(self.current_char)    
+        for match in token_pattern.finditer(self.file_content):
+            kind = match.lastgroup
+            end = match.end() # the spaces are skipped in front of the lexeme so the match always ends with it
+            if kind == "word": # makes keywords, if not a keyword makes an identifier
+                lexeme = match[kind]
+                keyword_type = keywords.get(lexeme)
+                yield Token(keyword_type, None, end - len(lexeme), end) if keyword_type is not None else Token(identifier, lexeme, end - len(lexeme), end)
+            elif kind == "operator":
+                lexeme = match[kind]
+                yield Token(operators[lexeme], None, end - len(lexeme), end)
+            elif kind == "number": # ints only for now
+                lexeme = match[kind]
+                yield Token(tt.int_lit, lexeme, end - len(lexeme), end)
+            elif kind == "new_line":
+                yield Token(tt.end_line, None, end - 1, end)
+            elif kind == "line_comment" or kind == "block_comment" or kind == "end":
+                continue
+            elif kind == "char":
+                lexeme = match[kind]
+                if lexeme[1] == "\\":
+                    ascii_value = escape_sequences.get(lexeme[2], ord(lexeme[2]))
                 else:
-                    ascii_value = ord(self.current_char)
-                tokens.append(Token(type=tt.char_lit, value=str(ascii_value)))
-                self.advance()
-                if self.current_char is None or self.current_char != "'":
-                    self.raise_error("Syntax", "expected \"'\"")
-                self.advance()
-            
-            elif char == "=" and self.look_ahead() == "=":
-                self.advance()
-                self.advance()
-                tokens.append(Token(type=tt.is_equal))
-            elif char == "!" and self.look_ahead() == "=":
-                self.advance()
-                self.advance()
-                tokens.append(Token(type=tt.is_not_equal))
-            elif char == ">" and self.look_ahead() == "=":
-                self.advance()
-                self.advance()
-                tokens.append(Token(type=tt.larger_than_or_eq))
-            elif char == "<" and self.look_ahead() == "=":
-                self.advance()
-                self.advance()
-                tokens.append(Token(type=tt.less_than_or_eq))
-            elif char == "+" and self.look_ahead() == "+":
-                self.advance()
-                self.advance()
-                tokens.append(Token(type=tt.increment))
-            elif char == "-" and self.look_ahead() == "-":
-                self.advance()
-                self.advance()
-                tokens.append(Token(type=tt.decrement))
-            elif char == "/" and self.look_ahead() == "/":
-                self.advance()
-                while self.current_char not in ("\n", None):
-                    self.advance()
-            elif char == "/" and self.look_ahead() == "*":
-                cache = self.line_number, self.column_number
-                self.advance()
-                self.advance()
-                while self.current_char not in ("*", None) or self.look_ahead() not in ("/", None):
-                    self.advance()
-                self.advance()
-                self.advance()
-                if self.current_char is None:
-                    self.line_number, self.column_number = cache
-                    self.raise_error("Syntax", "unclosed multiline comment")
-            elif char == "\n":
-                self.advance()
-                tokens.append(Token(type=tt.end_line))
-            elif char == " ":
-                self.advance()
-            elif char == "(":
-                self.advance()
-                tokens.append(Token(type=tt.left_paren))
-            elif char == ")":
-                self.advance()
-                tokens.append(Token(type=tt.right_paren))
-            elif char == "{":
-                self.advance()
-                tokens.append(Token(type=tt.left_curly))
-            elif char == "}":
-                self.advance()
-                tokens.append(Token(type=tt.right_curly))
-            elif char == ",":
-                self.advance()
-                tokens.append(Token(type=tt.dash))
-            elif char == "=":
-                self.advance()
-                tokens.append(Token(type=tt.equals))
-            elif char == ">":
-                self.advance()
-                tokens.append(Token(type=tt.larger_than))
-            elif char == "<":
-                self.advance()
-                tokens.append(Token(type=tt.less_than))
-            elif char == "+":
-                self.advance()
-                tokens.append(Token(type=tt.plus))
-            elif char == "-":
-                self.advance()
-                tokens.append(Token(type=tt.minus))
-            elif char == "*":
-                self.advance()
-                tokens.append(Token(type=tt.star))
-            elif char == "/":
-                self.advance()
-                tokens.append(Token(type=tt.slash))
-            elif char == "%":
-                self.advance()
-                tokens.append(Token(type=tt.percent))
+                    ascii_value = ord(lexeme[1])
+                yield Token(tt.char_lit, str(ascii_value), end - len(lexeme), end)
+            elif kind == "unclosed_char":
+                start = match.start(kind)
+                self.move_to(min(start + (3 if self.file_content.startswith("\\", start + 1) else 2), len(self.file_content)))
+                self.raise_error("Syntax", "expected \"'\"")
+            elif kind == "unclosed_comment":
+                self.move_to(match.start(kind))
+                self.raise_error("Syntax", "unclosed multiline comment")
             else:
+                self.move_to(match.start(kind))
                 self.raise_error("Syntax", "char not included in the lexer")
-        return tokens
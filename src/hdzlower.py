@@ -0,0 +1,382 @@
+from hdzerrors import ErrorHandler, LineIndex
+import hdzparser as prs
+import hdztokentypes as tt
+import hdzir as ir
+from hdzfold import wrap
+from hdztrace import Trace
+
+
+# ir opcode of every arithmetic node
+arithmetic_opcodes: dict[type, str] = {
+    prs.NodeBinExprAdd: "add",
+    prs.NodeBinExprSub: "sub",
+    prs.NodeBinExprMulti: "mul",
+    prs.NodeBinExprDiv: "div",
+    prs.NodeBinExprMod: "mod",
+}
+
+comparison_opcodes: list[str | None] = [None] * tt.token_type_count # ir opcode of every comparison token type
+comparison_opcodes[tt.is_equal] = "eq"
+comparison_opcodes[tt.is_not_equal] = "ne"
+comparison_opcodes[tt.larger_than] = "gt"
+comparison_opcodes[tt.less_than] = "lt"
+comparison_opcodes[tt.larger_than_or_eq] = "ge"
+comparison_opcodes[tt.less_than_or_eq] = "le"
+
+logic_opcodes: list[str | None] = [None] * tt.token_type_count # ir opcode of every logic token type
+logic_opcodes[tt.and_] = "and"
+logic_opcodes[tt.or_] = "or"
+
+
+class Lowering(ErrorHandler):
+    """
+    turns the syntax tree into the three address ir (hdzir), control flow statements become blocks that jump to each other,
+    every variable gets a slot in the frame and every intermediate result a new temp,
+    the errors in the program that the parser can't see (undeclared variables, konec outside of a loop, ...) are raised here
+    """
+    def __init__(self, file_content: str, line_index: LineIndex | None = None) -> None:
+        super().__init__(file_content, line_index)
+        self.function: ir.Function = ir.Function()
+        self.block: ir.Block = ir.Block("entry")
+        self.function.blocks.append(self.block)
+
+        self.variables: dict[str, ir.Slot] = {} # the variables that can be used where the lowering is now
+        self.scopes: list[list[str]] = [] # names declared in every scope the lowering is in
+        self.loop_exits: list[ir.Block] = [] # where a konec in every loop the lowering is in goes
+        self.register_needs: dict[int, int] = {} # id of an expression node -> its Sethi-Ullman number, only kept while the expression is lowered
+
+        # lowering of every node type, looked up by type(node) so no isinstance chains are walked
+        self.statement_lowerings: dict[type, callable] = {
+            prs.NodeStmtExit: self.lower_exit,
+            prs.NodeStmtLet: self.lower_let,
+            prs.NodeScope: self.lower_scope,
+            prs.NodeStmtIf: self.lower_if_statement,
+            prs.NodeStmtReassign: self.lower_reassign,
+            prs.NodeStmtWhile: self.lower_while,
+            prs.NodeStmtDoWhile: self.lower_do_while,
+            prs.NodeStmtFor: self.lower_for,
+            prs.NodeStmtPrint: self.lower_print,
+            prs.NodeStmtBreak: self.lower_break,
+        }
+        self.expression_lowerings: dict[type, callable] = {
+            prs.NodeTerm: self.lower_term,
+            prs.NodeBinExpr: self.lower_binary_expression,
+            prs.NodeLogicExpr: self.lower_logical_expression,
+        }
+        self.logical_expression_lowerings: dict[type, callable] = {
+            prs.NodeBinExprComp: self.lower_comparison_expression,
+            prs.NodeBinExprLogic: self.lower_binary_logical_expression,
+        }
+        self.term_lowerings: dict[type, callable] = {
+            prs.NodeTermInt: self.lower_int_term,
+            prs.NodeTermIdent: self.lower_ident_term,
+            prs.NodeTermBool: self.lower_bool_term,
+            prs.NodeTermParen: self.lower_paren_term,
+            prs.NodeTermNot: self.lower_not_term,
+        }
+        # conditions that jump to their blocks without being turned into a 1 or 0, looked up by the node inside the expression
+        self.condition_lowerings: dict[type, callable] = {
+            prs.NodeBinExprLogic: self.lower_logic_condition,
+            prs.NodeTermNot: self.lower_not_condition,
+            prs.NodeTermParen: self.lower_paren_condition,
+        }
+        self.reassign_lowerings: dict[type, callable] = {
+            prs.NodeStmtReassignEq: self.lower_reassign_eq,
+            prs.NodeStmtReassignInc: self.lower_reassign_step,
+            prs.NodeStmtReassignDec: self.lower_reassign_step,
+        }
+
+    def emit(self, opcode: str, *args, dest: bool = True) -> ir.Temp | None:
+        """
+        adds an instruction to the current block, returns its new dest temp (None when dest is False)
+        """
+        temp = self.function.new_temp() if dest else None
+        self.block.instructions.append(ir.Instruction(opcode, temp, args))
+        return temp
+
+    def start_block(self, block: ir.Block) -> None:
+        """
+        continues in the block, it goes after every block laid out so far
+        """
+        self.function.blocks.append(block)
+        self.block = block
+
+    def terminate(self, opcode: str, *args) -> None:
+        """
+        ends the current block, whatever is lowered after this goes into a new block that nothing jumps to
+        """
+        self.emit(opcode, *args, dest=False)
+        self.start_block(self.function.new_block())
+
+    def register_need(self, expression: prs.NodeExpr | prs.NodeTerm) -> int:
+        """
+        the Sethi-Ullman number of an expression: how many registers evaluating it takes without spilling,
+        computed once for every node and remembered, a right hand side that is a literal needs none because its an immediate,
+        the side that needs more is lowered first so the generator keeps fewer temps alive at once
+        """
+        need = self.register_needs.get(id(expression))
+        if need is not None:
+            return need
+        node = expression.var
+        if isinstance(expression, prs.NodeTerm):
+            if isinstance(node, prs.NodeTermParen):
+                need = self.register_need(node.expr)
+            elif isinstance(node, prs.NodeTermNot):
+                need = self.register_need(node.term)
+            else:
+                need = 1
+        elif isinstance(node, prs.NodeTerm):
+            need = self.register_need(node)
+        else:
+            operation = node.var
+            lhs_need = self.register_need(operation.lhs)
+            rhs_need = 0 if self.literal_value(operation.rhs) is not None else self.register_need(operation.rhs)
+            need = lhs_need + 1 if lhs_need == rhs_need else max(lhs_need, rhs_need)
+        self.register_needs[id(expression)] = need
+        return need
+
+    def literal_value(self, expression: prs.NodeExpr) -> int | None:
+        term = expression.var
+        if isinstance(term, prs.NodeTerm) and isinstance(term.var, prs.NodeTermInt):
+            value = int(term.var.int_lit.value)
+            return wrap(-value if term.negative else value)
+        return None
+
+    def evaluate(self, expression: prs.NodeExpr) -> ir.Temp | ir.Const:
+        """
+        lowers an expression and returns the temp (or constant) that holds its value
+        """
+        self.register_need(expression)
+        value = self.lower_expression(expression)
+        self.register_needs.clear()
+        return value
+
+    def lower_operands(self, operation) -> tuple[ir.Temp | ir.Const, ir.Temp | ir.Const]:
+        """
+        lowers both sides of a binary operation, the one that needs more registers first
+        """
+        if self.register_need(operation.lhs) >= self.register_need(operation.rhs):
+            lhs = self.lower_expression(operation.lhs)
+            return lhs, self.lower_expression(operation.rhs)
+        rhs = self.lower_expression(operation.rhs)
+        return self.lower_expression(operation.lhs), rhs
+
+    def lower_expression(self, expression: prs.NodeExpr) -> ir.Temp | ir.Const:
+        return self.expression_lowerings[type(expression.var)](expression.var)
+
+    def lower_term(self, term: prs.NodeTerm) -> ir.Temp | ir.Const:
+        if Trace.codegen >= 2:
+            Trace.record("codegen", "term", term=term.var)
+        return self.term_lowerings[type(term.var)](term)
+
+    def negated(self, term: prs.NodeTerm, value: ir.Temp | ir.Const) -> ir.Temp | ir.Const:
+        if not term.negative:
+            return value
+        if type(value) is ir.Const:
+            return ir.Const(wrap(-value.value))
+        return self.emit("neg", value)
+
+    def lower_int_term(self, term: prs.NodeTerm) -> ir.Const:
+        return self.negated(term, ir.Const(wrap(int(term.var.int_lit.value))))
+
+    def lower_ident_term(self, term: prs.NodeTerm) -> ir.Temp:
+        if term.var.ident.value not in self.variables:
+            self.raise_error_at(term.var.ident, "Value", f"variable was not declared: {term.var.ident.value}")
+        return self.negated(term, self.emit("load", self.variables[term.var.ident.value]))
+
+    def lower_bool_term(self, term: prs.NodeTerm) -> ir.Const:
+        return ir.Const(int(term.var.bool.value)) # a minus in front of a bool is ignored
+
+    def lower_paren_term(self, term: prs.NodeTerm) -> ir.Temp | ir.Const:
+        return self.negated(term, self.lower_expression(term.var.expr))
+
+    def lower_not_term(self, term: prs.NodeTerm) -> ir.Temp:
+        return self.emit("not", self.lower_term(term.var.term))
+
+    def lower_comparison_expression(self, comparison: prs.NodeBinExprComp) -> ir.Temp:
+        opcode = comparison_opcodes[comparison.comp_sign.type]
+        if opcode is None:
+            self.raise_error_at(comparison.comp_sign, "Syntax", "Invalid comparison expression")
+        return self.emit(opcode, *self.lower_operands(comparison))
+
+    def lower_binary_logical_expression(self, logic_expr: prs.NodeBinExprLogic) -> ir.Temp:
+        opcode = logic_opcodes[logic_expr.logical_operator.type]
+        if opcode is None:
+            self.raise_error_at(logic_expr.logical_operator, "Syntax", "Invalid logic expression")
+        return self.emit(opcode, *self.lower_operands(logic_expr))
+
+    def lower_binary_expression(self, bin_expr: prs.NodeBinExpr) -> ir.Temp:
+        opcode = arithmetic_opcodes.get(type(bin_expr.var))
+        if opcode is None:
+            self.raise_error("Generator", "failed to generate binary expression")
+        return self.emit(opcode, *self.lower_operands(bin_expr.var))
+
+    def lower_logical_expression(self, expression: prs.NodeLogicExpr) -> ir.Temp:
+        return self.logical_expression_lowerings[type(expression.var)](expression.var)
+
+    def lower_condition(self, expression: prs.NodeExpr, true_block: ir.Block, false_block: ir.Block) -> None:
+        """
+        ends the current block with branches to true_block or false_block, aj and abo skip their rhs when the lhs decides
+        and ne swaps the blocks, anything else is evaluated and branched on (the generator jumps on the flags of a comparison)
+        """
+        lowering = self.condition_lowerings.get(type(expression.var.var))
+        if lowering is None:
+            self.emit("branch", self.evaluate(expression), true_block, false_block, dest=False)
+        else:
+            lowering(expression.var.var, true_block, false_block)
+
+    def lower_logic_condition(self, logic_expr: prs.NodeBinExprLogic, true_block: ir.Block, false_block: ir.Block) -> None:
+        opcode = logic_opcodes[logic_expr.logical_operator.type]
+        if opcode is None:
+            self.raise_error_at(logic_expr.logical_operator, "Syntax", "Invalid logic expression")
+        rhs_block = self.function.new_block()
+        if opcode == "and":
+            self.lower_condition(logic_expr.lhs, rhs_block, false_block)
+        else:
+            self.lower_condition(logic_expr.lhs, true_block, rhs_block)
+        self.start_block(rhs_block)
+        self.lower_condition(logic_expr.rhs, true_block, false_block)
+
+    def lower_not_condition(self, not_term: prs.NodeTermNot, true_block: ir.Block, false_block: ir.Block) -> None:
+        self.lower_condition(prs.NodeExpr(not_term.term), false_block, true_block)
+
+    def lower_paren_condition(self, paren: prs.NodeTermParen, true_block: ir.Block, false_block: ir.Block) -> None:
+        self.lower_condition(paren.expr, true_block, false_block) # a minus in front doesn't change whether its 0
+
+    def lower_scope(self, scope: prs.NodeScope) -> None:
+        self.scopes.append([])
+        for stmt in scope.stmts:
+            self.lower_statement(stmt)
+        self.end_scope()
+
+    def end_scope(self) -> None:
+        """
+        forgets the names of the innermost scope, their slots can be reused by the slots created after this
+        """
+        for name in self.scopes.pop():
+            self.variables.pop(name).scope_end = len(self.function.slots)
+
+    def lower_statement(self, statement: prs.NodeStmt) -> None:
+        self.statement_lowerings[type(statement.stmt_var)](statement.stmt_var)
+
+    def lower_let(self, let_stmt: prs.NodeStmtLet) -> None:
+        if let_stmt.ident.value in self.variables:
+            self.raise_error_at(let_stmt.ident, "Syntax", f"variable has been already declared: {let_stmt.ident.value}")
+
+        if let_stmt.type_.type == tt.let:
+            size = 8
+            if isinstance(let_stmt.expr.var, prs.NodeLogicExpr):
+                self.raise_error_at(let_stmt.ident, "Unexpected", "what ")
+        elif let_stmt.type_.type == tt.bool_def:
+            size = 2
+            if isinstance(let_stmt.expr.var, prs.NodeBinExpr):
+                self.raise_error_at(let_stmt.ident, "Unexpected", "what ")
+        else:
+            assert False
+        value = self.evaluate(let_stmt.expr)
+        slot = self.function.new_slot(let_stmt.ident.value, size)
+        slot.scope_start = slot.number
+        self.emit("store", slot, value, dest=False)
+        self.variables[let_stmt.ident.value] = slot
+        if self.scopes:
+            self.scopes[-1].append(let_stmt.ident.value)
+
+    def lower_reassign(self, reassign_stmt: prs.NodeStmtReassign) -> None:
+        if reassign_stmt.var.ident.value not in self.variables:
+            self.raise_error_at(reassign_stmt.var.ident, "Value", "undeclared identifier: " + reassign_stmt.var.ident.value)
+        self.reassign_lowerings[type(reassign_stmt.var)](reassign_stmt.var)
+
+    def lower_reassign_eq(self, reassign: prs.NodeStmtReassignEq) -> None:
+        self.emit("store", self.variables[reassign.ident.value], self.evaluate(reassign.expr), dest=False)
+
+    def lower_reassign_step(self, reassign: prs.NodeStmtReassignInc | prs.NodeStmtReassignDec) -> None:
+        self.emit("inc" if type(reassign) is prs.NodeStmtReassignInc else "dec", self.variables[reassign.ident.value], dest=False)
+
+    def lower_exit(self, exit_stmt: prs.NodeStmtExit) -> None:
+        self.terminate("exit", self.evaluate(exit_stmt.expr))
+
+    def lower_print(self, print_stmt: prs.NodeStmtPrint) -> None:
+        if isinstance(print_stmt.content, prs.NodeTermChar):
+            value = ir.Const(int(print_stmt.content.char.value))
+        else:
+            value = self.evaluate(print_stmt.content)
+        self.emit("print_number" if print_stmt.decimal else "print", value, dest=False)
+
+    def lower_if_statement(self, if_stmt: prs.NodeStmtIf) -> None:
+        end_block = self.function.new_block()
+        self.lower_branches(if_stmt.expr, if_stmt.scope, if_stmt.ifpred, end_block)
+        self.start_block(end_block)
+
+    def lower_branches(self, condition: prs.NodeExpr, scope: prs.NodeScope, pred: prs.NodeIfPred | None, end_block: ir.Block) -> None:
+        """
+        lowers a kec or an ikec and the ikec and inac after it, every branch jumps to end_block when its done
+        """
+        then_block = self.function.new_block()
+        next_block = self.function.new_block() if pred is not None else end_block
+        self.lower_condition(condition, then_block, next_block)
+        self.start_block(then_block)
+        self.lower_scope(scope)
+        self.emit("jump", end_block, dest=False)
+        if pred is None:
+            return
+        self.start_block(next_block)
+        if isinstance(pred.var, prs.NodeIfPredElif):
+            self.lower_branches(pred.var.expr, pred.var.scope, pred.var.pred, end_block)
+        else:
+            self.lower_scope(pred.var.scope)
+            self.emit("jump", end_block, dest=False)
+
+    def lower_loop(self, condition: prs.NodeExpr, body, test_first: bool) -> None:
+        """
+        lowers a loop, the condition is tested before every run of the body (kim, furt) or after it (zrob kim),
+        body lowers what runs every time (the scope and for furt the step)
+        """
+        test_block = self.function.new_block()
+        body_block = self.function.new_block()
+        exit_block = self.function.new_block()
+        self.emit("jump", test_block if test_first else body_block, dest=False)
+        if test_first:
+            self.start_block(test_block)
+            self.lower_condition(condition, body_block, exit_block)
+        self.loop_exits.append(exit_block)
+        self.start_block(body_block)
+        body()
+        self.loop_exits.pop()
+        self.emit("jump", test_block, dest=False)
+        if not test_first:
+            self.start_block(test_block)
+            self.lower_condition(condition, body_block, exit_block)
+        self.start_block(exit_block)
+
+    def lower_while(self, while_stmt: prs.NodeStmtWhile) -> None:
+        self.lower_loop(while_stmt.expr, lambda: self.lower_scope(while_stmt.scope), test_first=True)
+
+    def lower_do_while(self, do_while_stmt: prs.NodeStmtDoWhile) -> None:
+        self.lower_loop(do_while_stmt.expr, lambda: self.lower_scope(do_while_stmt.scope), test_first=False)
+
+    def lower_for(self, for_stmt: prs.NodeStmtFor) -> None:
+        self.scopes.append([]) # the loop variable only exists inside the loop
+        self.lower_let(for_stmt.ident_def)
+
+        def body() -> None:
+            self.lower_scope(for_stmt.scope)
+            self.lower_reassign(for_stmt.ident_assign)
+
+        self.lower_loop(prs.NodeExpr(prs.NodeLogicExpr(for_stmt.condition)), body, test_first=True)
+        self.end_scope()
+
+    def lower_break(self, break_stmt: prs.NodeStmtBreak) -> None:
+        if not self.loop_exits:
+            self.raise_error_at(break_stmt.token, "Syntax", "cant break out of a loop when not inside one")
+        self.terminate("jump", self.loop_exits[-1])
+
+    def lower_program(self, program: prs.NodeProgram) -> ir.Function:
+        """
+        lowers every statement, the program ends with exit 0 when it runs past its last statement
+        """
+        for stmt in program.stmts:
+            self.lower_statement(stmt)
+        self.emit("exit", ir.Const(0), dest=False)
+        if Trace.codegen:
+            Trace.record("codegen", "lowered", blocks=len(self.function.blocks), instructions=self.function.instruction_count(), slots=len(self.function.slots))
+        return self.function
@@ -1,9 +1,12 @@
 #TODO: fix the end lines acting weird while parsing, with if statements, scopes, etc.
 #TODO: implement proper parsing for booleans and boolean expressions
 from dataclasses import dataclass
+from collections import deque
+from typing import Callable, Iterable, Iterator
 from hdzlexer import Token
 import hdztokentypes as tt
-from hdzerrors import ErrorHandler
+from hdzerrors import ErrorHandler, LineIndex
+from hdztrace import Trace
 
 
 @dataclass(slots=True)
@@ -197,12 +200,13 @@ class NodeStmtFor:
 
 @dataclass(slots=True)
 class NodeStmtBreak:
-    pass
+    token: Token
 
 
 @dataclass(slots=True)
 class NodeStmtPrint:
     content: NodeExpr | NodeTermChar
+    decimal: bool = False # hutorcislo writes the value as a decimal number instead of a byte
 
 
 @dataclass(slots=True)
@@ -220,25 +224,79 @@ class NodeProgram:
 
 
 
+# builds the expression node for a binary or logical operator, indexed by the token type of the operator
+binary_expression_makers: list[Callable[[Token, NodeExpr, NodeExpr], NodeBinExpr | NodeLogicExpr] | None] = [None] * tt.token_type_count
+binary_expression_makers[tt.plus] = lambda op, lhs, rhs: NodeBinExpr(NodeBinExprAdd(lhs, rhs))
+binary_expression_makers[tt.minus] = lambda op, lhs, rhs: NodeBinExpr(NodeBinExprSub(lhs, rhs))
+binary_expression_makers[tt.star] = lambda op, lhs, rhs: NodeBinExpr(NodeBinExprMulti(lhs, rhs))
+binary_expression_makers[tt.slash] = lambda op, lhs, rhs: NodeBinExpr(NodeBinExprDiv(lhs, rhs))
+binary_expression_makers[tt.percent] = lambda op, lhs, rhs: NodeBinExpr(NodeBinExprMod(lhs, rhs))
+for comparison in (tt.is_equal, tt.is_not_equal, tt.larger_than, tt.less_than, tt.larger_than_or_eq, tt.less_than_or_eq):
+    binary_expression_makers[comparison] = lambda op, lhs, rhs: NodeLogicExpr(NodeBinExprComp(op, lhs, rhs))
+for logical_operator in (tt.and_, tt.or_):
+    binary_expression_makers[logical_operator] = lambda op, lhs, rhs: NodeLogicExpr(NodeBinExprLogic(op, lhs, rhs))
+
+
 class Parser(ErrorHandler):
-    def __init__(self, tokens, file_content):
-        super().__init__(file_content)
+    lookahead: int = 2 # how many tokens past the current one can be peeked at with get_token_at
+
+    def __init__(self, tokens: Iterable[Token], file_content, line_index: LineIndex | None = None):
+        super().__init__(file_content, line_index)
         self.index: int = -1
-        self.column_number = -1 # -1 means that theres no column number tracked
-        self.all_tokens: list = tokens
+        self.tokens: Iterator[Token] = iter(tokens) # a list or a token stream straight from Tokenizer.iter_tokens
+        self.buffer: deque[Token] = deque(maxlen=self.lookahead) # tokens already pulled from the stream but not parsed yet
         self.current_token: Token = None
+
+        # parse methods indexed by the token type that starts the statement or term, None if nothing can start with it,
+        # '(' and 'ne' are prefixes handled by parse_expr itself
+        self.statement_parsers: list[Callable[[], object] | None] = [None] * tt.token_type_count
+        for token_type, statement_parser in (
+            (tt.exit_, self.parse_exit), (tt.print_, self.parse_print), (tt.print_number, self.parse_print), (tt.let, self.parse_let), (tt.bool_def, self.parse_let),
+            (tt.left_curly, self.parse_scope), (tt.if_, self.parse_if), (tt.identifier, self.parse_reassign),
+            (tt.while_, self.parse_while), (tt.for_, self.parse_for_loop), (tt.do, self.parse_do_while), (tt.break_, self.parse_break),
+        ):
+            self.statement_parsers[token_type] = statement_parser
+        self.term_parsers: list[Callable[[bool], NodeTerm] | None] = [None] * tt.token_type_count
+        for token_type, term_parser in (
+            (tt.int_lit, self.parse_int_term), (tt.identifier, self.parse_ident_term),
+            (tt.true, self.parse_bool_term), (tt.false, self.parse_bool_term),
+        ):
+            self.term_parsers[token_type] = term_parser
+
         self.next_token()
 
     def next_token(self):
-        if self.current_token is not None and self.current_token.type == tt.end_line:
-            self.line_number += 1
         self.index += 1
-        self.current_token = self.all_tokens[self.index] if self.index < len(self.all_tokens) else None
+        self.current_token = self.buffer.popleft() if self.buffer else next(self.tokens, None)
 
     def get_token_at(self, offset: int = 0) -> Token | None:
-        return self.all_tokens[self.index + offset] if self.index + offset < len(self.all_tokens) else None
+        """
+        peeks at the token offset tokens after the current one without consuming anything,
+        only offsets up to the lookahead are supported so the parser never holds more than a few tokens
+        """
+        if offset == 0:
+            return self.current_token
+        if not 0 < offset <= self.lookahead:
+            raise ValueError(f"lookahead offset out of range: {offset}")
+        while len(self.buffer) < offset:
+            token = next(self.tokens, None)
+            if token is None:
+                return None
+            self.buffer.append(token)
+        return self.buffer[offset - 1]
     
-    def try_throw_error(self, token_type: str, error_name: str, error_details: str) -> None:
+    def raise_error(self, type: str, details: str) -> None:
+        """
+        parsing errors always point at the current token, or at the end of the file if theres no token left
+        """
+        self.move_to(self.current_token.start if self.current_token is not None else len(self.file_content))
+        super().raise_error(type, details)
+
+    def skip_end_lines(self) -> None:
+        while self.current_token is not None and self.current_token.type == tt.end_line:
+            self.next_token()
+
+    def try_throw_error(self, token_type: int, error_name: str, error_details: str) -> None:
         """
         checks if the current token is none or if its type is not the token type given,
         raises an error if the condition is true
@@ -255,101 +313,103 @@ class Parser(ErrorHandler):
         else:
             return None
 
-    def parse_term(self) -> NodeTerm | None:
-        is_negative = False
-        if self.current_token is not None and self.current_token.type == tt.minus:
-            is_negative = True
-            self.next_token()
+    def parse_int_term(self, is_negative: bool) -> NodeTerm:
+        return NodeTerm(NodeTermInt(int_lit=self.current_token), is_negative)
 
-        if self.current_token is not None and self.current_token.type == tt.int_lit:
-            return NodeTerm(NodeTermInt(int_lit=self.current_token), is_negative)
-        elif self.current_token is not None and self.current_token.type == tt.identifier:
-            return NodeTerm(NodeTermIdent(ident=self.current_token), is_negative)
-        elif self.current_token is not None and self.current_token.type == tt.true:
-            self.current_token.value = 1
-            return NodeTerm(NodeTermBool(bool=self.current_token), is_negative)
-        elif self.current_token is not None and self.current_token.type == tt.false:
-            self.current_token.value = 0
-            return NodeTerm(NodeTermBool(bool=self.current_token), is_negative)
-        elif self.current_token is not None and self.current_token.type == tt.left_paren:
-            self.next_token()
-            expr = self.parse_expr()
-            if expr is None:
-                self.raise_error("Value", "expected expression")
+    def parse_ident_term(self, is_negative: bool) -> NodeTerm:
+        return NodeTerm(NodeTermIdent(ident=self.current_token), is_negative)
 
-            self.try_throw_error(tt.right_paren, "Syntax", "expected ')'")
+    def parse_bool_term(self, is_negative: bool) -> NodeTerm:
+        self.current_token.value = 1 if self.current_token.type == tt.true else 0
+        return NodeTerm(NodeTermBool(bool=self.current_token), is_negative)
 
-            return NodeTerm(NodeTermParen(expr), is_negative)
-        elif self.current_token is not None and self.current_token.type == tt.not_:
-            self.next_token()
-            
-            term = self.parse_term()
-            if term is None:
-                self.raise_error("Value", "expected term")
-            
-            return NodeTerm(var=NodeTermNot(term=term))
-        else:
-            return None
-
-    def parse_expr(self, min_prec: int = 0) -> NodeExpr | None:
-        term_lhs = self.parse_term()
-        
-        if term_lhs is None:
-            return None
-        self.next_token()
-
-        expr_lhs = NodeExpr(var=term_lhs)
+    def parse_expr(self) -> NodeExpr | None:
+        """
+        parses an expression with an explicit stack of operands and a stack of operators (shunting yard),
+        so long expressions and deep parentheses don't recurse at all and every token is pushed and popped once,
+        returns None if theres no expression at the current token
+        """
+        operands: list[NodeExpr] = []
+        operators: list[tuple[Token, bool]] = [] # binary operators, '(' and 'ne' tokens, with the minus sign in front of them
+        open_parens: int = 0
 
         while True:
-            op: Token | None = self.current_token
-            prec: int | None = tt.get_prec_level(op.type)
+            # a term is expected, with any amount of prefixes before it
+            is_negative = False
+            if self.current_token is not None and self.current_token.type == tt.minus:
+                is_negative = True
+                self.next_token()
 
-            if op is None or prec is None or prec < min_prec:
-                break
+            token = self.current_token
+            if token is not None and token.type in (tt.left_paren, tt.not_):
+                operators.append((token, is_negative))
+                if token.type == tt.left_paren:
+                    open_parens += 1
+                self.next_token()
+                continue
 
-            next_min_prec: int = prec + 1
+            term_parser = self.term_parsers[token.type] if token is not None else None
+            if term_parser is None:
+                if not operands and not operators and not is_negative:
+                    return None
+                self.raise_error("Value", "expected term")
+            term = term_parser(is_negative)
             self.next_token()
+            operands.append(NodeExpr(var=self.apply_not_prefixes(term, operators)))
+
+            # a binary operator or a closing parenthesis is expected, otherwise the expression ends
+            while True:
+                op: Token | None = self.current_token
+                prec: int | None = tt.precedence[op.type] if op is not None else None
+
+                if prec is not None:
+                    self.reduce_operators(operands, operators, prec)
+                    operators.append((op, False))
+                    self.next_token()
+                    break
+                elif op is not None and op.type == tt.right_paren and open_parens > 0:
+                    self.reduce_operators(operands, operators, 0)
+                    _, is_negative = operators.pop() # the matching '('
+                    open_parens -= 1
+                    self.next_token()
+
+                    inner = operands.pop()
+                    if is_negative:
+                        term = NodeTerm(NodeTermParen(inner), is_negative)
+                    elif isinstance(inner.var, NodeTerm):
+                        term = inner.var # parentheses around a single term don't need a node
+                    else:
+                        term = NodeTerm(NodeTermParen(inner))
+                    operands.append(NodeExpr(var=self.apply_not_prefixes(term, operators)))
+                else:
+                    if open_parens > 0:
+                        self.raise_error("Syntax", "expected ')'")
+                    self.reduce_operators(operands, operators, 0)
+                    return operands[0]
+
+    def apply_not_prefixes(self, term: NodeTerm, operators: list[tuple[Token, bool]]) -> NodeTerm:
+        """
+        wraps a finished term in the 'ne' prefixes that are waiting right before it on the operator stack
+        """
+        while operators and operators[-1][0].type == tt.not_:
+            operators.pop()
+            term = NodeTerm(var=NodeTermNot(term=term))
+        return term
+
+    def reduce_operators(self, operands: list[NodeExpr], operators: list[tuple[Token, bool]], min_prec: int) -> None:
+        """
+        builds nodes for the binary operators on top of the stack while their precedence is at least min_prec,
+        stops at a '(' because it has no precedence
+        """
+        while operators:
+            op = operators[-1][0]
+            prec = tt.precedence[op.type]
+            if prec is None or prec < min_prec:
+                break
+            operators.pop()
+            rhs = operands.pop()
+            operands[-1] = NodeExpr(var=binary_expression_makers[op.type](op, operands[-1], rhs))
 
-            expr_rhs = self.parse_expr(next_min_prec)
-
-            if expr_rhs is None:
-                self.raise_error("Value", "unable to parse expression")
-
-            expr = NodeBinExpr(None) if op.type in (tt.plus, tt.minus, tt.star, tt.slash, tt.percent) else NodeLogicExpr(None)
-            expr_lhs2 = NodeExpr(None) # prevents a recursion error, god knows why but it makes it work
-            if op.type == tt.plus:
-                expr_lhs2.var = expr_lhs.var
-                add = NodeBinExprAdd(lhs=expr_lhs2, rhs=expr_rhs)
-                expr.var = add
-            elif op.type == tt.star:
-                expr_lhs2.var = expr_lhs.var
-                multi = NodeBinExprMulti(lhs=expr_lhs2, rhs=expr_rhs)
-                expr.var = multi
-            elif op.type == tt.minus:
-                expr_lhs2.var = expr_lhs.var
-                sub = NodeBinExprSub(lhs=expr_lhs2, rhs=expr_rhs)
-                expr.var = sub
-            elif op.type == tt.slash:
-                expr_lhs2.var = expr_lhs.var
-                div = NodeBinExprDiv(lhs=expr_lhs2, rhs=expr_rhs)
-                expr.var = div
-            elif op.type == tt.percent:
-                expr_lhs2.var = expr_lhs.var
-                mod = NodeBinExprMod(lhs=expr_lhs2, rhs=expr_rhs)
-                expr.var = mod
-            elif op.type in (tt.is_equal, tt.is_not_equal, tt.larger_than, tt.less_than, tt.larger_than_or_eq, tt.less_than_or_eq):
-                expr_lhs2.var = expr_lhs.var
-                comp = NodeBinExprComp(lhs=expr_lhs2, rhs=expr_rhs, comp_sign=op)
-                expr.var = comp
-            elif op.type == tt.and_ or op.type == tt.or_:
-                expr_lhs2.var = expr_lhs.var
-                log = NodeBinExprLogic(lhs=expr_lhs2, rhs=expr_rhs, logical_operator=op)
-                expr.var = log
-            else:
-                assert False # unreachable
-            expr_lhs.var = expr
-        return expr_lhs
-    
     def parse_let(self) -> NodeStmtLet:
         type_def = self.current_token
         self.next_token() # removes type def
@@ -399,13 +459,14 @@ class Parser(ErrorHandler):
         self.next_token()  # left curly
 
         scope = NodeScope(stmts=[])
-        while stmt := self.parse_statement():
-            scope.stmts.append(stmt)
-            if self.current_token and self.current_token.type == tt.right_curly:
+        while True:
+            self.skip_end_lines()
+            if self.current_token is None:
+                self.raise_error("Syntax", "expected '}'")
+            if self.current_token.type == tt.right_curly:
                 self.next_token() # right curly
                 break
-        else:
-            self.raise_error("Syntax", "expected '}'")
+            scope.stmts.append(self.parse_statement())
         
         if self.current_token is not None and self.current_token.type == tt.end_line:
             self.next_token()
@@ -422,8 +483,7 @@ class Parser(ErrorHandler):
             
             scope = self.parse_scope()
 
-            while self.current_token is not None and self.current_token.type == tt.end_line:
-                self.next_token()
+            self.skip_end_lines()
 
             ifpred = self.parse_ifpred()
 
@@ -446,8 +506,7 @@ class Parser(ErrorHandler):
         
         scope = self.parse_scope()
 
-        while self.current_token is not None and self.current_token.type == tt.end_line:
-            self.next_token()
+        self.skip_end_lines()
 
         ifpred = self.parse_ifpred()
         return NodeStmtIf(expr, scope, ifpred)
@@ -533,6 +592,7 @@ class Parser(ErrorHandler):
         return NodeStmtReassign(var=NodeStmtReassignEq(ident, expr))
 
     def parse_print(self) -> NodeStmtPrint:
+        decimal = self.current_token.type == tt.print_number
         self.next_token() # removes print token
 
         self.try_throw_error(tt.left_paren, "Syntax", "expected '('")
@@ -552,41 +612,29 @@ class Parser(ErrorHandler):
         if self.current_token is not None and self.current_token.type not in (tt.end_line, tt.right_curly):
             self.raise_error("Syntax", "expected endline")
         
-        return NodeStmtPrint(cont)
+        return NodeStmtPrint(cont, decimal)
     
+    def parse_break(self) -> NodeStmtBreak:
+        statement = NodeStmtBreak(self.current_token)
+        self.next_token()
+        return statement
+
     def parse_statement(self) -> NodeStmt | None:
         if self.current_token is None:
             return None
-        elif self.current_token.type == tt.end_line:
-            statement = "new_line"
-            self.next_token()
-        elif self.current_token.type == tt.exit_:
-            statement = self.parse_exit()
-        elif self.current_token.type == tt.print_:
-            statement = self.parse_print()
-        elif self.current_token.type in (tt.let, tt.bool_def):
-            statement = self.parse_let()
-        elif self.current_token.type == tt.left_curly:
-            statement = self.parse_scope()
-        elif self.current_token.type == tt.if_:
-            statement = self.parse_if()
-        elif self.current_token.type == tt.identifier:
-            statement = self.parse_reassign()
-        elif self.current_token.type == tt.while_:
-            statement = self.parse_while()
-        elif self.current_token.type == tt.for_:
-            statement = self.parse_for_loop()
-        elif self.current_token.type == tt.do:
-            statement = self.parse_do_while()
-        elif self.current_token.type == tt.break_:
-            self.next_token()
-            statement = NodeStmtBreak()
-        else:
+        statement_parser = self.statement_parsers[self.current_token.type]
+        if statement_parser is None:
             self.raise_error("Parsing", "cannot parse program correctly")
-        return NodeStmt(stmt_var=statement)
+        return NodeStmt(stmt_var=statement_parser())
 
     def parse_program(self) -> NodeProgram:
         program: NodeProgram = NodeProgram(stmts=[])
+        self.skip_end_lines()
         while self.current_token is not None:
             program.stmts.append(self.parse_statement())
+            if Trace.parser >= 2:
+                Trace.record("parser", "statement", statement=program.stmts[-1])
+            self.skip_end_lines()
+        if Trace.parser:
+            Trace.record("parser", "done", statements=len(program.stmts))
         return program
@@ -0,0 +1,487 @@
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Callable, TextIO
+import hdzir as ir
+from hdztiming import PassTimer
+
+
+def fold_constant_branches(function: ir.Function) -> int:
+    """
+    turns a branch on a condition known at compile time (kec(klamstvo), kim(pravda), ...) into a jump to the block it always goes to,
+    returns how many branches it folded
+    """
+    changes = 0
+    for block in function.blocks:
+        terminator = block.terminator
+        if terminator.opcode == "branch" and type(terminator.args[0]) is ir.Const:
+            target = terminator.args[1] if terminator.args[0].value != 0 else terminator.args[2]
+            block.instructions[-1] = ir.Instruction("jump", None, (target,))
+            changes += 1
+    return changes
+
+
+def remove_unreachable_blocks(function: ir.Function) -> int:
+    """
+    drops the blocks no path from the entry reaches, the code after vychod and konec, the default exit after a vychod at the end
+    and the branches folded away, the rest keep their order, returns how many blocks it dropped
+    """
+    reachable = set(ir.reverse_postorder(function))
+    kept = [block for block in function.blocks if block in reachable]
+    removed = len(function.blocks) - len(kept)
+    function.blocks = kept
+    return removed
+
+
+def simplify_cfg(function: ir.Function) -> int:
+    """
+    sends jumps past blocks that only jump on, turns a branch whose targets are the same into a jump,
+    drops the forwarding blocks nothing jumps to anymore and merges a block into the one before it
+    when thats the only way into it, returns how many blocks and jumps it changed
+    """
+    changes = 0
+    changed = True
+    while changed:
+        changed = False
+        forwards: dict[ir.Block, ir.Block] = {}
+        for block in function.blocks[1:]:
+            if len(block.instructions) == 1 and block.terminator.opcode == "jump" and block.terminator.args[0] is not block:
+                forwards[block] = block.terminator.args[0]
+
+        def final_target(block: ir.Block) -> ir.Block:
+            seen = {block}
+            while block in forwards and forwards[block] not in seen: # a loop of forwarding blocks stays as it is
+                block = forwards[block]
+                seen.add(block)
+            return block
+
+        for block in function.blocks:
+            terminator = block.terminator
+            args = tuple(final_target(arg) if type(arg) is ir.Block else arg for arg in terminator.args)
+            if args != terminator.args:
+                terminator.args = args
+                changes += 1
+                changed = True
+            if terminator.opcode == "branch" and terminator.args[1] is terminator.args[2]:
+                block.instructions[-1] = ir.Instruction("jump", None, (terminator.args[1],))
+                changes += 1
+                changed = True
+
+        predecessors = ir.predecessors(function)
+        kept = [function.blocks[0]]
+        for block in function.blocks[1:]:
+            if block in forwards and not predecessors[block]:
+                changes += 1
+                changed = True
+                for successor in block.successors():
+                    predecessors[successor].remove(block)
+            else:
+                kept.append(block)
+        function.blocks = kept
+
+        merged: set[ir.Block] = set()
+        for block in function.blocks:
+            if block in merged:
+                continue
+            while block.terminator.opcode == "jump":
+                successor = block.terminator.args[0]
+                if successor is block or successor is function.blocks[0] or len(predecessors[successor]) != 1:
+                    break
+                block.instructions[-1:] = successor.instructions
+                for next_successor in successor.successors():
+                    predecessors[next_successor] = [block if predecessor is successor else predecessor for predecessor in predecessors[next_successor]]
+                merged.add(successor)
+                changes += 1
+                changed = True
+        function.blocks = [block for block in function.blocks if block not in merged]
+    return changes
+
+
+def boolean_temps(function: ir.Function) -> set[ir.Temp]:
+    """
+    the temps that are only ever set by instructions that result in 1 or 0
+    """
+    booleans: set[ir.Temp] = set()
+    others: set[ir.Temp] = set()
+    for block in function.blocks:
+        for instruction in block.instructions:
+            if instruction.dest is not None:
+                (booleans if instruction.opcode in ir.boolean_opcodes else others).add(instruction.dest)
+    return booleans - others
+
+
+def forward_stores(function: ir.Function) -> int:
+    """
+    inside every block a load of a slot whose value is already known (it was stored or loaded before) becomes a copy
+    and the rest of the block uses the known value straight away,
+    a bul slot only keeps the low 16 bits so only values that fit into them are forwarded,
+    returns how many loads it replaced
+    """
+    booleans = boolean_temps(function)
+    changes = 0
+    for block in function.blocks:
+        known: dict[ir.Slot, ir.Temp | ir.Const] = {}
+        replacements: dict[ir.Temp, ir.Temp | ir.Const] = {}
+        # the other way around, so a temp that is set again is forgotten without looking through everything that is known
+        holders: dict[ir.Temp, list[ir.Slot]] = {}
+        aliases: dict[ir.Temp, list[ir.Temp]] = {}
+
+        def remember(slot: ir.Slot, value: ir.Temp | ir.Const) -> None:
+            known[slot] = value
+            if type(value) is ir.Temp:
+                holders.setdefault(value, []).append(slot)
+
+        for index, instruction in enumerate(block.instructions):
+            if replacements:
+                instruction.replace_uses(replacements)
+            opcode = instruction.opcode
+            if opcode == "load":
+                slot = instruction.args[0]
+                value = known.get(slot)
+                if value is not None:
+                    block.instructions[index] = ir.Instruction("copy", instruction.dest, (value,))
+                    replacements[instruction.dest] = value
+                    if type(value) is ir.Temp:
+                        aliases.setdefault(value, []).append(instruction.dest)
+                    changes += 1
+            elif opcode == "store":
+                slot, value = instruction.args
+                if slot.size == 8 or value in booleans:
+                    remember(slot, value)
+                elif type(value) is ir.Const:
+                    remember(slot, ir.Const(value.value & 0xFFFF))
+                else:
+                    known.pop(slot, None)
+            elif opcode in ("inc", "dec"):
+                known.pop(instruction.args[0], None)
+            dest = instruction.dest
+            if dest is not None:
+                # a temp that is set again no longer has the value that was known, the first load keeps it for later
+                for slot in holders.pop(dest, ()):
+                    if known.get(slot) == dest:
+                        del known[slot]
+                for temp in aliases.pop(dest, ()):
+                    if replacements.get(temp) == dest:
+                        del replacements[temp]
+                if opcode == "load" and dest not in replacements:
+                    remember(instruction.args[0], dest)
+    return changes
+
+
+def remove_dead_temps(function: ir.Function) -> int:
+    """
+    removes the instructions that only set a temp nothing uses, until there are none left,
+    returns how many it removed
+    """
+    removed = 0
+    while True:
+        used: set[ir.Temp] = set()
+        for block in function.blocks:
+            for instruction in block.instructions:
+                used.update(instruction.uses())
+        count = 0
+        for block in function.blocks:
+            kept = [instruction for instruction in block.instructions
+                    if instruction.dest is None or instruction.dest in used or instruction.opcode in ir.side_effect_opcodes]
+            count += len(block.instructions) - len(kept)
+            block.instructions = kept
+        if count == 0:
+            return removed
+        removed += count
+
+
+promoted_slots_per_loop: int = 4 # the most variables a loop keeps in registers, more would only get spilled again
+# instructions that can run before the loop instead of inside it when their operands don't change in it,
+# div and mod aren't here because they could crash a loop that never runs
+invariant_opcodes: frozenset[str] = (ir.arithmetic_opcodes - {"div", "mod"}) | ir.comparison_opcodes | ir.logic_opcodes | {"copy", "load"}
+
+
+def redirect(block: ir.Block, old: ir.Block, new: ir.Block) -> None:
+    terminator = block.terminator
+    terminator.args = tuple(new if arg is old else arg for arg in terminator.args)
+
+
+class LoopNest:
+    """
+    the loops of a function, inner ones first, and the edits the loop passes make around them,
+    blocks added in front of a loop are laid out only in finish so adding many doesn't search the layout every time
+    """
+    def __init__(self, function: ir.Function) -> None:
+        self.function: ir.Function = function
+        self.loops: list[ir.Loop] = ir.natural_loops(function)
+        self.predecessors: dict[ir.Block, list[ir.Block]] = ir.predecessors(function)
+        self.positions: dict[ir.Block, tuple[int, int]] = {block: (index, 0) for index, block in enumerate(function.blocks)}
+        self.laid_out_before: dict[ir.Block, list[ir.Block]] = {}
+
+    def blocks(self, loop: ir.Loop) -> list[ir.Block]:
+        """
+        the blocks of the loop in the order they are laid out in, so the passes always change them in the same order
+        """
+        return sorted(loop.blocks, key=self.positions.__getitem__)
+
+    def add_block(self, loop: ir.Loop, target: ir.Block, sources: list[ir.Block]) -> ir.Block:
+        """
+        a new block that jumps to target, laid out in front of it and put on the edges from sources to target,
+        its in the other loops that have both ends of those edges
+        """
+        block = self.function.new_block()
+        block.instructions.append(ir.Instruction("jump", None, (target,)))
+        self.positions[block] = (self.positions[target][0], len(self.positions))
+        self.laid_out_before.setdefault(target, []).append(block)
+        self.predecessors[block] = []
+        for other in self.loops:
+            #NOTE: target alone isn't enough, an edge from outside a loop into its header (one loop leaving straight into the next) isn't in it
+            if other is not loop and target in other.blocks and any(source in other.blocks for source in sources):
+                other.blocks.add(block)
+        return block
+
+    def preheader(self, loop: ir.Loop) -> ir.Block:
+        """
+        the block everything that goes into the loop passes right before the header, made when the loop doesn't have one
+        """
+        header = loop.header
+        outside = [predecessor for predecessor in self.predecessors[header] if predecessor not in loop.blocks]
+        if header is not self.function.blocks[0] and len(outside) == 1 and outside[0].terminator.opcode == "jump":
+            return outside[0]
+        preheader = self.add_block(loop, header, outside)
+        for predecessor in outside:
+            redirect(predecessor, header, preheader)
+        self.predecessors[preheader] = outside
+        self.predecessors[header] = [predecessor for predecessor in self.predecessors[header] if predecessor in loop.blocks] + [preheader]
+        if header is self.function.blocks[0]:
+            self.function.blocks.insert(0, preheader) # the program starts in it now
+            self.laid_out_before[header].remove(preheader)
+        return preheader
+
+    def exit_blocks(self, loop: ir.Loop) -> list[ir.Block]:
+        """
+        puts a new block on every way out of the loop, the loop blocks jumping to the same block share one
+        """
+        exits: dict[ir.Block, ir.Block] = {}
+        for block in self.blocks(loop):
+            for successor in dict.fromkeys(block.successors()):
+                if successor in loop.blocks:
+                    continue
+                exit_block = exits.get(successor)
+                if exit_block is None:
+                    exit_block = exits[successor] = self.add_block(loop, successor, [block])
+                redirect(block, successor, exit_block)
+                self.predecessors[exit_block].append(block)
+                self.predecessors[successor] = [predecessor for predecessor in self.predecessors[successor] if predecessor is not block]
+        for successor, exit_block in exits.items():
+            self.predecessors[successor].append(exit_block)
+        return list(exits.values())
+
+    def finish(self) -> None:
+        if not self.laid_out_before:
+            return
+        blocks: list[ir.Block] = []
+
+        def lay_out(block: ir.Block) -> None:
+            for added in self.laid_out_before.get(block, ()): # an added block can have blocks in front of it too (an outer loop leaving through an inner loops exit)
+                lay_out(added)
+            blocks.append(block)
+
+        for block in self.function.blocks:
+            lay_out(block)
+        self.function.blocks = blocks
+
+
+def promote_loop_variables(function: ir.Function) -> int:
+    """
+    keeps the naj variables a loop changes (the furt counter, sums, ...) in a temp for the whole loop, so they live in a register
+    instead of going through the stack every time, the temp is loaded before the loop and stored back on every way out of it,
+    inner loops go first, returns how many variables it promoted
+    """
+    nest = LoopNest(function)
+    promoted_count = 0
+    for loop in nest.loops:
+        accesses: dict[ir.Slot, int] = {}
+        changed: set[ir.Slot] = set()
+        for block in nest.blocks(loop):
+            for instruction in block.instructions:
+                if instruction.opcode in ("load", "store", "inc", "dec"):
+                    slot = instruction.args[0]
+                    accesses[slot] = accesses.get(slot, 0) + 1
+                    if instruction.opcode != "load":
+                        changed.add(slot)
+        candidates = sorted((slot for slot in changed if slot.size == 8), key=lambda slot: (-accesses[slot], slot.number))
+        if not candidates:
+            continue
+        #NOTE: a bul isn't promoted because storing into it cuts the value to 16 bits, which the temp wouldn't do
+        temps = {slot: function.new_temp() for slot in candidates[:promoted_slots_per_loop]}
+        for block in loop.blocks:
+            for index, instruction in enumerate(block.instructions):
+                opcode = instruction.opcode
+                if opcode not in ("load", "store", "inc", "dec") or instruction.args[0] not in temps:
+                    continue
+                temp = temps[instruction.args[0]]
+                if opcode == "load":
+                    block.instructions[index] = ir.Instruction("copy", instruction.dest, (temp,))
+                elif opcode == "store":
+                    block.instructions[index] = ir.Instruction("copy", temp, (instruction.args[1],))
+                else:
+                    block.instructions[index] = ir.Instruction("add" if opcode == "inc" else "sub", temp, (temp, ir.Const(1)))
+        preheader = nest.preheader(loop)
+        preheader.instructions[-1:-1] = [ir.Instruction("load", temp, (slot,)) for slot, temp in temps.items()]
+        for exit_block in nest.exit_blocks(loop):
+            exit_block.instructions[-1:-1] = [ir.Instruction("store", None, (slot, temp)) for slot, temp in temps.items()]
+        promoted_count += len(temps)
+    nest.finish()
+    return promoted_count
+
+
+def hoist_loop_invariants(function: ir.Function) -> int:
+    """
+    moves the instructions whose operands are the same in every run of a loop in front of it (loop invariant code motion),
+    inner loops go first so what they hoist can leave the loops around them too, returns how many instructions it moved
+    """
+    definitions: dict[ir.Temp, int] = {}
+    for block in function.blocks:
+        for instruction in block.instructions:
+            if instruction.dest is not None:
+                definitions[instruction.dest] = definitions.get(instruction.dest, 0) + 1
+    nest = LoopNest(function)
+    hoisted_count = 0
+    for loop in nest.loops:
+        blocks = nest.blocks(loop)
+        varying: set[ir.Temp] = set() # temps the loop sets
+        changed: set[ir.Slot] = set()
+        for block in blocks:
+            for instruction in block.instructions:
+                if instruction.dest is not None:
+                    varying.add(instruction.dest)
+                if instruction.opcode in ("store", "inc", "dec"):
+                    changed.add(instruction.args[0])
+        hoisted: list[ir.Instruction] = []
+        moved = True
+        while moved: # hoisting an instruction can make the ones using its dest invariant too
+            moved = False
+            for block in blocks:
+                kept = []
+                for instruction in block.instructions:
+                    if (instruction.opcode in invariant_opcodes and definitions[instruction.dest] == 1
+                            and not any(temp in varying for temp in instruction.uses())
+                            and not (instruction.opcode == "load" and instruction.args[0] in changed)):
+                        hoisted.append(instruction)
+                        varying.discard(instruction.dest)
+                        moved = True
+                    else:
+                        kept.append(instruction)
+                block.instructions = kept
+        if hoisted:
+            preheader = nest.preheader(loop)
+            preheader.instructions[-1:-1] = hoisted
+            hoisted_count += len(hoisted)
+    nest.finish()
+    return hoisted_count
+
+
+def propagate_copies(function: ir.Function) -> int:
+    """
+    inside every block the uses of a temp that is a copy of another one (set only by that copy) read the original instead,
+    until the original is set again, what's left of the copy is removed by dead-temps, returns how many uses it replaced
+    """
+    definitions: dict[ir.Temp, int] = {}
+    for block in function.blocks:
+        for instruction in block.instructions:
+            if instruction.dest is not None:
+                definitions[instruction.dest] = definitions.get(instruction.dest, 0) + 1
+    changes = 0
+    for block in function.blocks:
+        copies: dict[ir.Temp, ir.Temp | ir.Const] = {}
+        copied_from: dict[ir.Temp, list[ir.Temp]] = {}
+        for instruction in block.instructions:
+            if copies:
+                uses = [temp for temp in instruction.uses() if temp in copies]
+                if uses:
+                    instruction.replace_uses(copies)
+                    changes += len(uses)
+            dest = instruction.dest
+            if dest is None:
+                continue
+            for temp in copied_from.pop(dest, ()): # the original changed, its copies keep the old value
+                if copies.get(temp) == dest:
+                    del copies[temp]
+            if instruction.opcode == "copy" and definitions[dest] == 1 and instruction.args[0] != dest:
+                source = instruction.args[0]
+                copies[dest] = source
+                if type(source) is ir.Temp:
+                    copied_from.setdefault(source, []).append(dest)
+    return changes + coalesce_copies(function, definitions)
+
+
+def coalesce_copies(function: ir.Function, definitions: dict[ir.Temp, int]) -> int:
+    """
+    "t1 = add ..., t2 = copy t1" becomes "t2 = add ..." when nothing else reads t1 and t2 isn't touched in between,
+    which is how a promoted loop variable is usually set, returns how many copies it removed
+    """
+    reads: dict[ir.Temp, int] = {}
+    for block in function.blocks:
+        for instruction in block.instructions:
+            for temp in instruction.uses():
+                reads[temp] = reads.get(temp, 0) + 1
+    removed = 0
+    for block in function.blocks:
+        defined_at: dict[ir.Temp, int] = {}
+        removed_indices: set[int] = set()
+        for index, instruction in enumerate(block.instructions):
+            if instruction.opcode == "copy" and type(instruction.args[0]) is ir.Temp:
+                source, dest = instruction.args[0], instruction.dest
+                start = defined_at.get(source)
+                if (start is not None and definitions[source] == 1 and reads[source] == 1
+                        and all(dest not in block.instructions[between].uses() and block.instructions[between].dest != dest
+                                for between in range(start + 1, index))):
+                    block.instructions[start].dest = dest
+                    removed_indices.add(index)
+                    continue
+            if instruction.dest is not None:
+                defined_at[instruction.dest] = index
+        if removed_indices:
+            block.instructions = [instruction for index, instruction in enumerate(block.instructions) if index not in removed_indices]
+            removed += len(removed_indices)
+    return removed
+
+
+@dataclass(slots=True)
+class Pass:
+    name: str
+    level: int # the lowest -O level it runs at
+    run: Callable[[ir.Function], int] # changes the function in place, returns how many changes it made
+
+
+optimization_passes: tuple[Pass, ...] = (
+    Pass("constant-branches", 1, fold_constant_branches),
+    Pass("unreachable", 1, remove_unreachable_blocks),
+    Pass("simplify-cfg", 1, simplify_cfg), # after unreachable so dead blocks don't count as a way into a block
+    Pass("forward-stores", 2, forward_stores),
+    Pass("promote-variables", 2, promote_loop_variables),
+    Pass("licm", 2, hoist_loop_invariants),
+    Pass("copies", 2, propagate_copies),
+    Pass("dead-temps", 1, remove_dead_temps),
+)
+
+
+class PassManager:
+    """
+    runs the ir passes of an optimization level in their order, -O0 runs none,
+    with a timer every pass is measured on its own, with a dump stream the ir is written to it after the lowering
+    and after every pass that changed something (--dump-ir)
+    """
+    def __init__(self, level: int, passes: tuple[Pass, ...] = optimization_passes, timer: PassTimer | None = None, dump: TextIO | None = None) -> None:
+        self.passes: list[Pass] = [optimization_pass for optimization_pass in passes if optimization_pass.level <= level]
+        self.timer: PassTimer | None = timer
+        self.dump: TextIO | None = dump
+        self.changes: dict[str, int] = {}
+
+    def run(self, function: ir.Function) -> ir.Function:
+        if self.dump is not None:
+            self.dump.write(f"; lowered\n{function}\n")
+        for optimization_pass in self.passes:
+            with self.timer.measure(optimization_pass.name) if self.timer is not None else nullcontext() as timing:
+                changes = optimization_pass.run(function)
+            if self.timer is not None:
+                timing.count, timing.unit = changes, "changes"
+            self.changes[optimization_pass.name] = changes
+            if self.dump is not None and changes:
+                self.dump.write(f"; after {optimization_pass.name} ({changes} changes)\n{function}\n")
+        return function
@@ -0,0 +1,275 @@
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable
+from hdzassembler import registers, label_pattern, strip_comment, split_operands, parse_number, fits_in_signed
+
+
+# the opposite of every condition the generator writes, for turning a setcc into the jump that skips when its false
+inverted_conditions: dict[str, str] = {
+    "e": "ne", "ne": "e", "z": "nz", "nz": "z",
+    "g": "le", "le": "g", "l": "ge", "ge": "l",
+    "a": "be", "be": "a", "b": "ae", "ae": "b",
+}
+
+
+@dataclass(slots=True)
+class Line:
+    text: str # the line as written, without the newline
+    label: str | None = None
+    mnemonic: str | None = None # None for labels, comments and empty lines
+    operands: tuple[str, ...] = ()
+
+    @property
+    def is_code(self) -> bool:
+        return self.label is not None or self.mnemonic is not None
+
+
+def parse_line(text: str) -> Line:
+    code = strip_comment(text).strip()
+    if not code:
+        return Line(text)
+    match = label_pattern.fullmatch(code)
+    if match is not None:
+        return Line(text, label=match[1])
+    mnemonic, _, rest = code.partition(" ")
+    return Line(text, mnemonic=mnemonic.lower(), operands=tuple(split_operands(rest)))
+
+
+def instruction(mnemonic: str, *operands: str) -> Line:
+    return Line(f"    {mnemonic} {', '.join(operands)}" if operands else f"    {mnemonic}", mnemonic=mnemonic, operands=operands)
+
+
+def operand_size(operand: str) -> int | None:
+    """
+    size in bytes of a register or a sized memory operand, 8 for an immediate because push sign extends it,
+    None when it can't be told
+    """
+    lowered = operand.lower()
+    if lowered in registers:
+        return registers[lowered][1]
+    if lowered.startswith("qword"):
+        return 8
+    if lowered.startswith("word"):
+        return 2
+    if "[" not in lowered:
+        return 8
+    return None
+
+
+def is_immediate32(operand: str) -> bool:
+    try:
+        return fits_in_signed(parse_number(operand), 32) # push and mov to memory only take a sign extended 32 bit immediate
+    except ValueError:
+        return False
+
+
+# registers the generator only uses inside the few instructions of one ir instruction, their value is dead after that
+scratch_registers: frozenset[str] = frozenset(("rax", "rdx", "r11"))
+
+#NOTE: the rules can't see which registers are still used later, so a rule that drops a write to a register only does it
+# for the scratch registers, flags are always set again before they are read so the rules don't keep them
+
+def push_pop(lines: list[Line]) -> tuple[int, list[Line]] | None:
+    """
+    push a / pop b -> mov b, a (or nothing when a is b)
+    """
+    if len(lines) < 2:
+        return None
+    push, pop = lines[-2:]
+    if push.mnemonic != "push" or pop.mnemonic != "pop" or pop.operands[0].lower() not in registers:
+        return None
+    source, destination = push.operands[0], pop.operands[0]
+    if operand_size(source) != operand_size(destination):
+        return None
+    if source.lower() == destination.lower():
+        return 2, []
+    return 2, [instruction("mov", destination, source)]
+
+
+def push_load(lines: list[Line]) -> tuple[int, list[Line]] | None:
+    """
+    mov r, x / push r -> push x, when x is a small immediate or a quadword in memory,
+    movzx r, WORD [m] / push r16 -> push WORD [m], r has to be a scratch register
+    """
+    if len(lines) < 2:
+        return None
+    load, push = lines[-2:]
+    if push.mnemonic != "push" or load.mnemonic not in ("mov", "movzx") or len(load.operands) != 2:
+        return None
+    register, source = load.operands[0].lower(), load.operands[1]
+    pushed = push.operands[0].lower()
+    if register not in scratch_registers or pushed not in registers or registers[register][0] != registers[pushed][0]:
+        return None
+    if load.mnemonic == "mov" and registers[pushed][1] == 8 and registers[register][1] == 8:
+        if source.lower().startswith("qword") or is_immediate32(source):
+            return 2, [instruction("push", source)]
+    if load.mnemonic == "movzx" and registers[pushed][1] == 2 and source.lower().startswith("word"):
+        return 2, [instruction("push", source)]
+    return None
+
+
+def negate(lines: list[Line]) -> tuple[int, list[Line]] | None:
+    """
+    imul r, -1 -> neg r
+    """
+    line = lines[-1]
+    if line.mnemonic == "imul" and len(line.operands) == 2 and line.operands[1].strip() == "-1":
+        return 1, [instruction("neg", line.operands[0])]
+    return None
+
+
+def merge_stack_adjustments(lines: list[Line]) -> tuple[int, list[Line]] | None:
+    """
+    add rsp, a / add rsp, b -> add rsp, a + b, an add of 0 is dropped
+    """
+    last = lines[-1]
+    if last.mnemonic != "add" or last.operands[0].lower() != "rsp":
+        return None
+    if parse_number(last.operands[1]) == 0:
+        return 1, []
+    if len(lines) < 2:
+        return None
+    previous = lines[-2]
+    if previous.mnemonic != "add" or previous.operands[0].lower() != "rsp":
+        return None
+    return 2, [instruction("add", "rsp", str(parse_number(previous.operands[1]) + parse_number(last.operands[1])))]
+
+
+def jump_to_next(lines: list[Line]) -> tuple[int, list[Line]] | None:
+    """
+    removes a jump to a label that comes right after it (a run of labels counts as right after)
+    """
+    if lines[-1].label is None:
+        return None
+    index = len(lines) - 1
+    while index >= 0 and lines[index].label is not None:
+        index -= 1
+    if index < 0:
+        return None
+    jump = lines[index]
+    if jump.mnemonic is None or not jump.mnemonic.startswith("j") or jump.operands[0] not in {line.label for line in lines[index + 1:]}:
+        return None
+    return len(lines) - index, lines[index + 1:]
+
+
+def branch_over_jump(lines: list[Line]) -> tuple[int, list[Line]] | None:
+    """
+    jcc a / jmp b / a: -> jncc b / a:
+    """
+    if len(lines) < 3:
+        return None
+    branch, jump, label = lines[-3:]
+    if label.label is None or jump.mnemonic != "jmp" or branch.mnemonic is None or branch.operands[:1] != (label.label,):
+        return None
+    condition = branch.mnemonic[1:]
+    if not branch.mnemonic.startswith("j") or condition not in inverted_conditions:
+        return None
+    return 3, [instruction("j" + inverted_conditions[condition], jump.operands[0]), label]
+
+
+def set_and_branch(lines: list[Line]) -> tuple[int, list[Line]] | None:
+    """
+    setcc r8 / movzx r, r8 / test r, r / jz label -> setcc r8 / movzx r, r8 / jncc label (and jnz -> jcc),
+    the flags of the comparison are used straight away instead of testing the number made from them,
+    the number is only dropped too when r is a scratch register
+    """
+    if len(lines) < 4:
+        return None
+    set_line, extend, test, branch = lines[-4:]
+    if branch.mnemonic not in ("jz", "jnz", "je", "jne") or test.mnemonic != "test" or extend.mnemonic != "movzx":
+        return None
+    if set_line.mnemonic is None or not set_line.mnemonic.startswith("set") or set_line.mnemonic[3:] not in inverted_conditions:
+        return None
+    register = test.operands[0].lower()
+    if test.operands[1].lower() != register or extend.operands[0].lower() != register:
+        return None
+    if extend.operands[1].lower() != set_line.operands[0].lower():
+        return None
+    condition = set_line.mnemonic[3:]
+    if branch.mnemonic in ("jz", "je"):
+        condition = inverted_conditions[condition]
+    if register in scratch_registers:
+        return 4, [instruction("j" + condition, branch.operands[0])]
+    return 4, [set_line, extend, instruction("j" + condition, branch.operands[0])]
+
+
+@dataclass(slots=True)
+class Rule:
+    name: str
+    rewrite: Callable[[list[Line]], tuple[int, list[Line]] | None] # gets the code lines at the end of the window, returns how many of them to replace and with what
+
+
+peephole_rules: tuple[Rule, ...] = (
+    Rule("push-pop", push_pop),
+    Rule("push-load", push_load),
+    Rule("negate", negate),
+    Rule("stack-adjust", merge_stack_adjustments),
+    Rule("jump-to-next", jump_to_next),
+    Rule("branch-over-jump", branch_over_jump),
+    Rule("set-and-branch", set_and_branch),
+)
+
+
+class Peephole:
+    """
+    an output sink that rewrites the assembly the generator writes before passing it on to another sink (-O1),
+    keeps a sliding window of the last few lines and tries every rule on its end whenever a line comes in,
+    comments and empty lines are carried along but the rules only see labels and instructions,
+    counts how many times every rule fired
+    """
+    window_size: int = 16 # code lines kept before the oldest one is passed on
+
+    def __init__(self, output, rules: tuple[Rule, ...] = peephole_rules) -> None:
+        self.output = output
+        self.rules: tuple[Rule, ...] = rules
+        self.fired: Counter[str] = Counter({rule.name: 0 for rule in rules})
+        self.window: list[Line] = []
+        self.pending: str = "" # the start of a line that hasn't been appended whole yet
+
+    def append(self, text: str) -> None:
+        lines = (self.pending + text).split("\n")
+        self.pending = lines.pop()
+        for line in lines:
+            self.add_line(parse_line(line))
+
+    def finish(self) -> None:
+        """
+        passes on everything that is still in the window, the last line goes out without a newline like the generator wrote it
+        """
+        unterminated = bool(self.pending)
+        if unterminated:
+            self.add_line(parse_line(self.pending))
+        for index, line in enumerate(self.window):
+            self.output.append(line.text if unterminated and index == len(self.window) - 1 else line.text + "\n")
+        self.window.clear()
+        self.pending = ""
+
+    def add_line(self, line: Line) -> None:
+        self.window.append(line)
+        if not line.is_code:
+            return
+        while self.apply_rules():
+            pass
+        code_count = sum(line.is_code for line in self.window)
+        while code_count > self.window_size:
+            oldest = self.window.pop(0)
+            self.output.append(oldest.text + "\n")
+            code_count -= oldest.is_code
+
+    def apply_rules(self) -> bool:
+        code = [index for index, line in enumerate(self.window) if line.is_code]
+        if not code:
+            return False
+        lines = [self.window[index] for index in code]
+        for rule in self.rules:
+            result = rule.rewrite(lines)
+            if result is None:
+                continue
+            count, replacement = result
+            replaced = code[-count:]
+            for index in reversed(replaced[1:]):
+                del self.window[index]
+            self.window[replaced[0]:replaced[0] + 1] = replacement
+            self.fired[rule.name] += 1
+            return True
+        return False
@@ -0,0 +1,122 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+import hdzir as ir
+
+
+# registers temps can live in, taken from the end of the list so rbx is used first,
+# rax and rdx are left out because division needs them, r11 because the generator needs a scratch register
+# (syscall overwrites it anyway), rsp and rbp because they hold the stack
+allocatable_registers: tuple[str, ...] = ("r15", "r14", "r13", "r12", "r10", "r9", "r8", "rdi", "rsi", "rcx", "rbx")
+
+# registers an instruction overwrites besides its dest, a temp that is live across it can't be in one of them,
+#NOTE: no temp is ever in rax or rdx (rdx is still kept for division), the entries only say what the routines overwrite,
+# every register a temp can be in (rdi, rsi, rcx, ...) stays as it was across hutor and hutorcislo
+clobbered_registers: dict[str, frozenset[str]] = {
+    "print": frozenset(("rax",)), # holds the buffer length, output_flush saves the registers the write syscall uses
+    "print_number": frozenset(("rax", "rdx")), # output_number saves everything else it uses
+}
+
+
+@dataclass(slots=True)
+class Interval:
+    """
+    the positions a temp is live in, an instruction at index i reads its operands at 2i and writes its dest at 2i + 1
+    """
+    temp: ir.Temp
+    start: int
+    end: int
+    register: str | None = None
+    spill_slot: ir.Slot | None = None
+
+
+class RegisterAllocator:
+    """
+    linear scan register allocation over the blocks in the order they are laid out,
+    every temp gets one interval from the first to the last position its live at (liveness fills the gaps loops leave),
+    when no register is free the interval that ends last is spilled to a slot in the frame
+    """
+    def __init__(self, function: ir.Function, registers: tuple[str, ...] = allocatable_registers) -> None:
+        self.function: ir.Function = function
+        self.registers: tuple[str, ...] = registers
+        self.intervals: dict[ir.Temp, Interval] = {}
+        self.clobber_positions: list[int] = [] # positions of instructions that clobber registers, sorted
+        self.clobbers: list[frozenset[str]] = [] # what the instruction at the same index of clobber_positions clobbers
+        self.spill_count: int = 0
+
+    def extend(self, temp: ir.Temp, position: int) -> None:
+        interval = self.intervals.get(temp)
+        if interval is None:
+            self.intervals[temp] = Interval(temp, position, position)
+        elif position < interval.start:
+            interval.start = position
+        elif position > interval.end:
+            interval.end = position
+
+    def build_intervals(self) -> None:
+        live_in, live_out = ir.liveness(self.function)
+        index = 0
+        for block in self.function.blocks:
+            for temp in live_in[block]:
+                self.extend(temp, 2 * index - 1)
+            for instruction in block.instructions:
+                for temp in instruction.uses():
+                    self.extend(temp, 2 * index)
+                if instruction.dest is not None:
+                    self.extend(instruction.dest, 2 * index + 1)
+                clobbered = clobbered_registers.get(instruction.opcode)
+                if clobbered is not None:
+                    self.clobber_positions.append(2 * index)
+                    self.clobbers.append(clobbered)
+                index += 1
+            for temp in live_out[block]:
+                self.extend(temp, 2 * index) # past the terminator
+
+    def forbidden_registers(self, interval: Interval) -> set[str]:
+        """
+        the registers clobbered by the instructions the interval is live across
+        """
+        forbidden: set[str] = set()
+        index = bisect_right(self.clobber_positions, interval.start)
+        while index < len(self.clobber_positions) and self.clobber_positions[index] < interval.end:
+            forbidden |= self.clobbers[index]
+            index += 1
+        return forbidden
+
+    def spill(self, interval: Interval) -> None:
+        interval.register = None
+        interval.spill_slot = self.function.new_slot("spill", 8)
+        self.spill_count += 1
+
+    def allocate(self) -> dict[ir.Temp, str | ir.Slot]:
+        """
+        returns the register or the spill slot of every temp
+        """
+        self.build_intervals()
+        free: list[str] = list(self.registers)
+        active: list[Interval] = []
+        for interval in sorted(self.intervals.values(), key=lambda interval: interval.start):
+            still_active = []
+            for other in active:
+                if other.end < interval.start:
+                    free.append(other.register)
+                else:
+                    still_active.append(other)
+            active = still_active
+
+            forbidden = self.forbidden_registers(interval)
+            register = next((register for register in reversed(free) if register not in forbidden), None)
+            if register is not None:
+                free.remove(register)
+                interval.register = register
+                active.append(interval)
+                continue
+            candidates = [other for other in active if other.register not in forbidden]
+            victim = max(candidates, key=lambda other: other.end, default=None)
+            if victim is not None and victim.end > interval.end:
+                interval.register = victim.register # the one that lives longer goes to memory
+                self.spill(victim)
+                active.remove(victim)
+                active.append(interval)
+            else:
+                self.spill(interval)
+        return {temp: interval.register if interval.register is not None else interval.spill_slot for temp, interval in self.intervals.items()}
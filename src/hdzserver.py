@@ -0,0 +1,102 @@
+"""
+compile server that keeps the compiler imported between builds, run from the src directory:
+
+    python hdzserver.py [--socket PATH]
+
+listens on a unix socket (HDZ_SOCKET or /tmp/hdz-<uid>.sock by default) for one json request per connection:
+
+    {"cwd": "/project", "args": ["main.hdz", "-s"], "sources": {"main.hdz": "..."}}
+
+args are the same as the arguments of hdz.py, relative paths are relative to cwd,
+sources is optional and gives the content of files instead of reading them (like an unsaved buffer in an editor),
+the response is
+
+    {"returncode": 0, "output": "what hdz.py would print", "files": [{"file": ..., "status": ..., "asm": ..., "executable": ...}]}
+
+every request is compiled in a forked child, so requests never share the state of the compiler and the imports are already done,
+the server stops (answering {"stale": true}) when the compiler sources change so the client can fall back to the new code
+"""
+import os
+import io
+import sys
+import glob
+import json
+import signal
+import traceback
+import contextlib
+import socketserver
+
+import hdz
+from hdzcache import BuildCache
+from hdzclient import socket_path
+
+
+def compiler_modification_times() -> dict[str, float]:
+    return {path: os.path.getmtime(path) for path in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "hdz*.py"))}
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+            os.chdir(request["cwd"])
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                returncode, results = hdz.run(request["args"], request.get("sources"))
+            response = {
+                "returncode": returncode,
+                "output": output.getvalue(),
+                "files": [{
+                    "file": result.filename,
+                    "status": result.status,
+                    "asm": os.path.abspath(result.filename[:-len(".hdz")] + ".asm"),
+                    "executable": os.path.abspath(result.filename[:-len(".hdz")]),
+                } for result in results],
+            }
+        except Exception: # a bug in the compiler fails the request, not the server
+            response = {"returncode": 1, "output": traceback.format_exc(), "files": []}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class CompileServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    def __init__(self, path: str) -> None:
+        if os.path.exists(path):
+            os.unlink(path) # left behind by a server that was killed
+        super().__init__(path, CompileRequestHandler)
+        self.path: str = path
+        self.compiler_times: dict[str, float] = compiler_modification_times()
+        BuildCache.get_compiler_hash() # computed once here, every forked child inherits it
+        self.stale: bool = False
+
+    def process_request(self, request, client_address) -> None:
+        if compiler_modification_times() != self.compiler_times:
+            request.sendall(json.dumps({"stale": True}).encode() + b"\n")
+            self.shutdown_request(request)
+            self.stale = True
+            return
+        super().process_request(request, client_address)
+
+    def serve(self) -> None:
+        """
+        answers requests until the compiler changes or the server gets killed
+        """
+        try:
+            while not self.stale:
+                self.handle_request()
+                self.collect_children()
+        finally:
+            self.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def main(args: list[str]) -> None:
+    path = args[args.index("--socket") + 1] if "--socket" in args else socket_path()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0)) # so the socket file gets removed
+    print(f"compile server listening on {path}")
+    sys.stdout.flush()
+    CompileServer(path).serve()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+import time
+import resource
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from hdzarena import node_kinds
+from hdzassembler import strip_comment
+
+
+@dataclass(slots=True)
+class PassTiming:
+    name: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_bytes: int | None = None # None for nasm and ld, they run in their own process
+    count: int | None = None
+    unit: str = "" # what count counts (tokens, nodes, instructions)
+    details: dict[str, int] = field(default_factory=dict) # counts the pass splits its count into, like how many times every peephole rule fired
+
+
+class PassTimer:
+    """
+    measures the stages of one compile for --time-passes: wall time, cpu time of the compiling thread and the tracemalloc peak,
+    tracemalloc is only running while a stage is measured, it slows python code down so the times are higher than without --time-passes
+    """
+    def __init__(self) -> None:
+        self.passes: list[PassTiming] = []
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[PassTiming]:
+        timing = PassTiming(name)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0] # memory the earlier stages still hold isn't counted
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield timing
+        finally:
+            timing.wall_seconds = time.perf_counter() - wall
+            timing.cpu_seconds = time.thread_time() - cpu
+            timing.peak_bytes = tracemalloc.get_traced_memory()[1] - baseline
+            if not tracing:
+                tracemalloc.stop()
+            self.passes.append(timing)
+
+    @contextmanager
+    def measure_tool(self, name: str) -> Iterator[PassTiming]:
+        """
+        measures an external tool (nasm or ld), the cpu time is what the finished child processes used,
+        it can include other tools when several files are linked at the same time
+        """
+        timing = PassTiming(name)
+        wall = time.perf_counter()
+        cpu = resource.getrusage(resource.RUSAGE_CHILDREN)
+        try:
+            yield timing
+        finally:
+            timing.wall_seconds = time.perf_counter() - wall
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            timing.cpu_seconds = usage.ru_utime - cpu.ru_utime + usage.ru_stime - cpu.ru_stime
+            self.passes.append(timing)
+
+
+def count_nodes(program) -> int:
+    """
+    counts the dataclass nodes of a program without the program node itself (same as the length of its AstArena),
+    walked with an explicit stack so deep trees don't hit the recursion limit
+    """
+    count = 0
+    stack = list(program.stmts)
+    while stack:
+        node = stack.pop()
+        count += 1
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if type(value) in node_kinds:
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(value)
+    return count
+
+
+def count_instructions(lines: Iterable[str]) -> int:
+    """
+    counts the instructions and data definitions in the lines of assembly (an open file works too),
+    labels, comments and section directives are skipped
+    """
+    count = 0
+    for line in lines:
+        line = strip_comment(line).strip()
+        if line and not line.endswith(":") and not line.startswith(("section", "global")):
+            count += 1
+    return count
+
+
+def format_passes(passes: list[PassTiming]) -> str:
+    lines = [f"    {'pass':18} {'wall ms':>10} {'cpu ms':>10} {'peak KB':>10}  count"]
+    for timing in passes:
+        peak = f"{timing.peak_bytes / 1024:10.0f}" if timing.peak_bytes is not None else f"{'-':>10}"
+        count = f"{timing.count} {timing.unit}" if timing.count is not None else ""
+        lines.append(f"    {timing.name:18} {timing.wall_seconds * 1000:10.2f} {timing.cpu_seconds * 1000:10.2f} {peak}  {count}")
+        for name, detail in timing.details.items():
+            lines.append(f"      {name:49}  {detail}")
+    total = sum(timing.wall_seconds for timing in passes)
+    lines.append(f"    {'total':18} {total * 1000:10.2f}")
+    return "\n".join(lines) + "\n"
@@ -1,76 +1,97 @@
-left_paren = "left_paren"
-right_paren = "right_paren"
-left_curly = "left_curly"
-right_curly = "right_curly"
-dash = "dash"
+# token types are small consecutive ints so they can index the lookup tables in the lexer, parser and below
+left_paren = 0
+right_paren = 1
+left_curly = 2
+right_curly = 3
+dash = 4
 
-end_line = "end_ln"
+end_line = 5
 
-exit_ = "vychod" # names of keywords must be what is used in the hadzik syntax
-print_ = "hutor"
+exit_ = 6 # the hadzik spelling of keywords is in the keywords table
+print_ = 7
+print_number = 8
 
-let = "naj"
-bool_def = "bul"
+let = 9
+bool_def = 10
 
-if_ = "kec"
-elif_ = "ikec"
-else_ = "inac"
-while_ = "kim"
-do = "zrob"
-for_ = "furt"
-break_ = "konec"
+if_ = 11
+elif_ = 12
+else_ = 13
+while_ = 14
+do = 15
+for_ = 16
+break_ = 17
 
-identifier = "identifier"
-char_lit = "character"
-int_lit = "integer"
-true = "pravda"
-false = "klamstvo"
-floating_number = "float"
+identifier = 18
+char_lit = 19
+int_lit = 20
+true = 21
+false = 22
+floating_number = 23
 
-plus = "+"
-minus = "-"
-star = "*"
-slash = "/"
-percent = "%"
-equals = "="
+plus = 24
+minus = 25
+star = 26
+slash = 27
+percent = 28
+equals = 29
 
-is_equal = "=="
-is_not_equal = "!="
-larger_than = ">"
-less_than = "<"
-larger_than_or_eq = ">="
-less_than_or_eq = "<="
+is_equal = 30
+is_not_equal = 31
+larger_than = 32
+less_than = 33
+larger_than_or_eq = 34
+less_than_or_eq = 35
 
-increment = "increment"
-decrement = "decrement"
+increment = 36
+decrement = 37
 
-and_ = "aj"
-or_ = "abo"
-not_ = "ne"
+and_ = 38
+or_ = 39
+not_ = 40
 
-all_token_types = (
-    left_paren, right_paren, left_curly, right_curly, dash,
-    end_line,  
-    exit_, print_, let, bool_def, if_, elif_, else_, while_, do, for_, break_,
-    identifier, int_lit, floating_number,
-    plus, minus, star, slash, percent, equals, 
-    is_equal, is_not_equal, larger_than, less_than, larger_than_or_eq, less_than_or_eq,
-    increment, decrement,
-    and_, or_, not_, true, false,
-)
+token_type_count = 41
 
-def get_prec_level(token_type: str) -> int | None:
+names: tuple[str, ...] = (
+    "left_paren", "right_paren", "left_curly", "right_curly", "dash",
+    "end_ln",
+    "vychod", "hutor", "hutorcislo",
+    "naj", "bul",
+    "kec", "ikec", "inac", "kim", "zrob", "furt", "konec",
+    "identifier", "character", "integer", "pravda", "klamstvo", "float",
+    "+", "-", "*", "/", "%", "=",
+    "==", "!=", ">", "<", ">=", "<=",
+    "increment", "decrement",
+    "aj", "abo", "ne",
+) # readable name of every token type, indexed by the type
+
+keywords: dict[str, int] = {
+    names[keyword]: keyword for keyword in (
+        exit_, print_, print_number, let, bool_def, if_, elif_, else_, while_, do, for_, break_,
+        and_, or_, not_, true, false,
+    )
+} # maps the hadzik spelling of a keyword to its token type
+
+operators: dict[str, int] = {
+    "(": left_paren, ")": right_paren, "{": left_curly, "}": right_curly, ",": dash,
+    "+": plus, "-": minus, "*": star, "/": slash, "%": percent, "=": equals,
+    "==": is_equal, "!=": is_not_equal, ">": larger_than, "<": less_than, ">=": larger_than_or_eq, "<=": less_than_or_eq,
+    "++": increment, "--": decrement,
+} # maps the spelling of an operator or punctuation to its token type
+
+precedence: list[int | None] = [None] * token_type_count # None for tokens that aren't binary or logical operators
+for token_type in (and_, or_):
+    precedence[token_type] = 0
+for token_type in (is_equal, is_not_equal, larger_than, less_than, larger_than_or_eq, less_than_or_eq):
+    precedence[token_type] = 1
+for token_type in (plus, minus):
+    precedence[token_type] = 2
+for token_type in (star, slash, percent):
+    precedence[token_type] = 3
+
+def get_prec_level(token_type: int) -> int | None:
     """
-    returns the precedence level of the token, 
+    returns the precedence level of the token,
     returns None if that token doesn't have a precedence level (token isn't a binary operator or a logical operator)
     """
-    if token_type == and_ or token_type == or_:
-        return 0
-    elif token_type in (is_equal, is_not_equal, larger_than, less_than, larger_than_or_eq, less_than_or_eq):
-        return 1
-    elif token_type == plus or token_type == minus:
-        return 2
-    elif token_type == star or token_type == slash or token_type == percent:
-        return 3
-    else:
-        return None
+    return precedence[token_type]
@@ -0,0 +1,59 @@
+import json
+from typing import Iterable, Iterator, TextIO
+import hdztokentypes as tt
+
+
+class Trace:
+    """
+    opt in tracing of the compiler stages, configured once by hdz.py from --trace=lexer,parser:2,codegen:3,
+    every stage has a level: 0 is off, 1 writes a summary, 2 writes every token / statement / term, 3 also writes the generator state,
+    records are json objects written one per line to the trace file,
+    when a stage is off the only cost is checking its level before building a record
+    """
+    lexer: int = 0
+    parser: int = 0
+    codegen: int = 0
+    stages: tuple[str, ...] = ("lexer", "parser", "codegen")
+    file: TextIO | None = None
+
+    @classmethod
+    def configure(cls, spec: str, path: str) -> None:
+        """
+        spec is a comma separated list of stages, each optionally followed by :level (1 if not given),
+        raises ValueError for an unknown stage or a level that isn't a number, before anything is switched on
+        """
+        levels: dict[str, int] = {}
+        for item in spec.split(","):
+            stage, _, level = item.partition(":")
+            if stage not in cls.stages:
+                raise ValueError(f"unknown trace stage: {stage} (stages are {', '.join(cls.stages)})")
+            if level and not level.isdigit():
+                raise ValueError(f"trace level of {stage} has to be a number: {level}")
+            levels[stage] = int(level) if level else 1
+        for stage, level in levels.items():
+            setattr(cls, stage, level)
+        cls.file = open(path, "w")
+
+    @classmethod
+    def record(cls, stage: str, event: str, **fields) -> None:
+        cls.file.write(json.dumps({"stage": stage, "event": event, **fields}, default=repr) + "\n")
+
+    @classmethod
+    def close(cls) -> None:
+        if cls.file is not None:
+            cls.file.close()
+            cls.file = None
+
+    @classmethod
+    def traced_tokens(cls, tokens: Iterable) -> Iterator:
+        """
+        passes a token stream through, recording the tokens on the way,
+        only wrapped around the stream when the lexer is traced so the tokenizer itself never checks
+        """
+        count = 0
+        for token in tokens:
+            count += 1
+            if cls.lexer >= 2:
+                cls.record("lexer", "token", type=tt.names[token.type], value=token.value, start=token.start, end=token.end)
+            yield token
+        cls.record("lexer", "done", tokens=count)